@@ -0,0 +1,103 @@
+'''
+Compares the glob-per-suffix affiliate tag matching that on_automod_finished used to do against the compiled
+AffiliateRules, for the same set of links.
+
+Run from the repository root:
+
+    python benchmarks/bench_affiliate.py
+'''
+
+import argparse
+import os
+import pathlib
+import random
+import sys
+import timeit
+import urllib.parse
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.utility import AffiliateRules  # noqa: E402
+
+
+RULES = {
+    "*": ["awc"],
+    "amazon.*": ["colid", "coliid", "tag", "ascsubtag"],
+    "bestbuy.*": ["aid", "cjpid", "lid", "pid"],
+    "bhphotovideo.com": ["sid"],
+    "ebay.*": ["afepn", "campid", "pid"],
+    "gamestop.com": ["affid", "cid", "sourceid"],
+    "groupon.*": ["affid"],
+    "newegg*.*": ["aid", "pid"],
+    "play-asia.com": ["tagid"],
+    "stacksocial.com": ["aid", "rid"],
+    "store.nintendo.co.uk": ["affil"],
+    "tigerdirect.com": ["affiliateid", "srccode"],
+    "walmart.*": ["sourceid", "veh", "wmlspartner"],
+}
+
+HOSTS = [
+    'www.amazon.com',
+    'smile.amazon.co.uk',
+    'www.bestbuy.ca',
+    'www.bhphotovideo.com',
+    'www.ebay.de',
+    'www.gamestop.com',
+    'www.neweggbusiness.com',
+    'store.nintendo.co.uk',
+    'www.nintendo.com',
+    'www.youtube.com',
+    'cdn.discordapp.com',
+    'old.reddit.com',
+]
+
+
+def baseline(url):
+    '''The previous approach: PurePath.match of every glob against every suffix of the hostname'''
+    urlParts = urllib.parse.urlsplit(url)
+    labels = urlParts.hostname.split('.')
+    tags = set()
+    amazon = False
+    for i in range(0, len(labels)):
+        domain = '.'.join(labels[i - len(labels) :])
+        if pathlib.PurePath(domain).match('amazon.*'):
+            amazon = True
+
+        for glob, globTags in RULES.items():
+            if pathlib.PurePath(domain).match(glob):
+                tags.update(globTags)
+
+    return frozenset(tags), amazon
+
+
+def compiled(rules, url):
+    if not rules.precheck.search(url):
+        return None
+
+    return rules.lookup(urllib.parse.urlsplit(url).hostname)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=2000, help='Number of links to match')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    urls = []
+    for _ in range(args.count):
+        query = '?tag=abc-20&ref=x' if rng.random() < 0.3 else ''
+        urls.append(f'https://{rng.choice(HOSTS)}/item/{rng.randint(0, 10**6)}{query}')
+
+    rules = AffiliateRules(RULES)
+    for host in HOSTS:
+        assert rules.lookup(host) == baseline(f'https://{host}/'), host
+
+    for label, check in (('PurePath', baseline), ('AffiliateRules', lambda url: compiled(rules, url))):
+        best = min(timeit.repeat(lambda: [check(x) for x in urls], number=1, repeat=args.repeat))
+        print(f'{label:>14}: {best * 1000:8.1f} ms for {len(urls)} links ({best / len(urls) * 1e6:.2f} us each)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+'''
+Compares the per-pattern re_match_nonlink filter against tools.ChatFilter over a message corpus.
+
+Run from the repository root, with a corpus exported from the message store (one message per line, or JSON lines
+with a "content" key):
+
+    python benchmarks/bench_matcher.py --corpus messages.txt
+
+Without --corpus a synthetic corpus of chat, links and friend codes is generated.
+'''
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import timeit
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tools  # noqa: E402
+
+
+FILTERS = {
+    'friendcode': re.compile(
+        r'(sw|m[^ao]|d[^a]|[^MD]\w|^\w|^)[ \-\u2014_]?\d{4}[ \-\u2014_]\d{4}[ \-\u2014_]\d{4}', re.I + re.M
+    ),
+    'invite': re.compile(r'discord(?:\.gg|app\.com/invite|\.com/invite)/[\w-]+', re.I),
+    'zalgo': re.compile(r'[\u0300-\u036f]{3,}'),
+}
+
+
+def baseline(content):
+    '''The pre-ChatFilter approach: a finditer and a full link rescan for every pattern'''
+
+    def spans_overlap_link(string, spans):
+        links = [m.span() for m in tools.linkRe.finditer(string)]
+        overlaps = [False] * len(spans)
+        for i, span in enumerate(spans):
+            for link in links:
+                if span[1] >= link[0] and link[1] >= span[0]:
+                    overlaps[i] = True
+                    break
+
+        return overlaps
+
+    results = {}
+    for name, pattern in FILTERS.items():
+        spans = [m.span() for m in re.finditer(pattern, content)]
+        if spans:
+            results[name] = any(not x for x in spans_overlap_link(content, spans))
+
+    return results
+
+
+def synthetic(count):
+    rng = random.Random(0)
+    words = 'the switch game online friend add me tonight anyone playing splatoon zelda mario kart lol gg'.split()
+    messages = []
+    for _ in range(count):
+        parts = [rng.choice(words) for _ in range(rng.randint(3, 30))]
+        if rng.random() < 0.2:
+            parts.insert(rng.randrange(len(parts)), f'https://example.com/{rng.randint(0, 10**8)}?ref=abc')
+
+        if rng.random() < 0.05:
+            parts.insert(rng.randrange(len(parts)), f'SW-{rng.randint(1000, 9999)}-1234-5678')
+
+        messages.append(' '.join(parts))
+
+    return messages
+
+
+def load(path):
+    messages = []
+    with open(path, encoding='utf-8') as corpus:
+        for line in corpus:
+            line = line.rstrip('\n')
+            if line.startswith('{'):
+                line = json.loads(line).get('content') or ''
+
+            messages.append(line)
+
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='Message corpus, one message per line or JSON lines')
+    parser.add_argument('--count', type=int, default=50000, help='Synthetic corpus size when no corpus is given')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    messages = load(args.corpus) if args.corpus else synthetic(args.count)
+    matcher = tools.ChatFilter()
+    for name, pattern in FILTERS.items():
+        matcher.register(name, pattern)
+
+    for message in messages:
+        assert matcher.scan(message) == baseline(message), message
+
+    for label, check in (('per-pattern', baseline), ('ChatFilter', matcher.scan)):
+        best = min(timeit.repeat(lambda: [check(x) for x in messages], number=1, repeat=args.repeat))
+        print(
+            f'{label:>12}: {best * 1000:8.1f} ms for {len(messages)} messages ({best / len(messages) * 1e6:.2f} us each)'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,13 @@ import logging
 from sys import exit
 
 import discord
-import pymongo
 from discord.ext import commands
 
 
 LOG_FORMAT = '%(levelname)s [%(asctime)s]: %(message)s'
 logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
 
+import database
 import tools
 
 
@@ -20,7 +20,6 @@ except ImportError:
     logging.critical('[Bot] config.py does not exist, you should make one from the example config')
     exit(1)
 
-mclient = pymongo.MongoClient(config.mongoURI)
 intents = discord.Intents(
     guilds=True,
     members=True,
@@ -54,34 +53,6 @@ class BotCache(commands.Cog):
             for rc, lc in zip(remote, local):  # We are pulling command IDs from server-side, then storing the mentions
                 lc.extras['id'] = rc.id
 
-            # logging.info('[Cache] Performing initial user database synchronization')
-            # self.READY = True
-            # return
-            # db = mclient.bowser.users
-            # NS = self.bot.get_guild(config.nintendoswitch)
-
-            # guildCount = len(NS.members)
-            # userCount = 0
-            # for member in NS.members:
-            #    await asyncio.sleep(0.5)
-            #    userCount += 1
-            #    logging.debug(f'[Cache] Syncronizing user {userCount}/{guildCount}')
-            #    doc = db.find_one({'_id': member.id})
-            #    if not doc:
-            #        await tools.store_user(member)
-            #        continue
-
-            #    roleList = []
-            #    for role in member.roles:
-            #        if role.id != NS.id:
-            #            roleList.append(role.id)
-
-            #    if roleList == doc['roles']:
-            #        continue
-
-            #    db.update_one({'_id': member.id}, {'$set': {'roles': roleList}})
-
-            # logging.info('[Cache] Inital user database syncronization complete')
             self.READY = True
 
 
@@ -128,7 +99,7 @@ class MechaBowser(commands.Bot):
                 message_content=True,
                 reactions=True,
             ),
-            max_messages=300000,
+            max_messages=1000,  # Delete and edit logging use the compact cache in modules.core
         )
 
         if config.DSN:
@@ -144,6 +115,10 @@ class MechaBowser(commands.Bot):
     async def on_message(self, message):
         return  # Return so commands will not process, and main extension can process instead
 
+    async def close(self):
+        await super().close()
+        database.close()
+
 
 bot = MechaBowser()
 
@@ -0,0 +1,413 @@
+'''
+Shared MongoDB connection for the bot, tools and every extension. Extensions are re-executed when they are reloaded,
+so they must import the client from here rather than create their own; this module is a plain import and lives for
+the lifetime of the process.
+
+Code running on the event loop should use `amclient`, which mirrors the pymongo client but runs every operation on a
+bounded thread pool and returns awaitables. `mclient` remains available for work that is already off the loop.
+'''
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import config
+import pymongo
+from pymongo import monitoring
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    '''
+    Tracks connection pool usage across all servers the client talks to. Check-out events carry no duration on this
+    pymongo version, so the wait time is measured per thread between check_out_started and checked_out/failed.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        self.open = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.failed_checkouts = 0
+        self.waiting = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.clears = 0
+
+    @property
+    def avg_wait_ms(self):
+        return 0.0 if not self.checkouts else self.total_wait_ms / self.checkouts
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open': self.open,
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'waiting': self.waiting,
+                'checkouts': self.checkouts,
+                'failed_checkouts': self.failed_checkouts,
+                'avg_wait_ms': self.avg_wait_ms,
+                'max_wait_ms': self.max_wait_ms,
+            }
+
+    def _end_wait(self):
+        started = getattr(self._local, 'started', None)
+        self._local.started = None
+        self.waiting -= 1
+        return 0.0 if started is None else (time.perf_counter() - started) * 1000
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.clears += 1
+
+        logging.warning(f'[Database] Connection pool for {event.address} was cleared')
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._end_wait()
+            self.failed_checkouts += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            wait = self._end_wait()
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.total_wait_ms += wait
+            self.max_wait_ms = max(self.max_wait_ms, wait)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+
+MAX_CONCURRENCY = 16  # Database calls allowed to run at once; the rest queue on the executor
+
+pool_monitor = PoolMonitor()
+mclient = pymongo.MongoClient(config.mongoURI, event_listeners=[pool_monitor])
+bowser = mclient.bowser
+modmail = mclient.modmail
+executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix='mongo')
+
+
+async def run(func, *args, **kwargs):
+    '''Run a blocking database call on the shared executor'''
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+def _passthrough(name):
+    async def method(self, *args, **kwargs):
+        return await run(getattr(self.delegate, name), *args, **kwargs)
+
+    method.__name__ = name
+    return method
+
+
+class AsyncCollection:
+    '''
+    Awaitable version of a pymongo Collection. Methods take the same arguments as pymongo; find and aggregate return
+    lists rather than cursors, so use the sort/skip/limit/projection keyword arguments instead of cursor chaining.
+    '''
+
+    def __init__(self, collection):
+        self.delegate = collection
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return AsyncCollection(self.delegate[name])
+
+    def __getitem__(self, name):
+        return AsyncCollection(self.delegate[name])
+
+    @property
+    def name(self):
+        return self.delegate.name
+
+    async def find(self, *args, **kwargs):
+        return await run(lambda: list(self.delegate.find(*args, **kwargs)))
+
+    async def aggregate(self, pipeline, **kwargs):
+        return await run(lambda: list(self.delegate.aggregate(pipeline, **kwargs)))
+
+    find_one = _passthrough('find_one')
+    count_documents = _passthrough('count_documents')
+    estimated_document_count = _passthrough('estimated_document_count')
+    distinct = _passthrough('distinct')
+    insert_one = _passthrough('insert_one')
+    insert_many = _passthrough('insert_many')
+    replace_one = _passthrough('replace_one')
+    update_one = _passthrough('update_one')
+    update_many = _passthrough('update_many')
+    delete_one = _passthrough('delete_one')
+    delete_many = _passthrough('delete_many')
+    find_one_and_update = _passthrough('find_one_and_update')
+    find_one_and_replace = _passthrough('find_one_and_replace')
+    find_one_and_delete = _passthrough('find_one_and_delete')
+    bulk_write = _passthrough('bulk_write')
+    create_index = _passthrough('create_index')
+
+
+class AsyncDatabase:
+    def __init__(self, database):
+        self.delegate = database
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return AsyncCollection(self.delegate[name])
+
+    def __getitem__(self, name):
+        return AsyncCollection(self.delegate[name])
+
+    command = _passthrough('command')
+
+
+class AsyncClient:
+    def __init__(self, client):
+        self.delegate = client
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return AsyncDatabase(self.delegate[name])
+
+    def __getitem__(self, name):
+        return AsyncDatabase(self.delegate[name])
+
+
+amclient = AsyncClient(mclient)
+
+DISCORD_EPOCH = 1420070400000
+
+
+class MessageStore:
+    '''
+    Message metadata lives in one collection per calendar month (UTC), named messages_YYYY_MM and routed by the
+    creation time encoded in the message snowflake. bowser.messagePartitions catalogs each partition's time range and
+    retention state. The pre-partitioning bowser.messages collection is still read until /update partitions has moved
+    its documents over.
+    '''
+
+    PREFIX = 'messages_'
+    LEGACY_RECHECK = 60  # Seconds an unmigrated legacy collection is cached for before the catalog is checked again
+
+    def __init__(self, database):
+        self.database = database
+        self.catalog = database.messagePartitions
+        self.legacy = database.messages
+        self._known = set()
+        self._legacy_migrated = None
+        self._legacy_checked = 0
+
+    @staticmethod
+    def partition_name(message_id):
+        created = datetime.fromtimestamp(((message_id >> 22) + DISCORD_EPOCH) / 1000, tz=timezone.utc)
+        return f'{MessageStore.PREFIX}{created.year}_{created.month:02}'
+
+    @staticmethod
+    def partition_bounds(name):
+        '''Returns the [start, end) unix timestamps covered by a partition'''
+        year, month = (int(x) for x in name[len(MessageStore.PREFIX) :].split('_'))
+        start = datetime(year, month, 1, tzinfo=timezone.utc)
+        end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+        return int(start.timestamp()), int(end.timestamp())
+
+    async def _register(self, name):
+        if name in self._known:
+            return
+
+        start, end = self.partition_bounds(name)
+        await self.catalog.update_one(
+            {'_id': name}, {'$setOnInsert': {'start': start, 'end': end, 'stripped': False}}, upsert=True
+        )
+        self._known.add(name)
+
+    async def _unstrip(self, names):
+        '''Mark stripped partitions that were written to as needing another strip, so old content does not outlive it'''
+        await self.catalog.update_many({'_id': {'$in': list(names)}, 'stripped': True}, {'$set': {'stripped': False}})
+
+    def _group(self, docs):
+        partitions = {}
+        for doc in docs:
+            partitions.setdefault(self.partition_name(doc['_id']), []).append(doc)
+
+        return partitions
+
+    async def legacy_migrated(self):
+        # Migration is one way, so only a negative result needs rechecking once it goes stale
+        if not self._legacy_migrated and time.time() - self._legacy_checked > self.LEGACY_RECHECK:
+            doc = await self.catalog.find_one({'_id': 'legacy'})
+            self._legacy_migrated = bool(doc and doc.get('migrated'))
+            self._legacy_checked = time.time()
+
+        return self._legacy_migrated
+
+    async def partitions(self, start=None, end=None):
+        '''Names of the partitions overlapping the given time range, oldest first'''
+        query = {'_id': {'$regex': f'^{self.PREFIX}'}}
+        if start is not None:
+            query['end'] = {'$gt': start}
+        if end is not None:
+            query['start'] = {'$lte': end}
+
+        return [doc['_id'] for doc in await self.catalog.find(query, projection={'_id': 1}, sort=[('start', 1)])]
+
+    async def sources(self, start=None, end=None):
+        '''Collections that can hold messages in the given time range, including the legacy collection if needed'''
+        names = await self.partitions(start, end)
+        if not await self.legacy_migrated():
+            names.append(self.legacy.name)
+
+        return names
+
+    async def insert_many(self, docs):
+        '''Insert message documents into their partitions, skipping ones already stored. Returns the inserted docs'''
+        inserted = []
+        for name, group in self._group(docs).items():
+            await self._register(name)
+            try:
+                await self.database[name].insert_many(group, ordered=False)
+                inserted += group
+
+            except pymongo.errors.BulkWriteError as e:
+                failed = {error['index'] for error in e.details['writeErrors']}
+                inserted += [doc for idx, doc in enumerate(group) if idx not in failed]
+
+        return inserted
+
+    async def upsert_many(self, docs):
+        '''
+        Store message documents that may already exist in either a partition or the legacy collection, i.e. history
+        backfills. Existing documents are left untouched. Returns the inserted docs
+        '''
+        if not await self.legacy_migrated():
+            existing = await self.legacy.find({'_id': {'$in': [doc['_id'] for doc in docs]}}, projection={'_id': 1})
+            existing = {doc['_id'] for doc in existing}
+            docs = [doc for doc in docs if doc['_id'] not in existing]
+
+        inserted = []
+        for name, group in self._group(docs).items():
+            await self._register(name)
+            try:
+                result = await self.database[name].bulk_write(
+                    [pymongo.UpdateOne({'_id': doc['_id']}, {'$setOnInsert': doc}, upsert=True) for doc in group],
+                    ordered=False,
+                )
+                upserted = result.upserted_ids
+
+            except pymongo.errors.BulkWriteError as e:
+                # A duplicate key can only come from the same message being stored concurrently
+                upserted = {x['index']: x['_id'] for x in e.details['upserted']}
+
+            inserted += [group[idx] for idx in upserted]
+
+        if inserted:
+            await self._unstrip({self.partition_name(doc['_id']) for doc in inserted})
+
+        return inserted
+
+    async def find_one(self, message_id, **kwargs):
+        doc = await self.database[self.partition_name(message_id)].find_one({'_id': message_id}, **kwargs)
+        if not doc and not await self.legacy_migrated():
+            doc = await self.legacy.find_one({'_id': message_id}, **kwargs)
+
+        return doc
+
+    async def aggregate(self, pipeline, start=None, end=None, **kwargs):
+        '''Run a pipeline against each source in turn, yielding the results of each as a list'''
+        for name in await self.sources(start, end):
+            yield await self.database[name].aggregate(pipeline, **kwargs)
+
+    async def strip_before(self, cutoff):
+        '''
+        Remove message content from every partition that ended before the cutoff. Each partition is rewritten once,
+        server side, and then marked as stripped so it is not visited again until more messages are stored in it.
+        Rewriting the legacy collection in place is unbounded, so it is migrated into partitions first. Returns the
+        partitions stripped
+        '''
+        if not await self.legacy_migrated():
+            logging.info('[Database] Migrating legacy messages before stripping')
+            await self.migrate_legacy()
+
+        stripped = []
+        for doc in await self.catalog.find(
+            {'_id': {'$regex': f'^{self.PREFIX}'}, 'end': {'$lte': cutoff}, 'stripped': False}
+        ):
+            await self.database[doc['_id']].aggregate(
+                [{'$addFields': {'content': None, 'sanitized': True}}, {'$out': doc['_id']}]
+            )
+            await self.catalog.update_one(
+                {'_id': doc['_id']}, {'$set': {'stripped': True, 'stripped_at': int(time.time())}}
+            )
+            stripped.append(doc['_id'])
+
+        return stripped
+
+    async def migrate_legacy(self, batch_size=1000):
+        '''
+        Move documents from the legacy collection into their partitions, which are then stripped again if they already
+        were. Progress is checkpointed to the catalog so an interrupted migration resumes. Returns the number of
+        documents moved
+        '''
+        checkpoint = await self.catalog.find_one({'_id': 'legacy'}) or {}
+        last = checkpoint.get('last_id', 0)
+        moved = 0
+        while True:
+            batch = await self.legacy.find({'_id': {'$gt': last}}, sort=[('_id', 1)], limit=batch_size)
+            if not batch:
+                break
+
+            inserted = await self.insert_many(batch)
+            if inserted:
+                await self._unstrip({self.partition_name(doc['_id']) for doc in inserted})
+
+            await self.legacy.delete_many({'_id': {'$in': [doc['_id'] for doc in batch]}})
+            last = batch[-1]['_id']
+            moved += len(batch)
+            await self.catalog.update_one({'_id': 'legacy'}, {'$set': {'last_id': last}}, upsert=True)
+
+        await self.catalog.update_one({'_id': 'legacy'}, {'$set': {'migrated': True}}, upsert=True)
+        self._legacy_migrated = True
+        return moved
+
+
+message_store = MessageStore(amclient.bowser)
+
+
+def close():
+    executor.shutdown(wait=True)
+    mclient.close()
+    logging.info('[Database] MongoDB client closed')
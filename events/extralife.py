@@ -5,11 +5,11 @@ from typing import List
 
 import config
 import discord
-import pymongo
 import requests
 from discord import app_commands
 from discord.ext import commands, tasks
 
+import database
 import tools
 
 
@@ -44,7 +44,7 @@ class ExtraLife(commands.Cog):
 
         ################################################################################################################################
 
-        self.mclient = pymongo.MongoClient(config.mongoURI)
+        self.mclient = database.mclient
         self.bot = bot
         self.guild = self.bot.get_guild(self.GUILD)
         self.extra_life_admin = self.guild.get_channel(self.EXTRA_LIFE_ADMIN)
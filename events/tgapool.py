@@ -4,16 +4,13 @@ from datetime import datetime
 import aiohttp
 import config
 import discord
-import pymongo
 from discord import app_commands
 from discord.ext import commands, tasks
 
+from database import amclient
 from tools import commit_profile_change
 
 
-mclient = pymongo.MongoClient(config.mongoURI)
-
-
 class TGAPool(commands.Cog):
     def __init__(self, bot):
         self.GUILD = 238080556708003851
@@ -24,7 +21,7 @@ class TGAPool(commands.Cog):
         self.TROPHIES = ['tga-gold', 'tga-silver', 'tga-bronze']
 
         self.bot = bot
-        self.db = mclient.bowser.users
+        self.db = amclient.bowser.users
         self.guild = self.bot.get_guild(self.GUILD)
         self.event_channel = self.guild.get_channel(self.EVENT_CHANNEL)
 
@@ -41,7 +38,7 @@ class TGAPool(commands.Cog):
             async with session.get(self.ENDPOINT, headers=headers) as resp:
                 users = await resp.json()
                 for user in users:
-                    dbUser = self.db.find_one(int(user['id']))
+                    dbUser = await self.db.find_one(int(user['id']))
 
                     if not user['earnedTrophy'] or not dbUser:
                         continue
@@ -53,7 +50,7 @@ class TGAPool(commands.Cog):
                         continue
 
                     if trophy_name not in dbUser['trophies']:
-                        self.db.update_one({'_id': int(user['id'])}, {'$push': {'trophies': trophy_name}})
+                        await self.db.update_one({'_id': int(user['id'])}, {'$push': {'trophies': trophy_name}})
 
                         msg = f':information_source: Assigned TGA trophy `{trophy_name}` to <@{user["id"]}>'
                         await interaction.followup.send(msg, allowed_mentions=discord.AllowedMentions.none())
@@ -71,7 +68,7 @@ class TGAPool(commands.Cog):
             async with session.get(self.ENDPOINT, headers=headers) as resp:
                 users = await resp.json()
                 for user in users:
-                    dbUser = self.db.find_one(int(user['id']))
+                    dbUser = await self.db.find_one(int(user['id']))
 
                     if not user['earnedBackground'] or not dbUser:
                         continue
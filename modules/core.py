@@ -1,6 +1,7 @@
 import asyncio
 import collections
 import logging
+import sys
 import time
 import typing
 from datetime import datetime, timezone
@@ -8,39 +9,1117 @@ from datetime import datetime, timezone
 import config  # type: ignore
 import discord
 import pymongo
+import token_bucket
 from discord import app_commands
 from discord.ext import commands, tasks
 
 import tools  # type: ignore
+from database import amclient, message_store, pool_monitor
 
 
 startTime = int(time.time())
-mclient = pymongo.MongoClient(config.mongoURI)
+
+
+class MessageIngest:
+    '''
+    Write-behind buffer for message metadata. on_message queues documents here and a single worker writes them to the
+    message store once `batch_size` documents are waiting or `flush_interval` seconds have passed. The
+    queue is bounded, so when the database falls behind producers wait on put() instead of memory growing unbounded.
+    Once closed, put() drops documents rather than waiting on a queue nothing is draining.
+    '''
+
+    def __init__(self, store, batch_size=500, flush_interval=0.25, max_queue=10000, retries=3, on_written=None):
+        self.store = store
+        self.on_written = on_written  # Coroutine called with the documents each flush actually inserted
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.task = None
+        self.closed = False
+
+        # Counters
+        self.flushes = 0
+        self.written = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    @property
+    def avg_flush_ms(self):
+        return 0.0 if not self.flushes else self.total_flush_ms / self.flushes
+
+    def start(self):
+        self.closed = False
+        if not self.task or self.task.done():
+            self.task = asyncio.create_task(self._worker())
+
+    async def put(self, doc):
+        if self.closed:
+            self.dropped += 1
+            logging.warning(f'[Core] Message ingest is closed, message {doc["_id"]} was not saved')
+            return
+
+        await self.queue.put(doc)  # Waits while the queue is full, this is our backpressure
+
+    async def close(self, timeout=30):
+        '''Flush everything that is queued and stop the worker'''
+        self.closed = True
+        if not self.task:
+            return
+
+        if not self.task.done():
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+
+            except asyncio.TimeoutError:
+                logging.error(
+                    f'[Core] Message ingest did not drain in {timeout}s, {self.depth} messages were not saved'
+                )
+
+            self.task.cancel()
+
+            # Taking from the queue releases any producers still waiting in put()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.dropped += 1
+
+        self.task = None
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+
+                except asyncio.QueueEmpty:
+                    pass
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._flush(batch)
+
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _flush(self, batch):
+        for attempt in range(1, self.retries + 1):
+            start = time.perf_counter()
+            try:
+                # Unordered inserts continue past duplicates, i.e. a message that was already stored by /update cache
+                inserted = await self.store.insert_many(batch)
+                self.duplicates += len(batch) - len(inserted)
+
+            except pymongo.errors.PyMongoError as e:
+                logging.warning(f'[Core] Message ingest flush of {len(batch)} failed (attempt {attempt}): {e}')
+                await asyncio.sleep(2**attempt)
+                continue
+
+            elapsed = (time.perf_counter() - start) * 1000
+            self.flushes += 1
+            self.written += len(inserted)
+            self.last_flush_ms = elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+            self.total_flush_ms += elapsed
+
+            if self.on_written and inserted:
+                try:
+                    await self.on_written(inserted)
+
+                except pymongo.errors.PyMongoError as e:
+                    logging.error(f'[Core] Failed to update message counters for {len(inserted)} messages: {e}')
+
+            return
+
+        self.dropped += len(batch)
+        logging.error(f'[Core] Message ingest dropped {len(batch)} messages after {self.retries} failed flushes')
+
+
+class MessageBackfill:
+    '''
+    Crawls channel history into the message store. Several channels are crawled at once, oldest message first, with every
+    history request drawing from one shared token bucket so the crawl cannot starve the rest of the bot of REST
+    capacity. Each page is written with an unordered bulk upsert and the last message ID is then checkpointed to
+    bowser.backfill, so a rerun continues from where the previous one stopped.
+    '''
+
+    PAGE_SIZE = 100  # Maximum messages returned by one history request
+
+    def __init__(self, channels, concurrency=4, requests_per_second=5, on_written=None):
+        self.channels = channels
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.requests_per_second = requests_per_second
+        self.ratelimit = token_bucket.Limiter(requests_per_second, requests_per_second, token_bucket.MemoryStorage())
+        self.on_written = on_written  # Coroutine called with the documents each page actually inserted
+        self.checkpoints = amclient.bowser.backfill
+
+        self.started = None
+        self.processed = 0
+        self.stored = 0
+        self.completed = []
+        self.failed = []
+
+    @property
+    def rate(self):
+        elapsed = time.time() - self.started if self.started else 0
+        return 0.0 if not elapsed else self.processed / elapsed
+
+    async def run(self, restart=False):
+        self.started = time.time()
+        if restart:
+            await self.checkpoints.delete_many({'_id': {'$in': [c.id for c in self.channels]}})
+
+        await asyncio.gather(*[self._crawl_channel(channel) for channel in self.channels])
+
+    async def _acquire(self):
+        while not self.ratelimit.consume('history'):
+            await asyncio.sleep(1 / self.requests_per_second)
+
+    async def _crawl_channel(self, channel):
+        async with self.semaphore:
+            checkpoint = await self.checkpoints.find_one({'_id': channel.id})
+            after = discord.Object(id=checkpoint['last_message']) if checkpoint else None
+            try:
+                while True:
+                    await self._acquire()
+                    page = [
+                        message
+                        async for message in channel.history(limit=self.PAGE_SIZE, after=after, oldest_first=True)
+                    ]
+                    if not page:
+                        break
+
+                    await self._store_page(channel, page)
+                    after = page[-1]
+                    if len(page) < self.PAGE_SIZE:
+                        break
+
+            except (discord.Forbidden, discord.HTTPException) as e:
+                logging.warning(f'[Core] Backfill of channel {channel.id} stopped: {e}')
+                self.failed.append(channel)
+                return
+
+            self.completed.append(channel)
+
+    async def _store_page(self, channel, page):
+        docs = [
+            {
+                '_id': message.id,
+                'author': message.author.id,
+                'guild': message.guild.id,
+                'channel': message.channel.id,
+                'timestamp': int(message.created_at.timestamp()),
+            }
+            for message in page
+            if not message.author.bot
+        ]
+
+        inserted = []
+        if docs:
+            inserted = await message_store.upsert_many(docs)
+            self.stored += len(inserted)
+            if self.on_written and inserted:
+                await self.on_written(inserted)
+
+        self.processed += len(page)
+        await self.checkpoints.update_one(
+            {'_id': channel.id},
+            {
+                '$set': {'last_message': page[-1].id, 'updated': int(time.time())},
+                '$inc': {'processed': len(page), 'stored': len(inserted)},
+            },
+            upsert=True,
+        )
+
+
+class PurgeRegistry:
+    '''
+    Message IDs the bot is about to bulk delete itself, so on_bulk_message_delete can tell our purges from anyone
+    else's without scanning recent archives. IDs are added before the delete request is sent and kept in memory for
+    `ttl` seconds, with a copy in bowser.purges (expired by a TTL index) in case the bot restarts mid-purge.
+    '''
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl  # Rate limiting, instability, and being just slow to fire can all delay the event
+        self.collection = amclient.bowser.purges
+        self.recent = collections.OrderedDict()  # message ID: expiry. Insertion order is expiry order
+
+    async def ensure_index(self):
+        await self.collection.create_index([('created', pymongo.ASCENDING)], expireAfterSeconds=self.ttl)
+
+    def _prune(self):
+        now = time.monotonic()
+        while self.recent:
+            messageID, expires = next(iter(self.recent.items()))
+            if expires > now:
+                break
+
+            del self.recent[messageID]
+
+    def add(self, message_id):
+        '''Mark a message as ours to delete. Safe to call from a purge check, which cannot await'''
+        self.recent[message_id] = time.monotonic() + self.ttl
+        self.recent.move_to_end(message_id)
+
+    async def persist(self, message_ids):
+        if not message_ids:
+            return
+
+        created = datetime.now(tz=timezone.utc)
+        try:
+            await self.collection.insert_many(
+                [{'_id': messageID, 'created': created} for messageID in message_ids], ordered=False
+            )
+
+        except pymongo.errors.BulkWriteError:
+            pass  # Already registered
+
+    async def contains(self, message_ids):
+        '''Return True if any of the message IDs were registered by us within the last `ttl` seconds'''
+        self._prune()
+        if any(messageID in self.recent for messageID in message_ids):
+            return True
+
+        # Not known in memory, could still be a purge that was running when we restarted
+        return bool(await self.collection.count_documents({'_id': {'$in': list(message_ids)}}, limit=1))
+
+
+class LogDispatcher:
+    '''
+    Queues log embeds per channel and packs them into as few messages as possible. Each channel has one worker that
+    waits `window` seconds after the first queued log so a burst can collect, then sends up to 10 embeds (within
+    Discord's 6000 character embed limit) in one message, highest priority first. Sends to a channel are serialized, so
+    discord.py's rate limit handling only ever has one request per channel waiting. When a channel's queue is full new
+    logs are dropped rather than delaying the event that produced them.
+    '''
+
+    HIGH = 0  # Moderation actions
+    NORMAL = 1
+    LOW = 2  # Voice and other high volume noise
+
+    MAX_EMBEDS = 10
+    MAX_EMBED_CHARS = 6000
+    MAX_CONTENT = 2000
+
+    def __init__(self, window=1.0, max_queue=5000):
+        self.window = window
+        self.max_queue = max_queue
+        self.queues = {}
+        self.tasks = {}
+        self.sequence = 0  # Keeps logs of the same priority in the order they were queued
+
+        # Counters
+        self.queued = 0
+        self.sent = 0
+        self.messages = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @property
+    def backlog(self):
+        return sum(x.qsize() for x in self.queues.values())
+
+    def send(self, channel, content, embed, priority=NORMAL):
+        if channel.id not in self.queues:
+            self.queues[channel.id] = asyncio.PriorityQueue(maxsize=self.max_queue)
+
+        queue = self.queues[channel.id]
+        try:
+            queue.put_nowait((priority, self.sequence, content, embed))
+
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logging.warning(f'[Core] Log queue for channel {channel.id} is full, dropping "{content}"')
+            return
+
+        self.sequence += 1
+        self.queued += 1
+        if channel.id not in self.tasks or self.tasks[channel.id].done():
+            self.tasks[channel.id] = asyncio.create_task(self._worker(channel, queue))
+
+    async def close(self, timeout=30):
+        '''Send everything that is queued and stop the workers'''
+        for channelID, queue in self.queues.items():
+            try:
+                await asyncio.wait_for(queue.join(), timeout)
+
+            except asyncio.TimeoutError:
+                logging.error(f'[Core] Log queue for channel {channelID} did not drain in {timeout}s')
+
+        for task in self.tasks.values():
+            task.cancel()
+
+        self.tasks = {}
+
+    async def _worker(self, channel, queue):
+        while True:
+            batch = [await queue.get()]
+            await asyncio.sleep(self.window)  # Let a burst build up so it can share a message
+
+            embedChars = len(batch[0][3])
+            contentChars = len(batch[0][2])
+            while len(batch) < self.MAX_EMBEDS and not queue.empty():
+                item = queue.get_nowait()
+                if (
+                    embedChars + len(item[3]) > self.MAX_EMBED_CHARS
+                    or contentChars + len(item[2]) + 1 > self.MAX_CONTENT
+                ):
+                    # Doesn't fit, it leads the next message instead. Nothing was awaited so its slot is still free
+                    queue.put_nowait(item)
+                    queue.task_done()
+                    break
+
+                embedChars += len(item[3])
+                contentChars += len(item[2]) + 1
+                batch.append(item)
+
+            batch.sort(key=lambda x: x[1])  # Priority decides what is sent first, chronology decides the layout
+            try:
+                await channel.send('\n'.join(x[2] for x in batch), embeds=[x[3] for x in batch])
+                self.sent += len(batch)
+                self.messages += 1
+
+            except discord.HTTPException as e:
+                self.failed += len(batch)
+                logging.error(f'[Core] Failed to send {len(batch)} logs to channel {channel.id}: {e}')
+
+            except Exception:
+                # Anything else would end the worker and leave the channel's queue unserviced
+                self.failed += len(batch)
+                logging.exception(f'[Core] Unexpected error sending {len(batch)} logs to channel {channel.id}')
+
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+
+class JoinPipeline:
+    '''
+    Handles member joins in batches. Joins are queued by on_member_join and a worker collects them for `window`
+    seconds (up to `batch_size` at a time), then loads every user document and active punishment for the batch with one
+    $in query each and records the joins with bulk writes. Role and punishment restores then run concurrently, at most
+    `concurrency` at a time. Batches larger than `summary_threshold` are logged as one summary instead of per member,
+    so a join raid doesn't flood the log channels.
+    '''
+
+    PUN_NAMES = {'mute': 'Mute', 'blacklist': 'Channel Blacklist ({})'}
+
+    def __init__(self, cog, window=1.0, batch_size=500, concurrency=5, summary_threshold=10, max_queue=10000):
+        self.cog = cog
+        self.window = window
+        self.batch_size = batch_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.summary_threshold = summary_threshold
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.task = None
+
+        # Counters
+        self.batches = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_batch = 0
+        self.max_latency_ms = 0.0
+        self.total_latency_ms = 0.0
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    @property
+    def avg_latency_ms(self):
+        return 0.0 if not self.processed else self.total_latency_ms / self.processed
+
+    def start(self):
+        if not self.task or self.task.done():
+            self.task = asyncio.create_task(self._worker())
+
+    async def put(self, member):
+        await self.queue.put((member, time.perf_counter()))
+
+    async def close(self, timeout=30):
+        '''Process everything that is queued and stop the worker'''
+        if not self.task:
+            return
+
+        if not self.task.done():
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+
+            except asyncio.TimeoutError:
+                logging.error(
+                    f'[Core] Join pipeline did not drain in {timeout}s, {self.depth} joins were not processed'
+                )
+
+            self.task.cancel()
+
+        self.task = None
+
+    async def _worker(self):
+        while True:
+            batch = [await self.queue.get()]
+            await asyncio.sleep(self.window)  # Let a burst of joins build up so it can share queries
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            try:
+                await self._process([x[0] for x in batch])
+
+            except Exception:
+                self.failed += len(batch)
+                logging.exception(f'[Core] Failed to process a batch of {len(batch)} joins')
+
+            finally:
+                finished = time.perf_counter()
+                for _, queued in batch:
+                    latency = (finished - queued) * 1000
+                    self.total_latency_ms += latency
+                    self.max_latency_ms = max(self.max_latency_ms, latency)
+                    self.queue.task_done()
+
+                self.processed += len(batch)
+                self.batches += 1
+                self.max_batch = max(self.max_batch, len(batch))
+
+    async def _process(self, members):
+        members = list({x.id: x for x in members}.values())  # A quick leave and rejoin only needs restoring once
+        ids = [x.id for x in members]
+        joined = int(datetime.now(tz=timezone.utc).timestamp())
+
+        docs = {x['_id']: x for x in await amclient.bowser.users.find({'_id': {'$in': ids}})}
+        puns = collections.defaultdict(list)
+        for pun in await amclient.bowser.puns.find({'user': {'$in': ids}, 'active': True}):
+            puns[pun['user']].append(pun)
+
+        newMembers = [x for x in members if x.id not in docs]
+        newDocs = [tools.user_document(x, joined) for x in newMembers]
+        if newDocs:
+            try:
+                await amclient.bowser.users.insert_many(newDocs, ordered=False)
+
+            except pymongo.errors.BulkWriteError:
+                pass  # Stored between our read and write by another path, the join is still recorded below
+
+            await tools.record_history_many('name', [(x.id, tools.name_event(x, 'name', joined)) for x in newMembers])
+
+        returning = [x for x in ids if x in docs]
+        if returning:
+            await amclient.bowser.users.update_many({'_id': {'$in': returning}}, {'$push': {'joins': joined}})
+
+        await amclient.bowser.memberEvents.insert_many([{'user': x, 'type': 'join', 'timestamp': joined} for x in ids])
+        docs.update({x['_id']: x for x in newDocs})
+
+        async def restore(member):
+            async with self.semaphore:
+                try:
+                    return await self._restore(member, docs[member.id], puns[member.id])
+
+                except Exception:
+                    logging.exception(f'[Core] Failed to restore member {member.id}')
+
+        results = await asyncio.gather(*[restore(x) for x in members])
+        await self._report(members, [x for x in results if x])
+
+    async def _restore(self, member, doc, puns):
+        roleList = []
+        hierarchyFails = []
+        needsRestore = False
+        if doc['roles']:
+            myTop = member.guild.me.top_role
+            for x in doc['roles']:
+                if x == member.guild.id:
+                    continue
+
+                needsRestore = True
+                role = member.guild.get_role(x)
+                if role and not role.managed:
+                    # Checks if role exists. Managed roles can't be assigned, and older documents may still hold them
+                    if myTop > role:
+                        roleList.append(role)
+
+                    else:
+                        hierarchyFails.append(role)
+
+            await member.edit(roles=roleList, reason='Automatic role restore action')
+
+        restoredPuns = []
+        restored = needsRestore or any(x['type'] == 'mute' for x in puns)
+        if restored:
+            for x in puns:
+                if x['type'] == 'blacklist':
+                    restoredPuns.append(self.PUN_NAMES[x['type']].format(x['context']))
+
+                elif x['type'] in ['strike', 'kick', 'ban', 'appealdeny']:
+                    continue  # These are not punishments being "restored", instead only status is being tracked
+
+                elif x['type'] == 'mute':
+                    if (
+                        x['expiry'] < time.time()
+                    ):  # If the member is rejoining after mute has expired, the task has already quit. Restart it
+                        mod = self.cog.bot.get_cog('Moderation Commands')
+                        await mod.expire_actions(x['_id'], member.guild.id)
+
+                    else:
+                        # The member rejoined while a mute is still active, reapply the chat timeout.
+                        # We want to make sure if the expiry was modified while they were not in the
+                        # server that the correct timeout is applied
+                        await member.edit(
+                            timed_out_until=datetime.fromtimestamp(x['expiry'], tz=timezone.utc),
+                            reason='Reapplying timeout after user rejoined',
+                        )
+
+                        restoredPuns.append(self.PUN_NAMES[x['type']])
+
+                elif x['type'] in ['tier1', 'tier2', 'tier3']:
+                    # We don't want to handle this, these will be converted to strikes further on
+                    pass
+
+                else:
+                    restoredPuns.append(self.PUN_NAMES[x['type']])
+
+        activeHist = []
+        strikes = doc.get('active_strikes', 0)
+        for pun in puns:
+            if pun['type'] == 'mute':
+                activeHist.append('Mute')
+
+            elif pun['type'] == 'blacklist':
+                activeHist.append(f'Blacklist ({pun["context"]})')
+
+        if strikes:
+            activeHist.append(f'{strikes} Strike{"s" if strikes > 1 else ""}')
+
+        if doc.get('migrate_unnotified') == True:  # Migration of warnings to strikes for returning members
+            for pun in puns:
+                if pun['type'] in ['tier1', 'tier2', 'tier3']:  # Should only be one, it's mutually exclusive
+                    await self._migrate_warning(member, pun)
+
+        return {
+            'member': member,
+            'restored': restored,
+            'roles': roleList,
+            'hierarchyFails': hierarchyFails,
+            'puns': restoredPuns,
+            'active': activeHist,
+        }
+
+    async def _migrate_warning(self, member, pun):
+        strikeCount = int(pun['type'][-1:]) * 4
+
+        await amclient.bowser.puns.update_one({'_id': pun['_id']}, {'$set': {'active': False}})
+
+        explanation = (
+            'Hello there **{}**,\nI am letting you know of a change in status for your active level {} warning issued on {}.\n\n'
+            'The **/r/NintendoSwitch** Discord server is moving to a strike-based system for infractions. Here is what you need to know:\n'
+            '- Your warning level will be converted to **{}** strikes.\n'
+            '- __Your strikes will decay at a equivalent rate as warnings previously did__. Each warning tier is equivalent to four strikes, where one strike decays once per week instead of one warn level per four weeks\n'
+            '- You will no longer have any permission restrictions you previously had with this warning. Moderators will instead restrict features as needed to enforce the rules on a case-by-case basis.\n\n'
+            'Strikes will allow the moderation team to weigh rule-breaking behavior better and serve as a reminder to users who may need to review our rules. You may also now view your infraction history '
+            'by using the `/history` command in any channel. Please feel free to send a modmail to @Parakarry (<@{}>) if you have any questions or concerns.'
+        ).format(
+            str(member),  # Username
+            pun['type'][-1:],  # Tier type
+            f'<t:{int(pun["timestamp"])}:D>',  # Date of warn
+            strikeCount,  # How many strikes will replace tier,
+            config.parakarry,  # Parakarry mention for DM
+        )
+
+        public_notify = False
+        try:
+            await member.send(explanation)
+
+        except:
+            public_notify = True
+
+        await tools.issue_pun(
+            member.id,
+            self.cog.bot.user.id,
+            'strike',
+            f'[Migrated] {pun["reason"]}',
+            strike_count=strikeCount,
+            context='strike-migration',
+            public=False,
+            public_notify=public_notify,
+        )
+        await amclient.bowser.users.update_one({'_id': member.id}, {'$set': {'migrate_unnotified': False}})
+        await tools.add_strikes(member.id, strikeCount)  # Starts their decay from today
+
+    async def _report(self, members, results):
+        cog = self.cog
+        summarize = len(members) > self.summary_threshold
+        now = datetime.now(tz=timezone.utc)
+
+        def is_new(member):
+            return (now - member.created_at).total_seconds() <= 60 * 60 * 24 * 14  # Two weeks
+
+        if not summarize:
+            for member in members:
+                new = ':new: ' if is_new(member) else ''
+                embed = discord.Embed(color=0x417505, timestamp=now)
+                embed.set_author(name=f'{member} ({member.id})', icon_url=member.display_avatar.url)
+                created_at = f'{new} <t:{int(member.created_at.timestamp())}:f>'
+                created_at += '' if not new else f'\n<t:{int(member.created_at.timestamp())}:R>'
+                embed.add_field(name='Created at', value=created_at)
+                embed.add_field(name='Mention', value=f'<@{member.id}>')
+                cog.logs.send(cog.serverLogs, ':inbox_tray: User joined', embed)
+
+            for result in results:
+                member = result['member']
+                if result['restored']:
+                    embed = discord.Embed(color=0x4A90E2, timestamp=now)
+                    embed.set_author(name=f'{member} ({member.id})', icon_url=member.display_avatar.url)
+                    embed.add_field(name='Restored roles', value=', '.join(x.name for x in result['roles']) or 'None')
+                    if result['hierarchyFails']:
+                        embed.description = (
+                            f':warning: Failed to reassign some or all roles due to missing permissions:\n> '
+                            + ', '.join(x.name for x in result['hierarchyFails'])
+                        )
+                        await cog.adminChannel.send(
+                            f':warning: **{member}** ({member.id}) rejoined the server, but I failed to restore some or all roles due to missing permissions: '
+                            + ', '.join(x.name for x in result['hierarchyFails'])
+                        )
+                    if result['puns']:
+                        embed.add_field(name='Restored punishments', value=', '.join(result['puns']))
+                    embed.add_field(name='Mention', value=f'<@{member.id}>')
+                    cog.logs.send(cog.serverLogs, ':shield: Member restored', embed, priority=LogDispatcher.HIGH)
+
+                if result['active']:
+                    await cog.adminChannel.send(
+                        f':grey_exclamation: **{member}** ({member.id}) rejoined the server after leaving with the following active punishments:\n{", ".join(result["active"])}'
+                    )
+
+            return
+
+        newAccounts = [x for x in members if is_new(x)]
+        embed = discord.Embed(
+            description=f'**{len(members)}** members joined within {self.window:g}s, '
+            f'**{len(newAccounts)}** of them with accounts created in the last two weeks',
+            color=0x417505,
+            timestamp=now,
+        )
+        for field in tools.convert_list_to_fields(
+            [f'{":new: " if is_new(x) else ""}{x} ({x.id})' for x in members], codeblock=False
+        )[:20]:
+            embed.add_field(**field)
+
+        cog.logs.send(cog.serverLogs, f':inbox_tray: {len(members)} users joined', embed)
+
+        restored = [x for x in results if x['restored']]
+        if restored:
+            lines = []
+            for result in restored:
+                line = f'{result["member"]} ({result["member"].id}): {len(result["roles"])} roles'
+                if result['puns']:
+                    line += ', ' + ', '.join(result['puns'])
+
+                if result['hierarchyFails']:
+                    line += f', :warning: {len(result["hierarchyFails"])} roles above me'
+
+                lines.append(line)
+
+            embed = discord.Embed(
+                description=f'Restored roles and punishments for **{len(restored)}** returning members',
+                color=0x4A90E2,
+                timestamp=now,
+            )
+            for field in tools.convert_list_to_fields(lines, codeblock=False)[:20]:
+                embed.add_field(**field)
+
+            cog.logs.send(cog.serverLogs, ':shield: Members restored', embed, priority=LogDispatcher.HIGH)
+
+        notices = [f'**{x["member"]}** ({x["member"].id}): {", ".join(x["active"])}' for x in results if x['active']]
+        failures = [
+            f'**{x["member"]}** ({x["member"].id}): {", ".join(y.name for y in x["hierarchyFails"])}'
+            for x in results
+            if x['hierarchyFails']
+        ]
+        for header, lines in [
+            (':grey_exclamation: Members rejoined the server with active punishments:', notices),
+            (':warning: Failed to restore some or all roles due to missing permissions:', failures),
+        ]:
+            while lines:
+                message = header
+                while lines and len(message) + len(lines[0]) + 1 <= 2000:
+                    message += '\n' + lines.pop(0)
+
+                if message == header:
+                    message += '\n' + lines.pop(0)[: 1999 - len(header)]
+
+                await cog.adminChannel.send(message)
+
+
+class RoleReconciler:
+    '''
+    Brings the roles stored in bowser.users back in line with the member cache, i.e. after roles changed while the bot
+    was offline. User documents are read in `_id` order, `batch_size` at a time with only their roles projected, and
+    compared in memory against the chunked guild members. Only documents that drifted are rewritten, with one unordered
+    bulk_write per page, sleeping `throttle` seconds between pages so the sync yields to everything else using the
+    database. Members without a document are stored. Users no longer in the guild keep their roles for a rejoin.
+    '''
+
+    def __init__(self, guild, batch_size=1000, throttle=0.1):
+        self.guild = guild
+        self.batch_size = batch_size
+        self.throttle = throttle
+        self.db = amclient.bowser.users
+
+        self.scanned = 0
+        self.fixed = 0
+        self.created = 0
+
+    def _member_roles(self):
+        return {
+            member.id: [role.id for role in member.roles if role.id != self.guild.id and not role.managed]
+            for member in self.guild.members
+        }
+
+    async def run(self):
+        members = self._member_roles()  # Snapshot, so members changing mid-sync are only diffed against one state
+        lastID = None
+        while True:
+            query = {} if lastID is None else {'_id': {'$gt': lastID}}
+            page = await self.db.find(query, projection={'roles': 1}, sort=[('_id', 1)], limit=self.batch_size)
+            if not page:
+                break
+
+            lastID = page[-1]['_id']
+            self.scanned += len(page)
+            writes = []
+            for doc in page:
+                roles = members.pop(doc['_id'], None)
+                if roles is None or sorted(roles) == sorted(doc.get('roles', [])):
+                    continue
+
+                writes.append(pymongo.UpdateOne({'_id': doc['_id']}, {'$set': {'roles': roles}}))
+
+            if writes:
+                await self.db.bulk_write(writes, ordered=False)
+                self.fixed += len(writes)
+
+            await asyncio.sleep(self.throttle)
+
+        # Whatever is left in the snapshot has no document at all
+        missing = [self.guild.get_member(x) for x in members]
+        missing = [x for x in missing if x]
+        for idx in range(0, len(missing), self.batch_size):
+            docs = []
+            events = []
+            names = []
+            for member in missing[idx : idx + self.batch_size]:
+                joined = int((member.joined_at or datetime.now(tz=timezone.utc)).timestamp())
+                docs.append(tools.user_document(member, joined))
+                events.append({'user': member.id, 'type': 'join', 'timestamp': joined})
+                names.append((member.id, tools.name_event(member, 'name', joined)))
+
+            try:
+                await self.db.insert_many(docs, ordered=False)
+
+            except pymongo.errors.BulkWriteError as e:
+                # Stored by a join between our read and write, that join already recorded the event
+                failed = {error['index'] for error in e.details['writeErrors']}
+                events = [event for idx, event in enumerate(events) if idx not in failed]
+                names = [name for idx, name in enumerate(names) if idx not in failed]
+
+            if events:
+                await amclient.bowser.memberEvents.insert_many(events)
+                await tools.record_history_many('name', names)
+
+            self.created += len(events)
+            await asyncio.sleep(self.throttle)
+
+        return self.fixed
+
+
+CachedAttachment = collections.namedtuple('CachedAttachment', ['url', 'proxy_url'])
+
+
+class CachedMessage:
+    '''The parts of a message that delete and edit logging need, kept instead of a full discord.Message'''
+
+    __slots__ = ('id', 'guild_id', 'channel_id', 'author_id', 'content', 'attachments', 'size')
+
+    def __init__(self, message_id, guild_id, channel_id, author_id, content, attachments=()):
+        self.id = message_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.content = content
+        self.attachments = attachments  # Tuple of (url, proxy_url)
+        self.size = self._measure()
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(
+            message.id,
+            message.guild.id,
+            message.channel.id,
+            message.author.id,
+            message.content,
+            tuple((x.url, x.proxy_url) for x in message.attachments),
+        )
+
+    def _measure(self):
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self.content)
+            + sys.getsizeof(self.attachments)
+            + sum(sys.getsizeof(url) + sys.getsizeof(proxy) for url, proxy in self.attachments)
+            + CompactMessageCache.ENTRY_OVERHEAD
+        )
+
+    @property
+    def created_at(self):
+        return discord.utils.snowflake_time(self.id)
+
+    @property
+    def jump_url(self):
+        return f'https://discord.com/channels/{self.guild_id}/{self.channel_id}/{self.id}'
+
+    def set_content(self, content):
+        self.content = content
+        self.size = self._measure()
+
+
+class ArchivedMessage:
+    '''A CachedMessage with its author and channel resolved, shaped like the discord.Message tools.message_archive reads'''
+
+    __slots__ = ('id', 'guild', 'channel', 'author', 'content', 'attachments', 'created_at')
+
+    def __init__(self, cached, guild, channel, author, content=None):
+        self.id = cached.id
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.content = cached.content if content is None else content
+        self.attachments = [CachedAttachment(url, proxy) for url, proxy in cached.attachments]
+        self.created_at = cached.created_at
+
+
+class CompactMessageCache:
+    '''
+    LRU cache of CachedMessage records, bounded by an estimate of the memory they hold rather than a message count.
+    Reads move a message to the newest end, and the oldest messages are evicted once `budget` bytes is exceeded.
+    Hits and misses are counted so the budget can be sized from /ping. The IDs of recent messages that are never
+    cached (bots, webhooks and system messages) are remembered, so their deletes and edits are skipped without a
+    lookup and are not counted as misses.
+    '''
+
+    ENTRY_OVERHEAD = 100  # Approximate cost of the dict entry and key
+
+    def __init__(self, budget=64 * 1024 * 1024, skip_limit=50000):
+        self.budget = budget
+        self.messages = collections.OrderedDict()
+        self.size = 0
+        self.skip_limit = skip_limit
+        self.skipped = collections.OrderedDict()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return 0.0 if not lookups else self.hits / lookups
+
+    def skip(self, message_id):
+        '''Remember a message that is not cached because it never will be'''
+        self.skipped[message_id] = None
+        if len(self.skipped) > self.skip_limit:
+            self.skipped.popitem(last=False)
+
+    def is_skipped(self, message_id):
+        return message_id in self.skipped
+
+    def put(self, record):
+        self.pop(record.id, count=False)
+        self.messages[record.id] = record
+        self.size += record.size
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.budget and self.messages:
+            _, oldest = self.messages.popitem(last=False)
+            self.size -= oldest.size
+            self.evicted += 1
+
+    def get(self, message_id):
+        record = self.messages.get(message_id)
+        if record is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.messages.move_to_end(message_id)
+        return record
+
+    def pop(self, message_id, count=True):
+        record = self.messages.pop(message_id, None)
+        if record is not None:
+            self.size -= record.size
+
+        if count:
+            if record is None:
+                self.misses += 1
+
+            else:
+                self.hits += 1
+
+        return record
+
+    def update(self, message_id, content):
+        record = self.messages.get(message_id)
+        if record is None:
+            return
+
+        self.size -= record.size
+        record.set_content(content)
+        self.size += record.size
+        self.messages.move_to_end(message_id)
+        self._evict()
+
+
+async def record_message_counts(docs):
+    '''
+    Fold newly stored message documents into bowser.messageCounts, which keeps a running message count and last
+    message timestamp per author so profile cards and /info don't need to count the messages collection
+    '''
+    counts = {}
+    for doc in docs:
+        count, last = counts.get(doc['author'], (0, 0))
+        counts[doc['author']] = (count + 1, max(last, doc['timestamp']))
+
+    if not counts:
+        return
+
+    await amclient.bowser.messageCounts.bulk_write(
+        [
+            pymongo.UpdateOne({'_id': author}, {'$inc': {'count': count}, '$max': {'last_message': last}}, upsert=True)
+            for author, (count, last) in counts.items()
+        ],
+        ordered=False,
+    )
+
+
+async def rebuild_message_counts(batch_size=1000):
+    '''
+    Recompute every counter from the message store. Messages stored while this runs can be counted twice or not at
+    all, so run it when chat is quiet. Returns the number of users counted
+    '''
+    totals = {}
+    async for partition in message_store.aggregate(
+        [{'$group': {'_id': '$author', 'count': {'$sum': 1}, 'last_message': {'$max': '$timestamp'}}}],
+        allowDiskUse=True,
+    ):
+        for doc in partition:
+            count, last = totals.get(doc['_id'], (0, 0))
+            totals[doc['_id']] = (count + doc['count'], max(last, doc['last_message']))
+
+    counts = [{'_id': author, 'count': count, 'last_message': last} for author, (count, last) in totals.items()]
+
+    for idx in range(0, len(counts), batch_size):
+        await amclient.bowser.messageCounts.bulk_write(
+            [
+                pymongo.UpdateOne(
+                    {'_id': doc['_id']},
+                    {'$set': {'count': doc['count'], 'last_message': doc['last_message']}},
+                    upsert=True,
+                )
+                for doc in counts[idx : idx + batch_size]
+            ],
+            ordered=False,
+        )
+
+    return len(counts)
 
 
 class MainEvents(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.ingest = MessageIngest(message_store, on_written=self._messages_written)
+        self.purges = PurgeRegistry()
+        self.logs = LogDispatcher()
+        self.joins = JoinPipeline(self)
+        self.messageCache = CompactMessageCache()
+        self.role_sync = None
 
     async def cog_load(self):
+        profile = {}
+        startupStart = time.perf_counter()
+
+        await tools.ensure_stat_indexes()
+        await self.purges.ensure_index()
+        self.ingest.start()
+        self.joins.start()
+        profile['indexes'] = time.perf_counter() - startupStart
+
         logging.info('[Core] Waiting for guild caches to chunk...')
-        await asyncio.sleep(15)
-        try:
-            await self.bot.load_extension('tools')
-            await self.bot.load_extension('modules.moderation')
-            await self.bot.load_extension('modules.utility')
-            await self.bot.load_extension('modules.statistics')
-            await self.bot.load_extension('modules.games')
-            await self.bot.load_extension('modules.social')
-            try:  # Private submodule extensions
-                await self.bot.load_extension('private.automod')
+        phaseStart = time.perf_counter()
+        await self.bot.wait_until_ready()
+        guild = self.bot.get_guild(config.nintendoswitch)
+        if guild and not guild.chunked:
+            await guild.chunk()
+
+        profile['chunk'] = time.perf_counter() - phaseStart
+
+        async def load(extension):
+            extensionStart = time.perf_counter()
+            try:
+                await self.bot.load_extension(extension)
+
+            except commands.errors.ExtensionAlreadyLoaded:
+                pass
+
             except commands.errors.ExtensionNotFound:
+                if not extension.startswith('private.'):
+                    raise
+
                 logging.error('[Core] Unable to load one or more private modules, are you missing the submodule?')
 
-        except discord.ext.commands.errors.ExtensionAlreadyLoaded:
-            pass
+            profile[extension] = time.perf_counter() - extensionStart
+
+        # Extensions in a wave load concurrently. Social looks up the games cog when it is created, and automod expects
+        # the public modules to be available, so they wait for the first wave
+        for wave in [
+            ['tools'],
+            ['modules.moderation', 'modules.utility', 'modules.statistics', 'modules.games'],
+            ['modules.social', 'private.automod'],  # Private submodule extensions
+        ]:
+            await asyncio.gather(*[load(x) for x in wave])
+
+        profile['total'] = time.perf_counter() - startupStart
+        self.startupProfile = profile
+        logging.info(
+            '[Core] Startup profile: ' + ', '.join(f'{phase} {seconds:.2f}s' for phase, seconds in profile.items())
+        )
 
-        # self.sanitize_eud.start()  # pylint: disable=no-member
+        self.sanitize_eud.start()  # pylint: disable=no-member
+        self.role_sync = asyncio.create_task(self._startup_role_sync())
 
         self.serverLogs = self.bot.get_channel(config.logChannel)
         self.modLogs = self.bot.get_channel(config.modChannel)
@@ -49,11 +1128,11 @@ class MainEvents(commands.Cog):
         self.invites = {}
 
         # Automod is hard coded to this guild, so to reduce confusion, we only init configured guild.
-        guild_db = mclient.bowser.guilds
-        guild = guild_db.find_one({'_id': config.nintendoswitch})
+        guild_db = amclient.bowser.guilds
+        guild = await guild_db.find_one({'_id': config.nintendoswitch})
 
         if not guild:
-            guild_db.insert(
+            await guild_db.insert_one(
                 {
                     "_id": config.nintendoswitch,
                     "inviteWhitelist": [config.nintendoswitch],
@@ -62,22 +1141,21 @@ class MainEvents(commands.Cog):
                 }
             )
 
-    #    def cog_unload(self):
-    #        self.sanitize_eud.cancel()  # pylint: disable=no-member
+    async def cog_unload(self):
+        self.sanitize_eud.cancel()  # pylint: disable=no-member
+        if self.role_sync:
+            self.role_sync.cancel()
+
+        await self.ingest.close()
+        await self.joins.close()
+        await self.logs.close()
 
     @tasks.loop(hours=24)
     async def sanitize_eud(self):
         logging.info('[Core] Starting sanitzation of old EUD')
-        msgDB = mclient.bowser.messages
-        msgDB.update_many(
-            {
-                'timestamp': {"$lte": time.time() - (86400 * 365)},
-                'sanitized': False,
-            },  # Store message data upto 1 year old
-            {"$set": {'content': None, 'sanitized': True}},
-        )
+        stripped = await message_store.strip_before(time.time() - (86400 * 365))  # Store message data upto 1 year old
 
-        logging.info('[Core] Finished sanitzation of old EUD')
+        logging.info(f'[Core] Finished sanitzation of old EUD, {len(stripped)} partitions stripped')
 
     @app_commands.command(
         name='ping', description='Checks that the bot is responding normally and shows various latency values'
@@ -91,15 +1169,45 @@ class MainEvents(commands.Cog):
         roundtrip = (msg.created_at - initiated).total_seconds() * 1000
 
         database_start = time.time()
-        mclient.bowser.command('ping')
+        await amclient.bowser.command('ping')
         database = (time.time() - database_start) * 1000
 
         websocket = self.bot.latency * 1000
+        pool = pool_monitor.stats()
 
         return await msg.edit(
             content=(
-                'Pong! Latency: **Roundtrip** `{:1.0f}ms`, **Websocket** `{:1.0f}ms`, **Database** `{:1.0f}ms`'.format(
-                    roundtrip, websocket, database
+                'Pong! Latency: **Roundtrip** `{:1.0f}ms`, **Websocket** `{:1.0f}ms`, **Database** `{:1.0f}ms`\n'
+                'Message ingest: **Queued** `{}`, **Flush** `{:1.0f}ms` avg / `{:1.0f}ms` max\n'
+                'Join pipeline: **Queued** `{}`, **Latency** `{:1.0f}ms` avg / `{:1.0f}ms` max, **Largest batch** `{}`\n'
+                'Message cache: **Messages** `{}`, **Size** `{:1.1f}MiB` of `{:1.0f}MiB`, **Hit rate** `{:1.1%}`\n'
+                'Server logs: **Backlog** `{}`, **Sent** `{}` in `{}` messages, **Dropped** `{}`\n'
+                'Database pool: **Open** `{}`, **In use** `{}` (peak `{}`), **Waiting** `{}`, '
+                '**Checkout wait** `{:1.1f}ms` avg / `{:1.0f}ms` max'.format(
+                    roundtrip,
+                    websocket,
+                    database,
+                    self.ingest.depth,
+                    self.ingest.avg_flush_ms,
+                    self.ingest.max_flush_ms,
+                    self.joins.depth,
+                    self.joins.avg_latency_ms,
+                    self.joins.max_latency_ms,
+                    self.joins.max_batch,
+                    len(self.messageCache),
+                    self.messageCache.size / 1048576,
+                    self.messageCache.budget / 1048576,
+                    self.messageCache.hit_rate,
+                    self.logs.backlog,
+                    self.logs.sent,
+                    self.logs.messages,
+                    self.logs.dropped + self.logs.failed,
+                    pool['open'],
+                    pool['checked_out'],
+                    pool['max_checked_out'],
+                    pool['waiting'],
+                    pool['avg_wait_ms'],
+                    pool['max_wait_ms'],
                 )
             )
         )
@@ -134,16 +1242,13 @@ class MainEvents(commands.Cog):
             return
 
         # Add to database
-        mclient.bowser.users.update_one(
-            {'_id': member.id},
+        await tools.record_history(
+            'voice',
+            member.id,
             {
-                '$push': {
-                    'voiceHistory': {
-                        'before': before.channel.id if before.channel else None,
-                        'after': after.channel.id if after.channel else None,
-                        'timestamp': int(datetime.now(tz=timezone.utc).timestamp()),
-                    }
-                }
+                'before': before.channel.id if before.channel else None,
+                'after': after.channel.id if after.channel else None,
+                'timestamp': int(datetime.now(tz=timezone.utc).timestamp()),
             },
         )
 
@@ -162,198 +1267,21 @@ class MainEvents(commands.Cog):
 
         embed.add_field(name='Mention', value=f'<@{member.id}>', inline=False)
 
-        await self.serverLogs.send(':microphone2: User changed voice channel', embed=embed)
+        self.logs.send(self.serverLogs, ':microphone2: User changed voice channel', embed, priority=LogDispatcher.LOW)
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
-        db = mclient.bowser.users
-        doc = db.find_one({'_id': member.id})
-        roleList = []
-        restored = False
-
-        if not doc:
-            await tools.store_user(member)
-            doc = db.find_one({'_id': member.id})
-
-        else:
-            db.update_one(
-                {'_id': member.id},
-                {'$push': {'joins': int(datetime.now(tz=timezone.utc).timestamp())}},
-            )
-
-        new = (
-            ':new: ' if (datetime.now(tz=timezone.utc) - member.created_at).total_seconds() <= 60 * 60 * 24 * 14 else ''
-        )  # Two weeks
-
-        embed = discord.Embed(color=0x417505, timestamp=datetime.now(tz=timezone.utc))
-        embed.set_author(name=f'{member} ({member.id})', icon_url=member.display_avatar.url)
-        created_at = f'{new} <t:{int(member.created_at.timestamp())}:f>'
-        created_at += '' if not new else f'\n<t:{int(member.created_at.timestamp())}:R>'
-        embed.add_field(name='Created at', value=created_at)
-        embed.add_field(name='Mention', value=f'<@{member.id}>')
-
-        await self.serverLogs.send(':inbox_tray: User joined', embed=embed)
-
-        needsRestore = False
-        hierarchyFails = []
-        if doc and doc['roles']:
-            myTop = member.guild.me.top_role
-            for x in doc['roles']:
-                if x == member.guild.id:
-                    continue
-
-                needsRestore = True
-                role = member.guild.get_role(x)
-                if role:
-                    # Checks if role exists
-                    if myTop > role:
-                        roleList.append(role)
-
-                    else:
-                        hierarchyFails.append(role)
-
-            await member.edit(roles=roleList, reason='Automatic role restore action')
-
-        punDB = mclient.bowser.puns
-        if needsRestore or punDB.find_one({'user': member.id, 'type': 'mute', 'active': True}):
-            punTypes = {
-                'mute': 'Mute',
-                'blacklist': 'Channel Blacklist ({})',
-            }
-            puns = punDB.find({'user': member.id, 'active': True})
-            restoredPuns = []
-            if puns.count():
-                for x in puns:
-                    if x['type'] == 'blacklist':
-                        restoredPuns.append(punTypes[x['type']].format(x['context']))
-
-                    elif x['type'] in ['strike', 'kick', 'ban', 'appealdeny']:
-                        continue  # These are not punishments being "restored", instead only status is being tracked
-
-                    elif x['type'] == 'mute':
-                        if (
-                            x['expiry'] < time.time()
-                        ):  # If the member is rejoining after mute has expired, the task has already quit. Restart it
-                            mod = self.bot.get_cog('Moderation Commands')
-                            await mod.expire_actions(x['_id'], member.guild.id)
-
-                        else:
-                            # The member rejoined while a mute is still active, reapply the chat timeout.
-                            # We want to make sure if the expiry was modified while they were not in the
-                            # server that the correct timeout is applied
-                            await member.edit(
-                                timed_out_until=datetime.fromtimestamp(x['expiry'], tz=timezone.utc),
-                                reason='Reapplying timeout after user rejoined',
-                            )
-
-                            restoredPuns.append(punTypes[x['type']])
-
-                    elif x['type'] in ['tier1', 'tier2', 'tier3']:
-                        # We don't want to handle this, these will be converted to strikes further on
-                        pass
-
-                    else:
-                        restoredPuns.append(punTypes[x['type']])
-
-            embed = discord.Embed(color=0x4A90E2, timestamp=datetime.now(tz=timezone.utc))
-            embed.set_author(name=f'{member} ({member.id})', icon_url=member.display_avatar.url)
-            embed.add_field(name='Restored roles', value=', '.join(x.name for x in roleList) or 'None')
-            if hierarchyFails:
-                embed.description = (
-                    f':warning: Failed to reassign some or all roles due to missing permissions:\n> '
-                    + ', '.join(x.name for x in hierarchyFails)
-                )
-                await self.adminChannel.send(
-                    f':warning: **{member}** ({member.id}) rejoined the server, but I failed to restore some or all roles due to missing permissions: '
-                    + ', '.join(x.name for x in hierarchyFails)
-                )
-            if restoredPuns:
-                embed.add_field(name='Restored punishments', value=', '.join(restoredPuns))
-            embed.add_field(name='Mention', value=f'<@{member.id}>')
-            await self.serverLogs.send(':shield: Member restored', embed=embed)
-
-        if punDB.count_documents({'user': member.id, 'active': True, 'type': {'$in': ['mute', 'strike', 'blacklist']}}):
-            activeHist = []
-            strikes = 0
-            for pun in punDB.find(
-                {'user': member.id, 'active': True, 'type': {'$in': ['mute', 'strike', 'blacklist']}}
-            ):
-                if pun['type'] == 'strike':
-                    strikes += pun['active_strike_count']
-
-                elif pun['type'] == 'mute':
-                    activeHist.append('Mute')
-
-                elif pun['type'] == 'blacklist':
-                    activeHist.append(f'Blacklist ({pun["context"]})')
-
-            if strikes:
-                activeHist.append(f'{strikes} Strike{"s" if strikes > 1 else ""}')
-
-            await self.adminChannel.send(
-                f':grey_exclamation: **{member}** ({member.id}) rejoined the server after leaving with the following active punishments:\n{", ".join(activeHist)}'
-            )
-
-        if (
-            'migrate_unnotified' in doc.keys() and doc['migrate_unnotified'] == True
-        ):  # Migration of warnings to strikes for returning members
-            for pun in punDB.find(
-                {'active': True, 'type': {'$in': ['tier1', 'tier2', 'tier3']}, 'user': member.id}
-            ):  # Should only be one, it's mutually exclusive
-                strikeCount = int(pun['type'][-1:]) * 4
-
-                punDB.update_one({'_id': pun['_id']}, {'$set': {'active': False}})
-
-                explanation = (
-                    'Hello there **{}**,\nI am letting you know of a change in status for your active level {} warning issued on {}.\n\n'
-                    'The **/r/NintendoSwitch** Discord server is moving to a strike-based system for infractions. Here is what you need to know:\n'
-                    '- Your warning level will be converted to **{}** strikes.\n'
-                    '- __Your strikes will decay at a equivalent rate as warnings previously did__. Each warning tier is equivalent to four strikes, where one strike decays once per week instead of one warn level per four weeks\n'
-                    '- You will no longer have any permission restrictions you previously had with this warning. Moderators will instead restrict features as needed to enforce the rules on a case-by-case basis.\n\n'
-                    'Strikes will allow the moderation team to weigh rule-breaking behavior better and serve as a reminder to users who may need to review our rules. You may also now view your infraction history '
-                    'by using the `/history` command in any channel. Please feel free to send a modmail to @Parakarry (<@{}>) if you have any questions or concerns.'
-                ).format(
-                    str(member),  # Username
-                    pun['type'][-1:],  # Tier type
-                    f'<t:{int(pun["timestamp"])}:D>',  # Date of warn
-                    strikeCount,  # How many strikes will replace tier,
-                    config.parakarry,  # Parakarry mention for DM
-                )
-
-                public_notify = False
-                try:
-                    await member.send(explanation)
-
-                except:
-                    public_notify = True
-
-                docID = await tools.issue_pun(
-                    member.id,
-                    self.bot.user.id,
-                    'strike',
-                    f'[Migrated] {pun["reason"]}',
-                    strike_count=strikeCount,
-                    context='strike-migration',
-                    public=False,
-                    public_notify=public_notify,
-                )
-                db.update_one(
-                    {'_id': member.id},
-                    {'$set': {'migrate_unnotified': False, 'strike_check': time.time() + (60 * 60 * 24 * 7)}},
-                )  # Setting the next expiry check time
-                mod = self.bot.get_cog('Moderation Commands')
-                await mod.expire_actions(docID, member.guild.id)
+        await self.joins.put(member)
 
     @commands.Cog.listener()
     async def on_member_remove(self, member):
-        db = mclient.bowser.puns
-        puns = db.find({'user': member.id, 'active': True, 'type': {'$in': ['strike', 'mute', 'blacklist']}})
+        db = amclient.bowser.puns
+        puns = await db.find({'user': member.id, 'active': True, 'type': {'$in': ['strike', 'mute', 'blacklist']}})
 
-        mclient.bowser.users.update_one(
-            {'_id': member.id},
-            {'$push': {'leaves': int(datetime.now(tz=timezone.utc).timestamp())}},
-        )
-        if puns.count():
+        left = int(datetime.now(tz=timezone.utc).timestamp())
+        await amclient.bowser.users.update_one({'_id': member.id}, {'$push': {'leaves': left}})
+        await tools.record_member_event(member.id, 'leave', left)
+        if puns:
             embed = discord.Embed(
                 description=f'{member} ({member.id}) left the server\n\n:warning: __**User had active punishments**__ :warning:',
                 color=0xD62E44,
@@ -376,16 +1304,18 @@ class MainEvents(commands.Cog):
 
         embed.set_author(name=f'{member} ({member.id})', icon_url=member.display_avatar.url)
         embed.add_field(name='Mention', value=f'<@{member.id}>')
-        await self.serverLogs.send(':outbox_tray: User left', embed=embed)
+        self.logs.send(self.serverLogs, ':outbox_tray: User left', embed)
 
     @commands.Cog.listener()
     async def on_member_ban(self, guild: discord.Guild, user: discord.User):
         if guild.id != config.nintendoswitch:
             return
 
-        db = mclient.bowser.puns
+        db = amclient.bowser.puns
         await asyncio.sleep(10)  # Wait 10 seconds to allow audit log to update
-        if not db.find_one({'user': user.id, 'type': 'ban', 'active': True, 'timestamp': {'$gt': time.time() - 60}}):
+        if not await db.find_one(
+            {'user': user.id, 'type': 'ban', 'active': True, 'timestamp': {'$gt': time.time() - 60}}
+        ):
             # Manual ban
             audited = None
             async for entry in guild.audit_logs(action=discord.AuditLogAction.ban):
@@ -405,15 +1335,15 @@ class MainEvents(commands.Cog):
         embed.set_author(name=f'{user} ({user.id})', icon_url=user.display_avatar.url)
         embed.add_field(name='Mention', value=f'<@{user.id}>')
 
-        await self.serverLogs.send(':rotating_light: User banned', embed=embed)
+        self.logs.send(self.serverLogs, ':rotating_light: User banned', embed, priority=LogDispatcher.HIGH)
 
     @commands.Cog.listener()
     async def on_member_unban(self, guild: discord.Guild, user: discord.User):
         if guild.id != config.nintendoswitch:
             return
 
-        db = mclient.bowser.puns
-        if not db.find_one({'user': user.id, 'type': 'unban', 'timestamp': {'$gt': time.time() - 60}}):
+        db = amclient.bowser.puns
+        if not await db.find_one({'user': user.id, 'type': 'unban', 'timestamp': {'$gt': time.time() - 60}}):
             # Manual unban
 
             audited = None
@@ -428,7 +1358,9 @@ class MainEvents(commands.Cog):
 
                 reason = audited.reason or '-No reason specified-'
                 docID = await tools.issue_pun(audited.target.id, audited.user.id, 'unban', reason, active=False)
-                db.update_one({'user': audited.target.id, 'type': 'ban', 'active': True}, {'$set': {'active': False}})
+                await db.update_one(
+                    {'user': audited.target.id, 'type': 'ban', 'active': True}, {'$set': {'active': False}}
+                )
 
                 await tools.send_modlog(
                     self.bot, self.modLogs, 'unban', docID, reason, user=user, moderator=audited.user, public=True
@@ -438,7 +1370,7 @@ class MainEvents(commands.Cog):
         embed.set_author(name=f'{user} ({user.id})', icon_url=user.display_avatar.url)
         embed.add_field(name='Mention', value=f'<@{user.id}>')
 
-        await self.serverLogs.send(':triangular_flag_on_post: User unbanned', embed=embed)
+        self.logs.send(self.serverLogs, ':triangular_flag_on_post: User unbanned', embed, priority=LogDispatcher.HIGH)
 
     @commands.Cog.listener()
     async def on_thread_join(self, thread):
@@ -450,17 +1382,18 @@ class MainEvents(commands.Cog):
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.author.bot or message.webhook_id:
+            self.messageCache.skip(message.id)
             return
 
         if message.type not in [discord.MessageType.default, discord.MessageType.reply]:
             logging.debug(f'on_message discarding non-normal-message: {message.type=}, {message.id=}')
+            self.messageCache.skip(message.id)
             return
 
         if not message.guild:
             logging.debug(f'Discarding non guild message {message.channel.type} {message.id}')
             return
 
-        db = mclient.bowser.messages
         timestamp = int(time.time())
         obj = {
             '_id': message.id,
@@ -476,61 +1409,72 @@ class MainEvents(commands.Cog):
         if issubclass(message.channel.__class__, discord.Thread):
             obj['parent_channel'] = message.channel.parent_id
 
-        db.insert_one(obj)
+        self.messageCache.put(CachedMessage.from_message(message))
+        await self.ingest.put(obj)
 
         await self.bot.process_commands(message)  # Allow commands to fire
         return
 
     @commands.Cog.listener()
-    async def on_bulk_message_delete(self, messages):  # TODO: Work with archives channel attribute to list channels
-        if not messages[0].guild:
-            logging.debug(f'Discarding non guild bulk delete {messages[0].channel.type}  {messages[0].id}')
+    async def on_raw_bulk_message_delete(self, payload):  # TODO: Work with archives channel attribute to list channels
+        if not payload.guild_id:
+            logging.debug(f'Discarding non guild bulk delete {payload.channel_id}')
             return
 
-        await asyncio.sleep(10)  # Give chance for clean command to finish and discord to process delete
-        db = mclient.bowser.archive
-        checkStamp = int(
-            time.time() - 600
-        )  # Rate limiting, instability, and being just slow to fire are other factors that could delay the event
-        archives = db.find({'timestamp': {'$gt': checkStamp}})
-        if archives:  # If the bulk delete is the result of us, exit
-            for x in archives:
-                if messages[0].id in x['messages']:
-                    return
+        if await self.purges.contains(payload.message_ids):
+            for messageID in payload.message_ids:
+                self.messageCache.pop(messageID, count=False)
+
+            return  # The bulk delete is the result of us
+
+        # Messages the cache never stores are not misses, as with single deletes
+        known = {x.id: x for x in payload.cached_messages}
+        records = [
+            self.messageCache.pop(x, count=not self._uncacheable(x, known.get(x))) for x in sorted(payload.message_ids)
+        ]
+        records = [x for x in records if x]
+        if not records:
+            return  # None of the messages were cached, so there is nothing to archive
+
+        authors = {}
+        writer = None
+        for record in records:
+            if record.author_id not in authors:
+                authors[record.author_id] = await self._resolve_author(record.guild_id, record.author_id)
+
+            message = self._archived(record, authors[record.author_id])
+            if not writer:
+                writer = tools.ArchiveWriter(message)
 
-        archiveID = await tools.message_archive(messages)
+            await writer.add(message)
+
+        archiveID = await writer.close()
 
         embed = discord.Embed(
             description=f'Archive URL: {config.baseUrl}/logs/{archiveID}',
             color=0xF5A623,
             timestamp=datetime.now(tz=timezone.utc),
         )
-        return await self.serverLogs.send(':printer: New message archive generated', embed=embed)
+        self.logs.send(self.serverLogs, ':printer: New message archive generated', embed, priority=LogDispatcher.HIGH)
 
     @commands.Cog.listener()
     async def on_raw_message_delete(self, payload):
-        if payload.cached_message:
-            if (
-                payload.cached_message.type not in [discord.MessageType.default, discord.MessageType.reply]
-                or payload.cached_message.author.bot
-            ):
-                logging.debug(
-                    'on_raw_message_delete discarding non guild message '
-                    f'{payload.cached_message.channel.type} {payload.cached_message.id}'
-                )
-                return  # No system messages
+        if not payload.guild_id or self._uncacheable(payload.message_id, payload.cached_message):
+            return  # Never cached or stored, so there is nothing to log
 
-            if not payload.cached_message.content and not payload.cached_message.attachments:
+        cached = self.messageCache.pop(payload.message_id)
+        if cached:
+            if not cached.content and not cached.attachments:
                 return  # Blank or null content (could be embed)
 
-            user = payload.cached_message.author
-            jump_url = payload.cached_message.jump_url
-            content = payload.cached_message.content if payload.cached_message.content else '-No message content-'
+            user = await self._resolve_author(cached.guild_id, cached.author_id)
+            jump_url = cached.jump_url
+            content = cached.content if cached.content else '-No message content-'
+            attachments = [proxy for _, proxy in cached.attachments]
 
         else:
             # Message is not in ram cache, pull from DB or ignore if missing
-            db = mclient.bowser.messages
-            dbMessage = db.find_one({'_id': payload.message_id, 'channel': payload.channel_id})
+            dbMessage = await message_store.find_one(payload.message_id)
             if not dbMessage:
                 logging.warning(
                     f'[Core] Missing message metadata for deletion of {payload.channel_id}/{payload.message_id}'
@@ -542,6 +1486,7 @@ class MainEvents(commands.Cog):
             content = (
                 '-No saved copy of message content is available-' if not dbMessage['content'] else dbMessage['content']
             )
+            attachments = []
 
         embed = discord.Embed(
             description=f'[Jump to message]({jump_url})\n{content}',
@@ -550,12 +1495,11 @@ class MainEvents(commands.Cog):
         )
         embed.set_author(name=f'{str(user)} ({user.id})', icon_url=user.display_avatar.url)
         embed.add_field(name='Mention', value=f'<@{user.id}>')
-        if payload.cached_message and len(payload.cached_message.attachments) == 1:
-            embed.set_image(url=payload.cached_message.attachments[0].proxy_url)
+        if len(attachments) == 1:
+            embed.set_image(url=attachments[0])
 
-        elif payload.cached_message and len(payload.cached_message.attachments) > 1:
+        elif len(attachments) > 1:
             # More than one attachment, use fields
-            attachments = [x.proxy_url for x in payload.cached_message.attachments]
             for a in range(len(attachments)):
                 embed.add_field(name=f'Attachment {a + 1}', value=attachments[a])
 
@@ -563,61 +1507,86 @@ class MainEvents(commands.Cog):
             embed.description = content
             embed.add_field(name='Jump', value=f'[Jump to message]({jump_url})')
 
-        await self.serverLogs.send(f':wastebasket: Message deleted in <#{payload.channel_id}>', embed=embed)
+        self.logs.send(self.serverLogs, f':wastebasket: Message deleted in <#{payload.channel_id}>', embed)
+
+    def _uncacheable(self, message_id, message=None):
+        '''Whether a message is one that on_message never caches, from its ID or discord.py's copy of it'''
+        if message and (
+            message.author.bot
+            or message.webhook_id
+            or message.type not in [discord.MessageType.default, discord.MessageType.reply]
+        ):
+            return True
+
+        return self.messageCache.is_skipped(message_id)
 
     @commands.Cog.listener()
-    async def on_message_edit(self, before, after):
-        if not before.guild:
-            logging.debug(f'Discarding non guild edit {before.channel.type} {before.id}')
+    async def on_raw_message_edit(self, payload):
+        if not payload.guild_id:
+            logging.debug(f'Discarding non guild edit {payload.channel_id} {payload.message_id}')
             return
 
-        if before.content == after.content or before.author.bot:
+        if 'content' not in payload.data:
+            return  # Not a content edit, i.e. an embed resolving
+
+        # Only regular messages from users are cached, so bots and system messages are skipped here too
+        data = payload.data
+        if (
+            data.get('author', {}).get('bot')
+            or data.get('webhook_id')
+            or data.get('type', 0) not in (discord.MessageType.default.value, discord.MessageType.reply.value)
+            or self._uncacheable(payload.message_id, payload.cached_message)
+        ):
             return
 
-        if before.type not in [discord.MessageType.default, discord.MessageType.reply]:
-            logging.debug(f'on_message_edit discarding non-normal-message: {before.type=}, {before.id=}')
-            return  # No system messages
+        cached = self.messageCache.get(payload.message_id)
+        if not cached or cached.content == payload.data['content']:
+            return
 
-        if not after.content or not before.content:
+        before = cached.content
+        after = payload.data['content']
+        self.messageCache.update(payload.message_id, after)
+        if not after or not before:
             return  # Blank or null content (could be embed)
 
-        if len(before.content) <= 1024 and len(after.content) <= 1024:
+        author = await self._resolve_author(cached.guild_id, cached.author_id)
+        if len(before) <= 1024 and len(after) <= 1024:
             embed = discord.Embed(
-                description=f'[Jump to message]({before.jump_url})',
+                description=f'[Jump to message]({cached.jump_url})',
                 color=0xF8E71C,
                 timestamp=datetime.now(tz=timezone.utc),
             )
-            embed.add_field(name='Before', value=before.content, inline=False)
-            embed.add_field(name='After', value=after.content, inline=False)
+            embed.add_field(name='Before', value=before, inline=False)
+            embed.add_field(name='After', value=after, inline=False)
 
         else:
+            archive = [self._archived(cached, author, before), self._archived(cached, author, after)]
             embed = discord.Embed(
-                description=f'[Jump to message]({before.jump_url})\nMessage diff exceeds character limit, view at {config.baseUrl}/logs/{await tools.message_archive([before, after], True)}',
+                description=f'[Jump to message]({cached.jump_url})\nMessage diff exceeds character limit, view at {config.baseUrl}/logs/{await tools.message_archive(archive, True)}',
                 color=0xF8E71C,
                 timestamp=datetime.now(tz=timezone.utc),
             )
 
-        embed.set_author(name=f'{str(before.author)} ({before.author.id})', icon_url=before.author.display_avatar.url)
-        embed.add_field(name='Mention', value=f'<@{before.author.id}>')
+        embed.set_author(name=f'{str(author)} ({author.id})', icon_url=author.display_avatar.url)
+        embed.add_field(name='Mention', value=f'<@{author.id}>')
+
+        self.logs.send(self.serverLogs, f':pencil: Message edited in <#{payload.channel_id}>', embed)
 
-        await self.serverLogs.send(f':pencil: Message edited in <#{before.channel.id}>', embed=embed)
+    async def _resolve_author(self, guild_id, user_id):
+        guild = self.bot.get_guild(guild_id)
+        user = (guild.get_member(user_id) if guild else None) or self.bot.get_user(user_id)
+        return user if user else await self.bot.fetch_user(user_id)
+
+    def _archived(self, record, author, content=None):
+        guild = self.bot.get_guild(record.guild_id)
+        return ArchivedMessage(record, guild, guild.get_channel_or_thread(record.channel_id), author, content)
 
     @commands.Cog.listener()
     async def on_member_update(self, before, after):
-        userCol = mclient.bowser.users
+        userCol = amclient.bowser.users
         if before.display_name != after.display_name:
-            userCol.update_one(
-                {'_id': before.id},
-                {
-                    '$push': {
-                        'nameHist': {
-                            'str': after.display_name,  # Not escaped. Can be None if nickname removed
-                            'type': 'nick',
-                            'discriminator': after.discriminator,
-                            'timestamp': int(datetime.now(tz=timezone.utc).timestamp()),
-                        }
-                    }
-                },
+            await tools.record_history(
+                'name', before.id, tools.name_event(after, 'nick', int(datetime.now(tz=timezone.utc).timestamp()))
             )
             if not before.display_name:
                 before_name = before.name
@@ -637,7 +1606,7 @@ class MainEvents(commands.Cog):
             embed.add_field(name='After', value=after_name, inline=False)
             embed.add_field(name='Mention', value=f'<@{before.id}>')
 
-            await self.serverLogs.send(':label: User\'s display name updated', embed=embed)
+            self.logs.send(self.serverLogs, ':label: User\'s display name updated', embed)
 
         if before.roles != after.roles:
             roleList = []
@@ -650,10 +1619,20 @@ class MainEvents(commands.Cog):
                     roleList.append(x.id)
                 roleStr.append(x.name)
 
-            userCol.update_one({'_id': before.id}, {'$set': {'roles': roleList}})
+            await userCol.update_one({'_id': before.id}, {'$set': {'roles': roleList}})
 
             beforeCounter = collections.Counter(before.roles)
             afterCounter = collections.Counter(after.roles)
+            if beforeCounter != afterCounter:
+                await tools.record_history(
+                    'role',
+                    before.id,
+                    {
+                        'added': [x.id for x in afterCounter - beforeCounter],
+                        'removed': [x.id for x in beforeCounter - afterCounter],
+                        'timestamp': int(datetime.now(tz=timezone.utc).timestamp()),
+                    },
+                )
 
             rolesRemoved = list(map(lambda x: x.name, beforeCounter - afterCounter))
             rolesAdded = list(map(lambda x: x.name, afterCounter - beforeCounter))
@@ -679,7 +1658,7 @@ class MainEvents(commands.Cog):
                     inline=False,
                 )
                 embed.add_field(name='Mention', value=f'<@{before.id}>')
-                await self.serverLogs.send(':closed_lock_with_key: User\'s roles updated', embed=embed)
+                self.logs.send(self.serverLogs, ':closed_lock_with_key: User\'s roles updated', embed)
 
     @commands.Cog.listener()
     async def on_user_update(self, before, after):
@@ -688,20 +1667,9 @@ class MainEvents(commands.Cog):
             # is when nitro runs out with a custom discriminator set
             before_name = discord.utils.escape_markdown(str(before))
             after_name = discord.utils.escape_markdown(str(after))
-            userCol = mclient.bowser.users
 
-            userCol.update_one(
-                {'_id': before.id},
-                {
-                    '$push': {
-                        'nameHist': {
-                            'str': after.name,  # We want to keep the integrity without escape characters
-                            'type': 'name',
-                            'discriminator': after.discriminator,
-                            'timestamp': int(datetime.now(tz=timezone.utc).timestamp()),
-                        }
-                    }
-                },
+            await tools.record_history(
+                'name', before.id, tools.name_event(after, 'name', int(datetime.now(tz=timezone.utc).timestamp()))
             )
             embed = discord.Embed(color=0x9535EC, timestamp=datetime.now(tz=timezone.utc))
             embed.set_author(name=f'{after} ({after.id})', icon_url=after.display_avatar.url)
@@ -709,15 +1677,11 @@ class MainEvents(commands.Cog):
             embed.add_field(name='After', value=after_name, inline=False)
             embed.add_field(name='Mention', value=f'<@{before.id}>')
 
-            await self.serverLogs.send(':label: User\'s username updated', embed=embed)
+            self.logs.send(self.serverLogs, ':label: User\'s username updated', embed)
 
     @commands.Cog.listener()
     async def on_guild_role_delete(self, role):
-        db = mclient.bowser.users
-        for user in db.find({'roles': {'$in': [role.id]}}):
-            storedRoles = user['roles']
-            storedRoles.remove(role.id)
-            db.update_one({'_id': user['_id']}, {'$set': {'roles': storedRoles}})
+        await amclient.bowser.users.update_many({'roles': role.id}, {'$pull': {'roles': role.id}})
 
     @app_commands.guilds(discord.Object(id=config.nintendoswitch))
     @app_commands.default_permissions(manage_guild=True)
@@ -749,32 +1713,139 @@ class MainEvents(commands.Cog):
     @update_group.command(
         name='cache', description='Update the database message cache for the entire server. API and resource intensive'
     )
-    async def _update_cache(self, interaction: discord.Interaction):
+    @app_commands.describe(restart='Ignore saved progress and crawl every channel from the beginning')
+    async def _update_cache(self, interaction: discord.Interaction, restart: bool = False):
         funcStart = time.time()
         logging.info('[Core] Starting db message sync')
-        await interaction.send_message(
+        await interaction.response.send_message(
             'Starting syncronization of db for all messages in server. This will take a conciderable amount of time.'
         )
 
-        for channel in interaction.guild.channels:
-            if not issubclass(channel.__class__, discord.abc.Messageable):
-                continue
+        channels = [c for c in interaction.guild.channels if isinstance(c, discord.abc.Messageable)]
+        backfill = MessageBackfill(channels, on_written=self._messages_written)
+        task = asyncio.create_task(backfill.run(restart=restart))
+
+        # Because this will definitely exceed the interaction expiry, report progress to the channel directly
+        status = await interaction.channel.send('Syncronization starting...')
+        while not task.done():
+            await asyncio.wait([task], timeout=15)
+            await status.edit(
+                content=(
+                    f'Syncronized {len(backfill.completed)}/{len(channels)} channels. Processed {backfill.processed} '
+                    f'messages ({backfill.rate:.0f}/s) and recorded meta data for {backfill.stored} messages'
+                )
+            )
 
-            # Because this will definitely exceed the interaction expiry, send messages to the channel directly
-            await interaction.channel.send(f'Starting syncronization for <#{channel.id}>')
+        if task.exception():
+            logging.error('[Core] Message sync failed', exc_info=task.exception())
+            return await interaction.channel.send(
+                f'<@{interaction.user.id}> {config.redTick} Syncronization failed, run the command again to resume'
+            )
 
-            try:
-                x, y = await self.store_message_cache(channel)
-                await interaction.channel.send(
-                    f'Syncronized <#{channel.id}>. Processed {x} messages and recorded meta data for {y} messages'
-                )
+        failed = ''
+        if backfill.failed:
+            failed = '. Failed to syncronize ' + ', '.join(f'<#{c.id}>' for c in backfill.failed)
+
+        timeToComplete = tools.humanize_duration(tools.resolve_duration(f'{int(time.time() - funcStart)}s'))
+        return await interaction.channel.send(
+            f'<@{interaction.user.id}> Syncronization completed. Took {timeToComplete}{failed}'
+        )
+
+    @update_group.command(name='roles', description='Reconcile the stored member roles with the server')
+    @app_commands.describe(throttle='Seconds to wait between each batch of 1000 users, defaults to 0.1')
+    async def _update_roles(self, interaction: discord.Interaction, throttle: app_commands.Range[float, 0, 10] = 0.1):
+        funcStart = time.time()
+        await interaction.response.send_message('Reconciling stored member roles. This may take a while.')
+
+        reconciler = await self.reconcile_roles(throttle)
+
+        timeToComplete = tools.humanize_duration(tools.resolve_duration(f'{int(time.time() - funcStart)}s'))
+        return await interaction.channel.send(
+            f'<@{interaction.user.id}> {config.greenTick} Checked {reconciler.scanned} users, fixed roles for '
+            f'{reconciler.fixed} and stored {reconciler.created} missing members. Took {timeToComplete}'
+        )
+
+    @update_group.command(
+        name='history', description='Move voice and name history off user documents into history buckets'
+    )
+    async def _update_history(self, interaction: discord.Interaction):
+        funcStart = time.time()
+        logging.info('[Core] Migrating user history into buckets')
+        await interaction.response.send_message('Migrating user history into buckets. This may take a while.')
+
+        users = await tools.migrate_user_history()
+
+        timeToComplete = tools.humanize_duration(tools.resolve_duration(f'{int(time.time() - funcStart)}s'))
+        logging.info(f'[Core] Migrated history for {users} users')
+        return await interaction.channel.send(
+            f'<@{interaction.user.id}> {config.greenTick} Migrated history for {users} users. Took {timeToComplete}'
+        )
 
-            except (discord.Forbidden, discord.HTTPException):
-                await interaction.channel.send(f'Failed to syncronize <#{channel.id}>')
+    @update_group.command(
+        name='counters', description='Rebuild the per-user message counters from the message database'
+    )
+    async def _update_counters(self, interaction: discord.Interaction):
+        funcStart = time.time()
+        logging.info('[Core] Rebuilding message counters')
+        await interaction.response.send_message('Rebuilding message counters. This may take a while.')
+
+        users = await rebuild_message_counts()
+
+        timeToComplete = tools.humanize_duration(tools.resolve_duration(f'{int(time.time() - funcStart)}s'))
+        logging.info(f'[Core] Rebuilt message counters for {users} users')
+        return await interaction.channel.send(
+            f'<@{interaction.user.id}> {config.greenTick} Rebuilt message counters for {users} users. '
+            f'Took {timeToComplete}'
+        )
+
+    @update_group.command(name='rollups', description='Rebuild the activity rollups used by /stats')
+    async def _update_rollups(self, interaction: discord.Interaction):
+        funcStart = time.time()
+        logging.info('[Core] Rebuilding activity rollups')
+        await interaction.response.send_message('Rebuilding activity rollups. This may take a while.')
+
+        await tools.rebuild_rollups()
+
+        timeToComplete = tools.humanize_duration(tools.resolve_duration(f'{int(time.time() - funcStart)}s'))
+        logging.info('[Core] Rebuilt activity rollups')
+        return await interaction.channel.send(
+            f'<@{interaction.user.id}> {config.greenTick} Rebuilt activity rollups. Took {timeToComplete}'
+        )
+
+    @update_group.command(
+        name='memberevents', description='Rebuild the join/leave event log from the join and leave history of users'
+    )
+    async def _update_member_events(self, interaction: discord.Interaction):
+        funcStart = time.time()
+        logging.info('[Core] Rebuilding member event log')
+        await interaction.response.send_message('Rebuilding member event log. This may take a while.')
+
+        events = await tools.rebuild_member_events()
 
         timeToComplete = tools.humanize_duration(tools.resolve_duration(f'{int(time.time() - funcStart)}s'))
+        logging.info(f'[Core] Rebuilt member event log with {events} events')
         return await interaction.channel.send(
-            f'<@{interaction.user.id}> Syncronization completed. Took {timeToComplete}'
+            f'<@{interaction.user.id}> {config.greenTick} Rebuilt member event log with {events} events. '
+            f'Took {timeToComplete}'
+        )
+
+    @update_group.command(
+        name='partitions', description='Move messages stored before partitioning into the monthly message partitions'
+    )
+    async def _update_partitions(self, interaction: discord.Interaction):
+        funcStart = time.time()
+        logging.info('[Core] Migrating legacy messages into partitions')
+        await interaction.response.send_message(
+            'Migrating stored messages into monthly partitions. This may take a while.'
+        )
+
+        moved = await message_store.migrate_legacy()
+
+        timeToComplete = tools.humanize_duration(tools.resolve_duration(f'{int(time.time() - funcStart)}s'))
+        logging.info(f'[Core] Migrated {moved} legacy messages into partitions')
+        return await interaction.channel.send(
+            f'<@{interaction.user.id}> {config.greenTick} Moved {moved} messages into monthly partitions. '
+            f'Took {timeToComplete}'
         )
 
     @update_group.command(name='gamedb', description='Sync the games database with GiantBomb')
@@ -789,32 +1860,37 @@ class MainEvents(commands.Cog):
     @app_commands.default_permissions(manage_guild=True)
     async def _shutdown(self, interaction: discord.Interaction):
         await interaction.response.send_message('Closing connection to discord and shutting down')
+        await self.ingest.close()
+        await self.joins.close()
+        await self.logs.close()
         return await self.bot.close()
 
-    async def store_message_cache(self, channel):
-        # users = mclient.bowser.users
-        db = mclient.bowser.messages
-        x = 0
-        y = 0
-        async for message in channel.history(limit=None):
-            x += 1
-            if message.author.bot:
-                continue
+    async def _startup_role_sync(self):
+        try:
+            await self.reconcile_roles()
 
-            msg = db.find_one({'_id': message.id})
-            if not msg:
-                y += 1
-                db.insert_one(
-                    {
-                        '_id': message.id,
-                        'author': message.author.id,
-                        'guild': message.guild.id,
-                        'channel': message.channel.id,
-                        'timestamp': int(message.created_at.timestamp()),
-                    }
-                )
+        except Exception:
+            logging.exception('[Core] Startup role reconciliation failed')
+
+    async def reconcile_roles(self, throttle=0.1):
+        funcStart = time.time()
+        logging.info('[Core] Reconciling stored member roles')
+        reconciler = RoleReconciler(self.bot.get_guild(config.nintendoswitch), throttle=throttle)
+        await reconciler.run()
+
+        logging.info(
+            f'[Core] Role reconciliation complete in {time.time() - funcStart:.1f}s. Checked {reconciler.scanned} '
+            f'users, fixed {reconciler.fixed} drifted and stored {reconciler.created} missing'
+        )
+        return reconciler
+
+    async def _messages_written(self, docs):
+        '''Update the derived counters and rollups for newly stored message documents'''
+        if not docs:
+            return
 
-        return x, y
+        await record_message_counts(docs)
+        await tools.record_message_rollups(docs)
 
 
 async def setup(bot):
@@ -17,10 +17,9 @@ from discord.ext import commands, tasks
 from fuzzywuzzy import fuzz
 
 import tools  # type: ignore
+from database import amclient
 
 
-mclient = pymongo.MongoClient(config.mongoURI)
-
 GIANTBOMB_NSW_ID = 157
 AUTO_SYNC = False
 SEARCH_RATIO_THRESHOLD = 50
@@ -112,18 +111,13 @@ class Games(commands.Cog, name='Games'):
     def __init__(self, bot):
         self.bot = bot
         self.GiantBomb = GiantBomb(config.giantbomb)
-        self.db = mclient.bowser.games
+        self.db = amclient.bowser.games
 
         self.last_sync = {
             'part': {'at': None, 'count': {'games': 0, 'releases': 0}, 'running': False},
             'full': {'at': None, 'count': {'games': 0, 'releases': 0}, 'running': False},
         }
 
-        # Ensure indices exist
-        self.db.create_index([("date_last_updated", pymongo.DESCENDING)])
-        self.db.create_index([("guid", pymongo.ASCENDING)], unique=True)
-        self.db.create_index([("game.id", pymongo.ASCENDING)])
-
         # Generate the pipeline
         self.pipeline = [
             {'$match': {'_type': 'game'}},  # Select games
@@ -148,7 +142,15 @@ class Games(commands.Cog, name='Games'):
                 }
             },  # Filter to only stuff we want
         ]
-        self.aggregatePipeline = list(self.db.aggregate(self.pipeline))
+        self.aggregatePipeline = []
+
+    async def cog_load(self):
+        # Ensure indices exist
+        await self.db.create_index([("date_last_updated", pymongo.DESCENDING)])
+        await self.db.create_index([("guid", pymongo.ASCENDING)], unique=True)
+        await self.db.create_index([("game.id", pymongo.ASCENDING)])
+
+        self.aggregatePipeline = await self.db.aggregate(self.pipeline)
 
         if AUTO_SYNC:
             self.sync_db.start()  # pylint: disable=no-member
@@ -164,10 +166,10 @@ class Games(commands.Cog, name='Games'):
         full = force_full or ((self.last_sync['full']['at'] < day_ago) if self.last_sync['full']['at'] else True)
 
         if not full:
-            try:
-                latest_doc = self.db.find().sort("date_last_updated", pymongo.DESCENDING).limit(1).next()
+            latest_doc = await self.db.find_one({}, sort=[("date_last_updated", pymongo.DESCENDING)])
+            if latest_doc:
                 after = latest_doc['date_last_updated']
-            except StopIteration:
+            else:
                 full = True  # Do full sync if we're having issues getting latest updated
 
         detail_str = '(full)' if full else f'(partial after {after})'
@@ -176,7 +178,7 @@ class Games(commands.Cog, name='Games'):
 
         if full:
             # Flag items so we can detect if they are not updated.
-            self.db.update_many({}, {'$set': {'_full_sync_updated': False}})
+            await self.db.update_many({}, {'$set': {'_full_sync_updated': False}})
 
         count = {}
         for type, path in [('game', 'games'), ('release', 'releases')]:
@@ -186,7 +188,7 @@ class Games(commands.Cog, name='Games'):
                     if full:
                         game['_full_sync_updated'] = True
 
-                    self.update_item_in_db(type, game)
+                    await self.update_item_in_db(type, game)
                     count[path] += 1
 
             except aiohttp.ClientResponseError as e:
@@ -199,7 +201,7 @@ class Games(commands.Cog, name='Games'):
                 raise
 
         if full:
-            self.db.delete_many({'_full_sync_updated': False})  # If items were not updated, delete them
+            await self.db.delete_many({'_full_sync_updated': False})  # If items were not updated, delete them
 
         logging.info(f'[Games] Finished syncing {count["games"]} games and {count["releases"]} releases {detail_str}')
         self.last_sync['full' if full else 'part'] = {
@@ -207,11 +209,11 @@ class Games(commands.Cog, name='Games'):
             'count': count,
             'running': False,
         }
-        self.aggregatePipeline = list(self.db.aggregate(self.pipeline))
+        self.aggregatePipeline = await self.db.aggregate(self.pipeline)
 
         return count, detail_str
 
-    def update_item_in_db(self, type: Literal['game', 'release'], game: dict):
+    async def update_item_in_db(self, type: Literal['game', 'release'], game: dict):
         if type not in ['game', 'release']:
             raise ValueError(f'invalid type: {type}')
 
@@ -232,7 +234,7 @@ class Games(commands.Cog, name='Games'):
 
         game['_type'] = type
 
-        return self.db.replace_one({'guid': game['guid']}, game, upsert=True)
+        return await self.db.replace_one({'guid': game['guid']}, game, upsert=True)
 
     def search(self, query: str) -> Optional[dict]:
         match = {'guid': None, 'score': None, 'name': None}
@@ -259,13 +261,13 @@ class Games(commands.Cog, name='Games'):
 
         return match
 
-    def get_preferred_name(self, guid: str) -> Optional[str]:
-        game = self.db.find_one({'_type': 'game', 'guid': guid}, projection={'name': 1, 'id': 1})
+    async def get_preferred_name(self, guid: str) -> Optional[str]:
+        game = await self.db.find_one({'_type': 'game', 'guid': guid}, projection={'name': 1, 'id': 1})
         if not game:
             return None
 
-        releases_cursor = self.db.find({'_type': 'release', 'game.id': game['id']}, projection={'name': 1})
-        release_names = [release['name'] for release in list(releases_cursor)] if releases_cursor else []
+        releases = await self.db.find({'_type': 'release', 'game.id': game['id']}, projection={'name': 1})
+        release_names = [release['name'] for release in releases]
 
         if not release_names:
             return game['name']
@@ -322,7 +324,7 @@ class Games(commands.Cog, name='Games'):
         return f'{calendar.month_abbr[month]}. {day}, {year}' if string else datetime(year, month, day)
 
     async def get_image(self, guid: str, type: str, as_url: bool = False) -> Union[str, None]:
-        game = self.db.find_one({'_type': 'game', 'guid': guid}, projection={'image': 1})
+        game = await self.db.find_one({'_type': 'game', 'guid': guid}, projection={'image': 1})
 
         if not game or 'image' not in game or type not in game['image']:
             return None
@@ -347,7 +349,7 @@ class Games(commands.Cog, name='Games'):
         if type not in ['game', 'release']:
             raise ValueError(f'invalid type: {type}')
 
-        db_item = self.db.find_one({'_type': type, 'guid': guid}, projection={'_developers': 1, '_publishers': 1})
+        db_item = await self.db.find_one({'_type': type, 'guid': guid}, projection={'_developers': 1, '_publishers': 1})
 
         if not db_item:
             return None, None
@@ -359,7 +361,7 @@ class Games(commands.Cog, name='Games'):
         developers = item_details['developers'] if 'developers' in item_details else []
         publishers = item_details['publishers'] if 'publishers' in item_details else []
 
-        self.db.update_one(
+        await self.db.update_one(
             {'_type': type, 'guid': guid}, {'$set': {'_developers': developers, '_publishers': publishers}}
         )
 
@@ -392,7 +394,7 @@ class Games(commands.Cog, name='Games'):
     async def _games_search(self, interaction: discord.Interaction, query: str):
         '''Search for Nintendo Switch games'''
         await interaction.response.defer()
-        user_guid = self.db.find_one({'guid': query.strip()})
+        user_guid = await self.db.find_one({'guid': query.strip()})
         game = None
 
         if user_guid:
@@ -403,10 +405,10 @@ class Games(commands.Cog, name='Games'):
             result = self.search(query)
 
         if not user_guid and result and result['guid']:
-            game = self.db.find_one({'_type': 'game', 'guid': result['guid']})
+            game = await self.db.find_one({'_type': 'game', 'guid': result['guid']})
 
         if game:
-            name = self.get_preferred_name(result['guid'])
+            name = await self.get_preferred_name(result['guid'])
 
             embed = discord.Embed(
                 title=name,
@@ -456,9 +458,9 @@ class Games(commands.Cog, name='Games'):
             embed.add_field(name=f'General Game Details', value=game_desc, inline=False)
 
             # Build info about switch releases
-            release_count = self.db.count({'_type': 'release', 'game.id': game['id']})
+            releases = await self.db.find({'_type': 'release', 'game.id': game['id']})
+            release_count = len(releases)
             if release_count:
-                releases = self.db.find({'_type': 'release', 'game.id': game['id']})
 
                 dates = {'oldest': None, 'newest': None}
                 ratelimited = False
@@ -550,8 +552,8 @@ class Games(commands.Cog, name='Games'):
             ),
         )
 
-        game_count = self.db.find({'_type': 'game'}).count()
-        release_count = self.db.find({'_type': 'release'}).count()
+        game_count = await self.db.count_documents({'_type': 'game'})
+        release_count = await self.db.count_documents({'_type': 'release'})
         embed.add_field(name='Games Stored', value=game_count, inline=True)
         embed.add_field(name='Releases Stored', value=release_count, inline=True)
 
@@ -4,7 +4,6 @@ import logging
 import time
 import typing
 from datetime import datetime, timedelta, timezone
-from itertools import batched
 
 import config
 import discord
@@ -13,63 +12,221 @@ from discord import app_commands
 from discord.ext import commands, tasks
 
 import tools
+from database import amclient
 
 
-mclient = pymongo.MongoClient(config.mongoURI)
+class ModlogOutbox:
+    '''
+    Pending public modlog posts, persisted in bowser.modlogOutbox with the time they are due so they survive restarts.
+    tools.send_modlog queues them and this worker posts whatever is due, at most `concurrency` at a time. A failed post
+    is retried with exponential backoff starting at `backoff` seconds, and dropped after `retries` attempts. Public
+    puns that were never posted, such as ones pending in memory before the outbox existed, are queued when it starts.
+    '''
+
+    def __init__(self, bot, concurrency=4, retries=5, backoff=30, batch_size=20, lease=300, max_sleep=60):
+        self.bot = bot
+        self.db = amclient.bowser.modlogOutbox
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.lease = lease  # Claimed posts become due again after this long, in case we stop mid-post
+        self.max_sleep = max_sleep
+        self.wakeup = asyncio.Event()
+        self.sleepingUntil = None
+        self.task = None
+
+        # Counters
+        self.posted = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def start(self):
+        await self.db.create_index([('due', 1)])
+        await self._queue_unposted()
+        if not self.task or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def _queue_unposted(self):
+        pending = await amclient.bowser.puns.find(
+            {'public': True, 'public_log_message': None, 'type': {'$ne': 'note'}}, projection={'_id': 1}
+        )
+        if not pending:
+            return
+
+        # Entries already queued keep their due time and attempts
+        now = time.time()
+        await self.db.bulk_write(
+            [
+                pymongo.UpdateOne({'_id': x['_id']}, {'$setOnInsert': {'due': now, 'attempts': 0}}, upsert=True)
+                for x in pending
+            ],
+            ordered=False,
+        )
+        logging.info(f'[Moderation] Queued {len(pending)} unposted public modlogs')
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def wake(self, due):
+        if self.sleepingUntil is None or due < self.sleepingUntil:
+            self.wakeup.set()
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            now = time.time()
+            due = await self.db.find({'due': {'$lte': now}}, sort=[('due', 1)], limit=self.batch_size)
+            if due:
+                await self.db.update_many(
+                    {'_id': {'$in': [x['_id'] for x in due]}}, {'$set': {'due': now + self.lease}}
+                )
+                await asyncio.gather(*[self._post(x) for x in due])
+                continue
+
+            upcoming = await self.db.find_one({}, sort=[('due', 1)], projection={'due': 1})
+            delay = self.max_sleep if not upcoming else min(max(upcoming['due'] - time.time(), 0), self.max_sleep)
+            self.sleepingUntil = time.time() + delay
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+
+            except asyncio.TimeoutError:
+                pass
+
+            finally:
+                self.sleepingUntil = None
+
+    async def _post(self, entry):
+        async with self.semaphore:
+            try:
+                await tools.send_public_modlog(self.bot, entry['_id'], self.bot.get_channel(config.publicModChannel))
+
+            except Exception as e:
+                attempts = entry.get('attempts', 0) + 1
+                if attempts >= self.retries:
+                    self.failed += 1
+                    logging.error(
+                        f'[Moderation] Giving up on public modlog for {entry["_id"]} after {attempts} tries: {e}'
+                    )
+                    await self.db.delete_one({'_id': entry['_id']})
+
+                else:
+                    self.retried += 1
+                    retry = time.time() + self.backoff * 2 ** (attempts - 1)
+                    await self.db.update_one(
+                        {'_id': entry['_id']}, {'$set': {'due': retry, 'attempts': attempts, 'error': str(e)}}
+                    )
+
+                return
+
+            self.posted += 1
+            await self.db.delete_one({'_id': entry['_id']})
 
 
 class Moderation(commands.Cog, name='Moderation Commands'):
+    BAN_CONCURRENCY = 10  # Users resolved, timed out and DMed at once during a mass ban
+
     def __init__(self, bot):
         self.bot = bot
         self.serverLogs = self.bot.get_channel(config.logChannel)
         self.modLogs = self.bot.get_channel(config.modChannel)
         self.publicModLogs = self.bot.get_channel(config.publicModChannel)
-        self.taskHandles = {}
         self.NS = self.bot.get_guild(config.nintendoswitch)
 
-        loop = self.bot.loop
-        loop.create_task(self._initialize_infractions())
+        # Infraction expiry. Due puns carry a next_due timestamp and one loop sleeps until the earliest of them
+        self.scheduler = None
+        self.wakeup = asyncio.Event()
+        self.sleepingUntil = None
+
+        self.outbox = ModlogOutbox(self.bot)
+
+    async def cog_load(self):
+        await amclient.bowser.puns.create_index([('next_due', 1)], sparse=True)
+        await self._backfill_schedule()
+        self.scheduler = asyncio.create_task(self._run_scheduler())
+        await self.outbox.start()
+
+        # Strikes are decayed in batches from the cached user totals, which are rebuilt from puns on startup
+        await amclient.bowser.puns.create_index([('user', 1), ('type', 1)])
+        await amclient.bowser.users.create_index(
+            [('strike_check', 1)], partialFilterExpression={'active_strikes': {'$gt': 0}}
+        )
+        await amclient.bowser.puns.update_many(
+            {'type': 'strike', 'next_due': {'$exists': True}}, {'$unset': {'next_due': ''}}
+        )
+        await tools.refresh_strike_state()
+        self.strike_decay.start()
 
     async def cog_unload(self):
-        for task in self.taskHandles.values():
-            task.cancel()
-
-    async def _initialize_infractions(self):
-        # Publish all unposted/pending public modlogs on cog load
-        db = mclient.bowser.puns
-        pendingLogs = db.find({'public': True, 'public_log_message': None, 'type': {'$ne': 'note'}})
-        for log in pendingLogs:
-            await tools.send_public_modlog(self.bot, log['_id'], self.publicModLogs)
-
-        # Run expiration tasks
-        userDB = mclient.bowser.users
-        pendingPuns = db.find({'active': True, 'type': {'$in': ['strike', 'mute']}})
-        twelveHr = 60 * 60 * 12
-        trackedStrikes = []  # List of unique users
-        logging.info('[Moderation] Starting infraction expiration checks')
-        for pun in pendingPuns:
-            await asyncio.sleep(0.5)
-            if pun['type'] == 'strike':
-                if pun['user'] in trackedStrikes:
-                    continue  # We don't want to create many tasks when we only remove one
-                user = userDB.find_one({'_id': pun['user']})
-                trackedStrikes.append(pun['user'])
-                if user['strike_check'] > time.time():  # In the future
-                    tryTime = (
-                        twelveHr
-                        if user['strike_check'] - time.time() > twelveHr
-                        else user['strike_check'] - time.time()
-                    )
-                    self.schedule_task(tryTime, pun['_id'], config.nintendoswitch)
+        if self.scheduler:
+            self.scheduler.cancel()
+
+        self.strike_decay.cancel()
+        self.outbox.close()
+
+    @tasks.loop(minutes=15)
+    async def strike_decay(self):
+        users, strikes = await tools.decay_strikes()
+        if users:
+            logging.info(f'[Moderation] Decayed {strikes} strikes across {users} users')
+
+    async def _backfill_schedule(self):
+        '''
+        Give next_due to active mutes that were issued before the scheduler existed. Once every active mute is
+        scheduled this matches nothing, so restarts only cost this query
+        '''
+        db = amclient.bowser.puns
+        mutes = await db.update_many(
+            {'type': 'mute', 'active': True, 'expiry': {'$ne': None}, 'next_due': {'$exists': False}},
+            [{'$set': {'next_due': '$expiry'}}],
+        )
 
-                else:  # In the past
-                    self.schedule_task(0, pun['_id'], config.nintendoswitch)
+        if mutes.modified_count:
+            logging.info(f'[Moderation] Scheduled expiry for {mutes.modified_count} mutes')
+
+    async def schedule(self, _id: str, due: float):
+        '''Run expire_actions for a pun once `due` (a unix timestamp) has passed'''
+        await amclient.bowser.puns.update_one({'_id': _id}, {'$set': {'next_due': due}})
+        if self.sleepingUntil is None or due < self.sleepingUntil:
+            self.wakeup.set()
+
+    async def _run_scheduler(self, batch_size=100, max_sleep=60 * 60):
+        db = amclient.bowser.puns
+        while True:
+            self.wakeup.clear()
+            now = time.time()
+            due = await db.find(
+                {'next_due': {'$lte': now}}, sort=[('next_due', 1)], limit=batch_size, projection={'_id': 1}
+            )
+            if due:
+                # Claim the batch first, expire_actions sets a new next_due if the pun needs to run again
+                await db.update_many({'_id': {'$in': [x['_id'] for x in due]}}, {'$unset': {'next_due': ''}})
+                for doc in due:
+                    try:
+                        await self.expire_actions(doc['_id'], config.nintendoswitch)
 
-            elif pun['type'] == 'mute':
-                tryTime = twelveHr if pun['expiry'] - time.time() > twelveHr else pun['expiry'] - time.time()
-                self.schedule_task(tryTime, pun['_id'], config.nintendoswitch)
+                    except Exception:
+                        logging.exception(f'[Moderation] Expiry failed for pun {doc["_id"]}')
 
-        logging.info('[Moderation] Infraction expiration checks completed')
+                if len(due) == batch_size:
+                    continue  # There may be more already due
+
+            upcoming = await db.find_one(
+                {'next_due': {'$ne': None}}, sort=[('next_due', 1)], projection={'next_due': 1}
+            )
+            # Capped so a changed system clock can only delay expiry by max_sleep
+            delay = max_sleep if not upcoming else min(max(upcoming['next_due'] - time.time(), 0), max_sleep)
+            self.sleepingUntil = time.time() + delay
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+
+            except asyncio.TimeoutError:
+                pass
+
+            finally:
+                self.sleepingUntil = None
 
     @app_commands.guilds(discord.Object(id=config.nintendoswitch))
     @app_commands.default_permissions(view_audit_log=True)
@@ -83,8 +240,8 @@ class Moderation(commands.Cog, name='Moderation Commands'):
     @app_commands.describe(uuid='The infraction UUID, found in the footer of the mod log message embeds')
     @commands.max_concurrency(1, commands.BucketType.guild, wait=True)
     async def _hide_modlog(self, interaction: discord.Interaction, uuid: str):
-        db = mclient.bowser.puns
-        doc = db.find_one({'_id': uuid})
+        db = amclient.bowser.puns
+        doc = await db.find_one({'_id': uuid})
 
         await interaction.response.defer(ephemeral=tools.mod_cmd_invoke_delete(interaction.channel))
         if not doc:
@@ -94,7 +251,7 @@ class Moderation(commands.Cog, name='Moderation Commands'):
 
         if not doc['public_log_message']:
             # Public log has not been posted yet
-            db.update_one({'_id': uuid}, {'$set': {'sensitive': sensitive}})
+            await db.update_one({'_id': uuid}, {'$set': {'sensitive': sensitive}})
             return await interaction.followup.send(
                 f'{config.greenTick} Successfully {"" if sensitive else "un"}marked modlog as sensitive',
             )
@@ -137,7 +294,7 @@ class Moderation(commands.Cog, name='Moderation Commands'):
             assert (
                 embedDict['fields'] != newEmbedDict['fields']
             )  # Will fail if message was unchanged, this is likely because of a breaking change upstream in the pun flow
-            db.update_one({'_id': uuid}, {'$set': {'sensitive': sensitive}})
+            await db.update_one({'_id': uuid}, {'$set': {'sensitive': sensitive}})
             newEmbed = discord.Embed.from_dict(newEmbedDict)
             await message.edit(embed=newEmbed)
 
@@ -173,8 +330,8 @@ class Moderation(commands.Cog, name='Moderation Commands'):
         reason: app_commands.Range[str, None, 990],
         duration: str = None,
     ):
-        db = mclient.bowser.puns
-        doc = db.find_one({'_id': uuid})
+        db = amclient.bowser.puns
+        doc = await db.find_one({'_id': uuid})
         if not doc:
             return await interaction.followup.send(f'{config.redTick} An invalid infraction id was provided')
 
@@ -215,14 +372,12 @@ class Moderation(commands.Cog, name='Moderation Commands'):
                     f'{config.redTick} Cannot set the new duration to be less than one minute'
                 )
 
-            twelveHr = 60 * 60 * 12
-            tryTime = twelveHr if stamp - time.time() > twelveHr else stamp - time.time()
-            self.schedule_task(tryTime, uuid, config.nintendoswitch)
+            await self.schedule(uuid, int(stamp))
 
             if member:
                 await member.edit(timed_out_until=_duration, reason='Mute duration modified by moderator')
 
-            db.update_one({'_id': uuid}, {'$set': {'expiry': int(stamp)}})
+            await db.update_one({'_id': uuid}, {'$set': {'expiry': int(stamp)}})
             await tools.send_modlog(
                 self.bot,
                 self.modLogs,
@@ -236,7 +391,7 @@ class Moderation(commands.Cog, name='Moderation Commands'):
             )
 
         else:
-            db.update_one({'_id': uuid}, {'$set': {'reason': reason}})
+            await db.update_one({'_id': uuid}, {'$set': {'reason': reason}})
             await tools.send_modlog(
                 self.bot,
                 self.modLogs,
@@ -309,11 +464,15 @@ class Moderation(commands.Cog, name='Moderation Commands'):
     @app_commands.describe(uuid='The infraction UUID, found in the footer of the mod log message embeds')
     async def _inf_revoke(self, interaction: discord.Interaction, uuid: str):
         await interaction.response.defer(ephemeral=tools.mod_cmd_invoke_delete(interaction.channel))
-        db = mclient.bowser.puns
-        doc = db.find_one_and_delete({'_id': uuid})
+        db = amclient.bowser.puns
+        doc = await db.find_one_and_delete({'_id': uuid})
         if not doc:  # Delete did nothing if doc is None
             return await interaction.followup.send(f'{config.redTick} No matching infraction found')
 
+        await tools.record_pun_rollup(doc['type'], doc['timestamp'], -1)
+        if doc['type'] == 'strike' and doc['active']:
+            await tools.refresh_strike_state(doc['user'])
+
         await interaction.followup.send(
             f'{config.greenTick} removed {uuid}: {doc["type"]} against {doc["user"]} by {doc["moderator"]}'
         )
@@ -334,123 +493,149 @@ class Moderation(commands.Cog, name='Moderation Commands'):
         reason: app_commands.Range[str, None, 990],
     ):
         await interaction.response.defer(ephemeral=tools.mod_cmd_invoke_delete(interaction.channel))
-        banList = []
-        failedBans = []
-        failedDMs = []
-
         users = list(set(users.split()))  # Remove dupes
-        multiban = len(users) > 1
-        for u in users:
-            try:
-                ban_id = int(u)
+        if not users:
+            return await interaction.followup.send(f'{config.redTick} An invalid user was provided')
 
-            except ValueError:
-                if multiban:
-                    failedBans.append(u)
+        if len(users) > 1:
+            return await self._mass_ban(interaction, users, reason)
 
-                else:
-                    return await interaction.followup.send(
-                        f'{config.redTick} The user provided is invalid: `{u}`. Make sure you are providing a user id'
-                    )
+        try:
+            ban_id = int(users[0])
 
-            user = interaction.client.get_user(ban_id)
-            if not user:
-                try:
-                    user = await self.bot.fetch_user(ban_id)
-                    username = None
+        except ValueError:
+            return await interaction.followup.send(
+                f'{config.redTick} The user provided is invalid: `{users[0]}`. Make sure you are providing a user id'
+            )
 
-                except discord.NotFound:
-                    if multiban:
-                        failedBans.append(u)
+        user = interaction.client.get_user(ban_id)
+        if not user:
+            try:
+                user = await self.bot.fetch_user(ban_id)
 
-                    else:
-                        return await interaction.followup.send(
-                            f'{config.redTick} The user provided is invalid: `{ban_id}`. Make sure you are providing user ids'
-                        )
+            except discord.NotFound:
+                return await interaction.followup.send(
+                    f'{config.redTick} The user provided is invalid: `{ban_id}`. Make sure you are providing user ids'
+                )
 
-            username = user.name
-            userStr = f'{username} ({ban_id})'
-            member = interaction.guild.get_member(ban_id)
+        userStr = f'{user.name} ({ban_id})'
+        member = interaction.guild.get_member(ban_id)
+        if not self._can_ban(interaction, member):
+            return await interaction.followup.send(f'{config.redTick} Insufficent permissions to ban {userStr}')
 
-            if member:
-                usr_role_pos = member.top_role.position
+        try:
+            await interaction.guild.fetch_ban(user)
 
+            # If we are here, the user is already banned
+            if interaction.user.id == self.bot.user.id:  # Non-command invoke, such as automod
+                # We could do custom exception types, but the whole "automod context" is already a hack anyway.
+                raise ValueError
             else:
-                usr_role_pos = -1
+                return await interaction.followup.send(f'{config.redTick} {userStr} is already banned')
 
-            if (usr_role_pos >= interaction.guild.me.top_role.position) or (
-                usr_role_pos >= interaction.user.top_role.position
-            ):
-                return await interaction.followup.send(f'{config.redTick} Insufficent permissions to ban {userStr}')
+        except discord.NotFound:
+            pass
 
-            if not multiban:
-                try:
-                    await interaction.guild.fetch_ban(user)
+        failedDM = False
+        if member:
+            # Don't waste an API call with a DM if we don't have the user as a guild member
+            try:
+                await member.send(
+                    tools.format_pundm('ban', reason, interaction.user, auto=interaction.user.id == self.bot.user.id)
+                )
 
-                    # If we are here, the user is already banned
-                    if interaction.user.id == self.bot.user.id:  # Non-command invoke, such as automod
-                        # We could do custom exception types, but the whole "automod context" is already a hack anyway.
-                        raise ValueError
-                    else:
-                        return await interaction.followup.send(f'{config.redTick} {userStr} is already banned')
+            except (discord.Forbidden, AttributeError):
+                failedDM = True
 
-                except discord.NotFound:
-                    pass
+        try:
+            await interaction.guild.ban(user, reason='Ban action performed by moderator', delete_message_days=3)
 
-            if member:
-                # Don't waste an API call with a DM if we don't have the user as a guild member
-                try:
-                    await member.send(
-                        tools.format_pundm(
-                            'ban', reason, interaction.user, auto=interaction.user.id == self.bot.user.id
-                        )
-                    )
+        except discord.NotFound:
+            # User does not exist
+            return await interaction.followup.send(f'{config.redTick} User {userStr} does not exist')
 
-                except (discord.Forbidden, AttributeError):
-                    failedDMs.append(user)
-                    pass
+        resp = f'{config.greenTick} {userStr} has been successfully banned'
+        if failedDM:
+            resp += '. I was not able to DM them about this action'
 
-            if not multiban:
-                try:
-                    await interaction.guild.ban(
-                        user, reason=f'Ban action performed by moderator', delete_message_days=3
-                    )
+        docID = await tools.issue_pun(ban_id, interaction.user.id, 'ban', reason=reason)
+        await tools.send_modlog(
+            self.bot,
+            self.modLogs,
+            'ban',
+            docID,
+            reason,
+            username=user.name,
+            userid=ban_id,
+            moderator=interaction.user,
+            public=True,
+        )
+        return await interaction.followup.send(resp)
+
+    def _can_ban(self, interaction: discord.Interaction, member: typing.Optional[discord.Member]):
+        if not member:
+            return True
+
+        position = member.top_role.position
+        return position < interaction.guild.me.top_role.position and position < interaction.user.top_role.position
+
+    async def _mass_ban(self, interaction: discord.Interaction, users: typing.List[str], reason: str):
+        '''
+        Ban a list of user IDs. Users are resolved, timed out and DMed concurrently, and each batch of 200 is handed to
+        bulk_ban as soon as it is ready while the rest are still being prepared. The puns are written with one insert
+        and logged as one modlog, even if the command fails partway through
+        '''
+        auto = interaction.user.id == self.bot.user.id
+        failedBans = []
+        failedDMs = []
+        timedOut = []
+        guard = asyncio.Semaphore(self.BAN_CONCURRENCY)
 
-                except discord.NotFound:
-                    # User does not exist
-                    return await interaction.followup.send(f'{config.redTick} User {userStr} does not exist')
+        async def prepare(u):
+            try:
+                ban_id = int(u)
 
-                resp = f'{config.greenTick} {userStr} has been successfully banned'
-                if failedDMs:
-                    resp += '. I was not able to DM them about this action'
+            except ValueError:
+                failedBans.append(u)
+                return None
 
-                docID = await tools.issue_pun(ban_id, interaction.user.id, 'ban', reason=reason)
-                await tools.send_modlog(
-                    self.bot,
-                    self.modLogs,
-                    'ban',
-                    docID,
-                    reason,
-                    username=username,
-                    userid=ban_id,
-                    moderator=interaction.user,
-                    public=True,
-                )
-                return await interaction.followup.send(resp)
+            async with guard:
+                user = self.bot.get_user(ban_id)
+                if not user:
+                    try:
+                        user = await self.bot.fetch_user(ban_id)
 
-            try:
-                # Temp timeout to prevent message sends until bulk_ban fires
-                await user.edit(timed_out_until=datetime.now() + timedelta(minutes=10))
+                    except discord.HTTPException:
+                        failedBans.append(u)
+                        return None
 
-            except:
-                pass
+                member = interaction.guild.get_member(ban_id)
+                if not self._can_ban(interaction, member):
+                    failedBans.append(u)
+                    return None
 
-            banList.append(user)
+                if member:
+                    try:
+                        # Temp timeout to prevent message sends until bulk_ban fires
+                        await member.edit(timed_out_until=discord.utils.utcnow() + timedelta(minutes=10))
+                        timedOut.append(member)
+
+                    except discord.HTTPException:
+                        pass
+
+                    # Don't waste an API call with a DM if we don't have the user as a guild member
+                    try:
+                        await member.send(tools.format_pundm('ban', reason, interaction.user, auto=auto))
+
+                    except discord.HTTPException:
+                        failedDMs.append(u)
+
+                return user
 
         successes = []
         failures = []
-        for batch in list(batched(banList, 200)):
-            # Discord.py / Discord restricts us to 200 bans per bulk ban
+
+        async def ban(batch):
             try:
                 s, f = await interaction.guild.bulk_ban(batch, reason='Ban action performed by moderator')
 
@@ -458,31 +643,66 @@ class Moderation(commands.Cog, name='Moderation Commands'):
                 if e.status == 400:
                     # This can happen in such cases as a moderator bans a list of users that are ALL already banned
                     logging.error(f'[Moderation] bulk_ban failed with http 400. User set: {batch}')
-                    failures += batch
-                    continue
 
                 else:
-                    raise
+                    logging.error(f'[Moderation] bulk_ban failed for {len(batch)} users: {e}')
 
-            successes += s
-            failures += f
+                failures.extend(batch)
+                return
 
-        successIDs = [s.id for s in successes]
-        for user in [u for u in banList if u.id in successIDs]:
-            docID = await tools.issue_pun(ban_id, interaction.user.id, 'ban', reason=reason)
-            await tools.send_modlog(
-                self.bot,
-                self.modLogs,
-                'ban',
-                docID,
-                reason,
-                username=username,
-                userid=ban_id,
-                moderator=interaction.user,
-                public=True,
-            )
+            successes.extend(s)
+            failures.extend(f)
 
-        if interaction.user.id != self.bot.user.id and len(banList) > 1:  # Command invoke, i.e. anything not automod
+        banList = []
+        batch = []
+        tasks = [asyncio.create_task(prepare(u)) for u in users]
+        try:
+            for prepared in asyncio.as_completed(tasks):
+                user = await prepared
+                if not user:
+                    continue
+
+                banList.append(user)
+                batch.append(user)
+                if len(batch) == 200:  # Discord.py / Discord restricts us to 200 bans per bulk ban
+                    await ban(batch)
+                    batch = []
+
+            if batch:
+                await ban(batch)
+
+        finally:
+            # Whatever was banned before a failure still gets its puns and modlog
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+            successIDs = {s.id for s in successes}
+            banned = [u for u in banList if u.id in successIDs]
+            if banned:
+                docIDs = await tools.issue_puns([u.id for u in banned], interaction.user.id, 'ban', reason=reason)
+                await tools.send_bulk_modlog(
+                    self.bot,
+                    self.modLogs,
+                    'ban',
+                    list(zip(banned, docIDs)),
+                    reason,
+                    moderator=interaction.user,
+                    public=True,
+                )
+
+            # Members timed out ahead of a ban that never happened are untimed out
+            for member in timedOut:
+                if member.id in successIDs:
+                    continue
+
+                try:
+                    await member.edit(timed_out_until=None)
+
+                except discord.HTTPException:
+                    pass
+
+        if not auto:  # Command invoke, i.e. anything not automod
             failedBans += [str(f.id) for f in failures]
             if successes:
                 resp = f'{config.greenTick} **{len(successes)}** users have been successfully banned'
@@ -494,21 +714,11 @@ class Moderation(commands.Cog, name='Moderation Commands'):
                 resp += f'\nFailed to DM an infraction message to the following **{len(failedDMs)}** member(s):\n'
                 resp += f'```{" ".join(failedDMs)}```'
 
-            if failures:
-                resp += f'\nFailed to ban **{len(failures)}** from the provided list:\n```{" ".join(failedBans)}```'
+            if failedBans:
+                resp += f'\nFailed to ban **{len(failedBans)}** from the provided list:\n```{" ".join(failedBans)}```'
 
             await interaction.followup.send(resp)
 
-        # Edge case cleanup to ensure failed bans for users in server are untimed out
-        for f in failures:
-            m = interaction.guild.get_member(f.id)
-            try:
-                if m:
-                    await m.edit(timed_out_until=None)
-
-            except:
-                pass
-
     @app_commands.command(name='unban', description='Unban a specified user from the server')
     @app_commands.describe(user='The user id to unban', reason='The reason for unbanning the user')
     @app_commands.guilds(discord.Object(id=config.nintendoswitch))
@@ -523,20 +733,20 @@ class Moderation(commands.Cog, name='Moderation Commands'):
     ):
         await interaction.response.defer(ephemeral=tools.mod_cmd_invoke_delete(interaction.channel))
 
-        db = mclient.bowser.puns
+        db = amclient.bowser.puns
         try:
             await interaction.guild.fetch_ban(user)
 
         except discord.NotFound:
             return await interaction.followup.send(f'{config.redTick} {user} is not currently banned')
 
-        openAppeal = mclient.modmail.logs.find_one({'open': True, 'ban_appeal': True, 'recipient.id': user.id})
+        openAppeal = await amclient.modmail.logs.find_one({'open': True, 'ban_appeal': True, 'recipient.id': user.id})
         if openAppeal:
             return await interaction.followup.send(
                 f'{config.redTick} You cannot use the unban command on {user} while a ban appeal is in-progress. You can accept the appeal in <#{int(openAppeal["channel_id"])}> with `/appeal accept [reason]`',
             )
 
-        db.find_one_and_update({'user': user.id, 'type': 'ban', 'active': True}, {'$set': {'active': False}})
+        await db.find_one_and_update({'user': user.id, 'type': 'ban', 'active': True}, {'$set': {'active': False}})
         docID = await tools.issue_pun(user.id, interaction.user.id, 'unban', reason, active=False)
         await interaction.guild.unban(user, reason='Unban action performed by moderator')
         await tools.send_modlog(
@@ -668,8 +878,8 @@ class Moderation(commands.Cog, name='Moderation Commands'):
     ):
         await interaction.response.defer(ephemeral=tools.mod_cmd_invoke_delete(interaction.channel))
 
-        db = mclient.bowser.puns
-        if db.find_one({'user': member.id, 'type': 'mute', 'active': True}):
+        db = amclient.bowser.puns
+        if await db.find_one({'user': member.id, 'type': 'mute', 'active': True}):
             return await interaction.followup.send(f'{config.redTick} {member} ({member.id}) is already muted')
 
         try:
@@ -730,10 +940,7 @@ class Moderation(commands.Cog, name='Moderation Commands'):
             public=True,
         )
 
-        twelveHr = 60 * 60 * 12
-        expireTime = time.mktime(_duration.timetuple())
-        tryTime = twelveHr if expireTime - time.time() > twelveHr else expireTime - time.time()
-        self.schedule_task(tryTime, docID, interaction.guild.id)
+        await self.schedule(docID, int(_duration.timestamp()))
 
     @app_commands.command(name='unmute', description='Unmute a user who is currently timed out')
     @app_commands.describe(member='The user you wish to unmute', reason='The reason for removing the mute. Optional')
@@ -749,8 +956,8 @@ class Moderation(commands.Cog, name='Moderation Commands'):
     ):  # TODO: Allow IDs to be unmuted (in the case of not being in the guild)
         await interaction.response.defer(ephemeral=tools.mod_cmd_invoke_delete(interaction.channel))
 
-        db = mclient.bowser.puns
-        action = db.find_one_and_update(
+        db = amclient.bowser.puns
+        action = await db.find_one_and_update(
             {'user': member.id, 'type': 'mute', 'active': True}, {'$set': {'active': False}}
         )
         if not action:
@@ -844,17 +1051,14 @@ class Moderation(commands.Cog, name='Moderation Commands'):
                 f'{config.redTick} The strike mode must be either \'add\' or \'set\''
             )
 
-        punDB = mclient.bowser.puns
-        userDB = mclient.bowser.users
-        userDoc = userDB.find_one({'_id': user.id})
+        userDB = amclient.bowser.users
+        userDoc = await userDB.find_one({'_id': user.id})
         if not userDoc:
             return await interaction.followup.send(
                 f'{config.redTick} Unable strike user who has never joined the server'
             )
 
-        activeStrikes = 0
-        for pun in punDB.find({'user': user.id, 'type': 'strike', 'active': True}):
-            activeStrikes += pun['active_strike_count']
+        activeStrikes = userDoc.get('active_strikes', 0)
 
         error = ""
         public_notify = False
@@ -874,40 +1078,7 @@ class Moderation(commands.Cog, name='Moderation Commands'):
             elif count < activeStrikes:
                 # Mod is setting lower amount, we need to remove strikes
                 removedStrikes = activeStrikes - count
-                diff = removedStrikes  # accumlator
-
-                puns = punDB.find({'user': user.id, 'type': 'strike', 'active': True}).sort('timestamp', 1)
-                for pun in puns:
-                    if pun['active_strike_count'] - diff >= 0:
-                        punDB.update_one(
-                            {'_id': pun['_id']},
-                            {
-                                '$set': {
-                                    'active_strike_count': pun['active_strike_count'] - diff,
-                                    'active': pun['active_strike_count'] - diff > 0,
-                                }
-                            },
-                        )
-                        userDB.update_one(
-                            {'_id': user.id}, {'$set': {'strike_check': time.time() + (60 * 60 * 24 * 7)}}
-                        )
-                        self.schedule_task(60 * 60 * 12, pun['_id'], interaction.guild.id)
-
-                        # Logic to calculate the remaining (diff) strikes will simplify to 0
-                        # new_diff = diff - removed_strikes
-                        #          = diff - (old_strike_amount - new_strike_amount)
-                        #          = diff - (old_strike_amount - (old_strike_amount - diff))
-                        #          = diff - old_strike_amount + old_strike_amount - diff
-                        #          = 0
-                        diff = 0
-                        break
-
-                    elif pun['active_strike_count'] - diff < 0:
-                        punDB.update_one({'_id': pun['_id']}, {'$set': {'active_strike_count': 0, 'active': False}})
-                        diff -= pun['active_strike_count']
-
-                if diff != 0:  # Something has gone horribly wrong
-                    raise ValueError('Diff != 0 after full iteration')
+                await tools.remove_strikes(user.id, removedStrikes)
 
                 try:
                     await user.send(tools.format_pundm('destrike', reason, interaction.user, details=removedStrikes))
@@ -982,8 +1153,7 @@ class Moderation(commands.Cog, name='Moderation Commands'):
                 public=True,
             )
 
-            userDB.update_one({'_id': user.id}, {'$set': {'strike_check': time.time() + (60 * 60 * 24 * 7)}})  # 7 days
-            self.schedule_task(60 * 60 * 12, docID, interaction.guild.id)
+            await tools.add_strikes(user.id, count)
 
             await interaction.followup.send(
                 f'{config.greenTick} {user} ({user.id}) has been successfully struck, they now have '
@@ -1017,18 +1187,9 @@ class Moderation(commands.Cog, name='Moderation Commands'):
             )
             raise error
 
-    def schedule_task(self, tryTime: int, _id: str, guild_id: int):
-        if _id in self.taskHandles.keys():
-            self.taskHandles[_id].cancel()
-
-        self.taskHandles[_id] = self.bot.loop.call_later(
-            tryTime, asyncio.create_task, self.expire_actions(_id, guild_id)
-        )
-
     async def expire_actions(self, _id, guild):
-        await asyncio.sleep(0.5)
-        db = mclient.bowser.puns
-        doc = db.find_one({'_id': _id})
+        db = amclient.bowser.puns
+        doc = await db.find_one({'_id': _id})
         if not doc:
             logging.error(f'[Moderation] Expiry failed. Doc {_id} does not exist!')
             return
@@ -1038,59 +1199,10 @@ class Moderation(commands.Cog, name='Moderation Commands'):
             logging.debug(f'[Moderation] Expiry failed. Doc {_id} is not active but was scheduled to expire!')
             return
 
-        twelveHr = 60 * 60 * 12
-        if doc['type'] == 'strike':
-            userDB = mclient.bowser.users
-            user = userDB.find_one({'_id': doc['user']})
-            try:
-                if user['strike_check'] > time.time():
-                    # To prevent drift we recall every 12 hours. Schedule for 12hr or expiry time, whichever is sooner
-                    retryTime = (
-                        twelveHr
-                        if user['strike_check'] - time.time() > twelveHr
-                        else user['strike_check'] - time.time()
-                    )
-                    self.schedule_task(retryTime, _id, guild)
-                    return
-
-            except (
-                KeyError
-            ):  # This is a rare edge case, but if a pun is manually created the user may not have the flag yet. More a dev handler than not
-                logging.error(
-                    f'[Moderation] Expiry failed. Could not get strike_check from db.users resolving for pun {_id}, was it manually added?'
-                )
-
-            # Start logic
-            if doc['active_strike_count'] - 1 == 0:
-                db.update_one({'_id': doc['_id']}, {'$set': {'active': False}, '$inc': {'active_strike_count': -1}})
-                strikes = [
-                    x for x in db.find({'user': doc['user'], 'type': 'strike', 'active': True}).sort('timestamp', 1)
-                ]
-                if not strikes:  # Last active strike expired, no additional
-                    del self.taskHandles[_id]
-                    return
-
-                self.schedule_task(60 * 60 * 12, strikes[0]['_id'], guild)
-
-            elif doc['active_strike_count'] > 0:
-                db.update_one({'_id': doc['_id']}, {'$inc': {'active_strike_count': -1}})
-                self.schedule_task(60 * 60 * 12, doc['_id'], guild)
-
-            else:
-                logging.warning(
-                    f'[Moderation] Expiry failed. Doc {_id} had a negative active strike count and was skipped'
-                )
-                del self.taskHandles[_id]
-                return
-
-            userDB.update_one({'_id': doc['user']}, {'$set': {'strike_check': time.time() + 60 * 60 * 24 * 7}})
-
-        elif doc['type'] == 'mute' and doc['expiry']:  # A mute that has an expiry
-            # To prevent drift we recall every 12 hours. Schedule for 12hr or expiry time, whichever is sooner
-            # This could also fail if the expiry time is changed by a mod
+        if doc['type'] == 'mute' and doc['expiry']:  # A mute that has an expiry
+            # The expiry may have been changed by a mod since this was scheduled
             if doc['expiry'] > time.time():
-                retryTime = twelveHr if doc['expiry'] - time.time() > twelveHr else doc['expiry'] - time.time()
-                self.schedule_task(retryTime, _id, guild)
+                await self.schedule(_id, doc['expiry'])
                 return
 
             punGuild = self.bot.get_guild(guild)
@@ -1106,7 +1218,7 @@ class Moderation(commands.Cog, name='Moderation Commands'):
             except discord.Forbidden:  # User has DMs off
                 public_notify = True
 
-            newPun = db.find_one_and_update({'_id': doc['_id']}, {'$set': {'active': False}})
+            newPun = await db.find_one_and_update({'_id': doc['_id']}, {'$set': {'active': False}})
             docID = await tools.issue_pun(
                 doc['user'],
                 self.bot.user.id,
@@ -1124,7 +1236,6 @@ class Moderation(commands.Cog, name='Moderation Commands'):
 
             await member.edit(timed_out_until=None, reason='Automatic: Mute has expired')
 
-            del self.taskHandles[_id]
             await tools.send_modlog(
                 self.bot,
                 self.modLogs,
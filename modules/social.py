@@ -17,7 +17,6 @@ import discord
 import emoji_data
 import gridfs
 import numpy as np
-import pymongo
 import pytz
 import requests
 import token_bucket
@@ -28,9 +27,7 @@ from fuzzywuzzy import process
 from PIL import Image, ImageDraw, ImageFont
 
 import tools  # type: ignore
-
-
-mclient = pymongo.MongoClient(config.mongoURI)
+from database import amclient
 
 
 class SocialFeatures(commands.Cog, name='Social Commands'):
@@ -59,38 +56,6 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
             115840403458097161,  # FlapSnapple
         ]
 
-        # Profile generation - precaching
-        self.profileFonts = self._load_fonts(
-            {
-                'meta': ('Regular', 36),
-                'user': ('Regular', 48),
-                'subtext': ('Light', 48),
-                'medium': ('Light', 36),
-                'small': ('Light', 30),
-            }
-        )
-
-        with open("resources/profiles/themes.yml", 'r') as stream:
-            self.themes = yaml.safe_load(stream)
-
-        with open("resources/profiles/borders.yml", 'r') as stream:
-            self.borders = yaml.safe_load(stream)
-
-        with open("resources/profiles/backgrounds.yml", 'r') as stream:
-            self.backgrounds = yaml.safe_load(stream)
-
-            for bg_name in self.backgrounds.keys():
-                self.backgrounds[bg_name]["image"] = self._render_background_image_from_slug(bg_name)
-
-        for theme in self.themes.keys():
-            self.themes[theme]['pfpBackground'] = Image.open(
-                f'resources/profiles/layout/{theme}/pfp-background.png'
-            ).convert('RGBA')
-            self.themes[theme]['missingImage'] = (
-                Image.open(f'resources/profiles/layout/{theme}/missing-game.png').convert("RGBA").resize((45, 45))
-            )
-            self.themes[theme]['profileStatic'] = self._init_profile_static(theme)  # Do this last
-
         self.trophyImgCache = {}
         self.borderImgCache = {}
         self.flagImgCache = {}
@@ -159,18 +124,58 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
             ('trivia-gold-3', '<:triviagold3:1194031677715005490>'),
         ]
 
+        self.commonTimezones = []
+
+    async def cog_load(self):
+        # Profile generation - precaching. Rendering is CPU bound, so it runs off the event loop
+        await asyncio.to_thread(self._load_profile_assets)
+
         # Compile the most common timezones at runtime for autocomplete use
-        db = mclient.bowser.users
-        usersWithTimezones = db.find({'timezone': {'$ne': None}})
-        timezones = {}
-        for user in usersWithTimezones:
-            if user['timezone'] not in timezones.keys():
-                timezones[user['timezone']] = 1
+        timezones = await amclient.bowser.users.aggregate(
+            [
+                {'$match': {'timezone': {'$ne': None}}},
+                {'$group': {'_id': '$timezone', 'count': {'$sum': 1}}},
+                {'$sort': {'count': -1}},
+            ]
+        )
+        self.commonTimezones = [x['_id'] for x in timezones]
 
-            else:
-                timezones[user['timezone']] += 1
+        tools.chat_filter.register('friendcode', self.friendCodeRegex['chatFilter'])
+
+    async def cog_unload(self):
+        tools.chat_filter.unregister('friendcode')
+
+    def _load_profile_assets(self):
+        self.profileFonts = self._load_fonts(
+            {
+                'meta': ('Regular', 36),
+                'user': ('Regular', 48),
+                'subtext': ('Light', 48),
+                'medium': ('Light', 36),
+                'small': ('Light', 30),
+            }
+        )
+
+        with open("resources/profiles/themes.yml", 'r') as stream:
+            self.themes = yaml.safe_load(stream)
+
+        with open("resources/profiles/borders.yml", 'r') as stream:
+            self.borders = yaml.safe_load(stream)
 
-        self.commonTimezones = [x[0] for x in sorted(timezones.items(), key=lambda tz: tz[1], reverse=True)]
+        with open("resources/profiles/backgrounds.yml", 'r') as stream:
+            self.backgrounds = yaml.safe_load(stream)
+
+            for bg_name in self.backgrounds.keys():
+                self.backgrounds[bg_name]["image"] = self._render_background_image_from_slug(bg_name)
+
+        for theme in self.themes.keys():
+            self.themes[theme]['pfpBackground'] = Image.open(
+                f'resources/profiles/layout/{theme}/pfp-background.png'
+            ).convert('RGBA')
+            self.themes[theme]['missingImage'] = (
+                Image.open(f'resources/profiles/layout/{theme}/missing-game.png').convert("RGBA").resize((45, 45))
+            )
+            self.themes[theme]['profileStatic'] = self._init_profile_static(theme)  # Do this last
 
     @app_commands.guilds(discord.Object(id=config.nintendoswitch))
     class SocialCommand(app_commands.Group):
@@ -189,8 +194,8 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
         await self._profile_view(interaction, member)
 
     async def _profile_view(self, interaction: discord.Interaction, member: discord.Member):
-        db = mclient.bowser.users
-        dbUser = db.find_one({'_id': member.id})
+        db = amclient.bowser.users
+        dbUser = await db.find_one({'_id': member.id})
 
         # If profile not setup and running on self: force ephemeral and provide NUX
         if not dbUser['profileSetup'] and member == interaction.user:
@@ -413,8 +418,8 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
         return discord.File(io.BytesIO(bytesFile.getvalue()), filename='preview.png')
 
     async def _generate_profile_card_from_member(self, member: discord.Member) -> discord.File:
-        db = mclient.bowser.users
-        dbUser = db.find_one({'_id': member.id})
+        db = amclient.bowser.users
+        dbUser = await db.find_one({'_id': member.id})
 
         if 'default' in dbUser['backgrounds']:
             backgrounds = list(dbUser['backgrounds'])
@@ -422,12 +427,12 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
             backgrounds.insert(0, 'default-dark')
             backgrounds.insert(0, 'default-light')
 
-            db.update_one({'_id': member.id}, {'$set': {'backgrounds': backgrounds}})
+            await db.update_one({'_id': member.id}, {'$set': {'backgrounds': backgrounds}})
 
             if dbUser['background'] == 'default':
-                db.update_one({'_id': member.id}, {'$set': {'background': 'default-light'}})
+                await db.update_one({'_id': member.id}, {'$set': {'background': 'default-light'}})
 
-            dbUser = db.find_one({'_id': member.id})
+            dbUser = await db.find_one({'_id': member.id})
 
         ## Get avatar ##
         pfpBytes = io.BytesIO(await member.display_avatar.with_format('png').with_size(256).read())
@@ -441,7 +446,8 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
             setGames = list(dict.fromkeys(setGames))  # Remove duplicates from list, just in case
             setGames = setGames[0:5]  # Limit to 5 results, just in case
 
-            message_count = f'{mclient.bowser.messages.find({"author": member.id}).count():,}'
+            counter = await amclient.bowser.messageCounts.find_one({'_id': member.id})
+            message_count = f'{0 if not counter else counter["count"]:,}'
 
         ## Get join date ##
         joins = dbUser['joins']
@@ -602,7 +608,7 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
         setGames = profile['games']
         gameCount = 0
         if setGames:
-            gamesDb = mclient.bowser.games
+            gamesDb = amclient.bowser.games
 
             setGames = list(dict.fromkeys(setGames))  # Remove duplicates from list, just in case
             setGames = setGames[:5]  # Limit to 5 results, just in case
@@ -611,7 +617,7 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
                 if not self.Games:
                     continue
 
-                gameName = self.Games.get_preferred_name(game_guid)
+                gameName = await self.Games.get_preferred_name(game_guid)
 
                 if not gameName:
                     continue
@@ -650,8 +656,8 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
         return discord.File(io.BytesIO(bytesFile.getvalue()), filename='profile.png')
 
     async def modify_trivia_level(self, member: discord.Member, regress=False):
-        db = mclient.bowser.users
-        dbUser = db.find_one({'_id': member.id})
+        db = amclient.bowser.users
+        dbUser = await db.find_one({'_id': member.id})
         currentLevel = 0
 
         for t in dbUser['trophies']:
@@ -827,7 +833,7 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
     @app_commands.autocomplete(code=_profile_friendcode_autocomplete)
     async def _profile_friendcode(self, interaction: discord.Interaction, code: str):
         await interaction.response.defer(ephemeral=True)
-        db = mclient.bowser.users
+        db = amclient.bowser.users
 
         friendcode = re.search(self.friendCodeRegex['profile'], code)
         if friendcode:  # re match
@@ -837,20 +843,22 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
                     f'{config.redTick} The Nintendo Switch friend code you provided is invalid, please try again. The format of a friend code is `SW-0000-0000-0000`, with the zeros replaced with the numbers from your unique code'
                 )
 
-            db.update_one({'_id': interaction.user.id}, {'$set': {'friendcode': friendcode, 'profileSetup': True}})
+            await db.update_one(
+                {'_id': interaction.user.id}, {'$set': {'friendcode': friendcode, 'profileSetup': True}}
+            )
 
             msg = f'{config.greenTick} Your friend code has been successfully updated on your profile card! Here\'s how it looks:'
 
             # Duplicate friend code detection
-            duplicates = db.find({'_id': {'$ne': interaction.user.id}, 'friendcode': friendcode})
+            duplicates = await db.find({'_id': {'$ne': interaction.user.id}, 'friendcode': friendcode})
 
             if duplicates:
                 # Check if accounts with matching friend codes have infractions on file
-                punsDB = mclient.bowser.puns
+                punsDB = amclient.bowser.puns
                 hasPuns = False
                 otherUsers = []
                 for u in duplicates:
-                    if punsDB.count_documents({'user': u['_id']}):
+                    if await punsDB.count_documents({'user': u['_id']}):
                         hasPuns = True
 
                     if interaction.user.id != u['_id']:
@@ -879,7 +887,7 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
     @app_commands.describe(flag='The flag emoji you wish to set, from the emoji picker')
     async def _profile_flag(self, interaction: discord.Interaction, flag: str):
         await interaction.response.defer(ephemeral=True)
-        db = mclient.bowser.users
+        db = amclient.bowser.users
         flag = flag.strip()
 
         code_points = self.check_flag(flag)
@@ -896,7 +904,7 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
                 f'{config.redTick} You didn\'t provide a valid supported emoji that represents a flag -- make sure you are providing an emoji, not an abbreviation or text. Please try again; note you can only use emoji like a country\'s flag or extras such as the pirate and gay pride flags'
             )
 
-        db.update_one({'_id': interaction.user.id}, {'$set': {'regionFlag': pointStr, 'profileSetup': True}})
+        await db.update_one({'_id': interaction.user.id}, {'$set': {'regionFlag': pointStr, 'profileSetup': True}})
         await interaction.followup.send(
             f'{config.greenTick} Your flag has been successfully updated on your profile card! Here\'s how it looks:',
             file=await self._generate_profile_card_from_member(interaction.user),
@@ -919,10 +927,10 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
     async def _profile_timezone(self, interaction: discord.Interaction, timezone: str):
         await interaction.response.defer(ephemeral=True)
 
-        db = mclient.bowser.users
+        db = amclient.bowser.users
         for tz in pytz.all_timezones:
             if timezone.lower() == tz.lower():
-                db.update_one({'_id': interaction.user.id}, {'$set': {'timezone': tz, 'profileSetup': True}})
+                await db.update_one({'_id': interaction.user.id}, {'$set': {'timezone': tz, 'profileSetup': True}})
                 return await interaction.followup.send(
                     f'{config.greenTick} Your timezone has been successfully updated on your profile card! Here\'s how it looks:',
                     file=await self._generate_profile_card_from_member(interaction.user),
@@ -961,16 +969,16 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
     ):
         await interaction.response.defer(ephemeral=True)
 
-        db = mclient.bowser.games
+        db = amclient.bowser.games
 
         # If user selected an auto-complete result, we will be provided the guid automatically which saves effort
         flagConfirmation = False
         gameList = []
-        guid1 = db.find_one({'guid': game1})
-        guid2 = None if not game2 else db.find_one({'guid': game2})
-        guid3 = None if not game3 else db.find_one({'guid': game3})
-        guid4 = None if not game4 else db.find_one({'guid': game4})
-        guid5 = None if not game5 else db.find_one({'guid': game5})
+        guid1 = await db.find_one({'guid': game1})
+        guid2 = None if not game2 else await db.find_one({'guid': game2})
+        guid3 = None if not game3 else await db.find_one({'guid': game3})
+        guid4 = None if not game4 else await db.find_one({'guid': game4})
+        guid5 = None if not game5 else await db.find_one({'guid': game5})
 
         games = [game1, game2, game3, game4, game5]
         guids = [guid1, guid2, guid3, guid4, guid5]
@@ -1004,7 +1012,7 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
                 title='Are these games correct?', description='*Use the buttons below to confirm*', color=0xF5FF00
             )
             for idx, game in enumerate(gameList):
-                embed.add_field(name=f'Game {idx + 1}', value=db.find_one({'guid': game})['name'])
+                embed.add_field(name=f'Game {idx + 1}', value=(await db.find_one({'guid': game}))['name'])
 
             view = tools.NormalConfirmation(timeout=90.0)
             view.message = await interaction.followup.send(
@@ -1030,8 +1038,8 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
                 )
 
         # We are good to commit changes
-        userDB = mclient.bowser.users
-        userDB.update_one({'_id': interaction.user.id}, {'$set': {'favgames': gameList}})
+        userDB = amclient.bowser.users
+        await userDB.update_one({'_id': interaction.user.id}, {'$set': {'favgames': gameList}})
         message_reply = f'{config.greenTick} Your favorite games list has been successfully updated on your profile card! Here\'s how it looks:'
 
         if msg:
@@ -1081,8 +1089,8 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
             for s in self.menus:
                 if s.values:
                     value = s.values[0]
-                    db = mclient.bowser.users
-                    db.update_one({'_id': interaction.user.id}, {'$set': {'background': value}})
+                    db = amclient.bowser.users
+                    await db.update_one({'_id': interaction.user.id}, {'$set': {'background': value}})
 
                     await self.message.delete()
                     await interaction.response.send_message(
@@ -1119,8 +1127,8 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
     async def _profile_background(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
 
-        db = mclient.bowser.users
-        user = db.find_one({'_id': interaction.user.id})
+        db = amclient.bowser.users
+        user = await db.find_one({'_id': interaction.user.id})
         bg = user['background']
 
         choices = []
@@ -1170,17 +1178,17 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
             'Background': ('background', 'has'),
         }
 
-        db = mclient.bowser.users
+        db = amclient.bowser.users
         msg = f'Your {element.lower()} {elementKeyPairs[element][1]} been removed from your profile successfully'
         if element == 'Favorite Games':
-            db.update_one({'_id': interaction.user.id}, {'$set': {'favgames': []}})
+            await db.update_one({'_id': interaction.user.id}, {'$set': {'favgames': []}})
 
         elif element == 'Background':
-            db.update_one({'_id': interaction.user.id}, {'$set': {'background': 'default-light'}})
+            await db.update_one({'_id': interaction.user.id}, {'$set': {'background': 'default-light'}})
             msg += ', and has been set to `Default Light` theme. '
 
         else:
-            db.update_one({'_id': interaction.user.id}, {'$set': {elementKeyPairs[element][0]: None}})
+            await db.update_one({'_id': interaction.user.id}, {'$set': {elementKeyPairs[element][0]: None}})
             msg += '. '
 
         msg += 'Here\'s how it looks:'
@@ -1191,8 +1199,8 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
     )
     async def _profile_edit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
-        db = mclient.bowser.users
-        u = db.find_one({'_id': interaction.user.id})
+        db = amclient.bowser.users
+        u = await db.find_one({'_id': interaction.user.id})
         embed, card = await self.generate_user_flow_embed(interaction.user, new_user=not u['profileSetup'])
         await interaction.followup.send(embed=embed, file=card)
 
@@ -1519,7 +1527,7 @@ class SocialFeatures(commands.Cog, name='Social Commands'):
             return
 
         content = re.sub(r'(<@!?\d+>)', '', message.content)
-        contains_code = tools.re_match_nonlink(self.friendCodeRegex['chatFilter'], content)
+        contains_code = tools.chat_filter.scan(content).get('friendcode')
 
         if not contains_code:
             return
@@ -6,15 +6,12 @@ from datetime import date, datetime, timedelta, timezone
 
 import config
 import discord
-import pymongo
 import pytz
 from discord import app_commands
 from discord.ext import commands
 
 import tools
-
-
-mclient = pymongo.MongoClient(config.mongoURI)
+from database import amclient
 
 
 class StatCommands(commands.Cog, name='Statistic Commands'):
@@ -72,7 +69,8 @@ class StatCommands(commands.Cog, name='Statistic Commands'):
             )
 
         if not start:
-            messages = mclient.bowser.messages.find({'timestamp': {'$gte': (int(time.time()) - (60 * 60 * 24 * 30))}})
+            rangeStart = int(time.time()) - (60 * 60 * 24 * 30)
+            rangeEnd = int(time.time())
 
         else:
             if endDate <= searchDate:
@@ -80,44 +78,37 @@ class StatCommands(commands.Cog, name='Statistic Commands'):
                     content=f'{config.redTick} Invalid dates provided. The end date cannot be before the starting date. `/stats server [starting date] [ending date]`'
                 )
 
-            messages = mclient.bowser.messages.find(
-                {'timestamp': {'$gte': searchDate.timestamp(), '$lte': endDate.timestamp()}}
-            )
+            rangeStart = int(searchDate.timestamp())
+            rangeEnd = int(endDate.timestamp())
 
-        msgCount = messages.count()
-        channelCounts = {}
-        userCounts = {}
-        for message in messages:
-            if message['channel'] not in channelCounts.keys():
-                channelCounts[message['channel']] = 1
-
-            else:
-                channelCounts[message['channel']] += 1
+        # Message activity is read from the rollups kept by the core ingest, bucketed by the hour/day they fall in
+        hourRange = {'$gte': rangeStart - rangeStart % tools.HOUR, '$lte': rangeEnd}
+        dayRange = {'$gte': rangeStart - rangeStart % tools.DAY, '$lte': rangeEnd}
 
-            if message['author'] not in userCounts.keys():
-                userCounts[message['author']] = 1
+        channelCounts = await amclient.bowser.rollupChannelHour.aggregate(
+            [
+                {'$match': {'hour': hourRange}},
+                {'$group': {'_id': '$channel', 'count': {'$sum': '$count'}}},
+                {'$sort': {'count': -1}},
+            ]
+        )
+        msgCount = sum(x['count'] for x in channelCounts)
 
-            else:
-                userCounts[message['author']] += 1
+        activeUsers = await amclient.bowser.rollupAuthorDay.aggregate(
+            [{'$match': {'day': dayRange}}, {'$group': {'_id': '$author'}}, {'$count': 'users'}]
+        )
+        activeUsers = 0 if not activeUsers else activeUsers[0]['users']
 
-        if not start:
-            puns = mclient.bowser.puns.find(
-                {
-                    'timestamp': {'$gte': (int(time.time()) - (60 * 60 * 24 * 30))},
-                    'type': {'$nin': ['unmute', 'unblacklist', 'note']},
-                }
-            ).count()
+        puns = await amclient.bowser.rollupPunDay.aggregate(
+            [
+                {'$match': {'day': dayRange, 'type': {'$nin': ['unmute', 'unblacklist', 'note']}}},
+                {'$group': {'_id': None, 'count': {'$sum': '$count'}}},
+            ]
+        )
+        puns = 0 if not puns else puns[0]['count']
 
-        else:
-            puns = mclient.bowser.puns.find(
-                {
-                    'timestamp': {'$gte': searchDate.timestamp(), '$lte': endDate.timestamp()},
-                    'type': {'$nin': ['unmute', 'unblacklist', 'note']},
-                }
-            ).count()
-
-        topChannels = sorted(channelCounts.items(), key=lambda x: x[1], reverse=True)[
-            0:5
+        topChannels = [
+            (x['_id'], x['count']) for x in channelCounts[0:5]
         ]  # Get a list of tuple sorting by most active channel to least, and only include top 5
         topChannelsList = []
         for x in topChannels:
@@ -129,22 +120,12 @@ class StatCommands(commands.Cog, name='Statistic Commands'):
                 topChannelsList.append(f'*Deleted channel* ({x[1]})')
 
         await interaction.edit_original_response(content='One moment, crunching member data...')
-        netJoins = 0
-        netLeaves = 0
-        for member in mclient.bowser.users.find({'joins': {'$ne': []}}):
-            for join in member['joins']:
-                if not start and (searchDate.timestamp() - (60 * 60 * 24 * 30)) <= join <= endDate.timestamp():
-                    netJoins += 1
-
-                elif start and searchDate.timestamp() <= join <= endDate.timestamp():
-                    netJoins += 1
-
-            for leave in member['leaves']:
-                if not start and (searchDate.timestamp() - (60 * 60 * 24 * 30)) <= leave <= endDate.timestamp():
-                    netLeaves += 1
-
-                elif start and searchDate.timestamp() <= leave <= endDate.timestamp():
-                    netLeaves += 1
+        eventRange = {
+            '$gte': searchDate.timestamp() - (0 if start else 60 * 60 * 24 * 30),
+            '$lte': endDate.timestamp(),
+        }
+        netJoins = await amclient.bowser.memberEvents.count_documents({'type': 'join', 'timestamp': eventRange})
+        netLeaves = await amclient.bowser.memberEvents.count_documents({'type': 'leave', 'timestamp': eventRange})
 
         activeChannels = ', '.join(topChannelsList)
         premiumTier = 'No tier' if interaction.guild.premium_tier == 0 else f'Tier {interaction.guild.premium_tier}'
@@ -164,7 +145,7 @@ class StatCommands(commands.Cog, name='Statistic Commands'):
         embed = discord.Embed(
             title=f'{interaction.guild.name} Statistics',
             description=f'Current member count is **{interaction.guild.member_count}**\n*__{dayStr}...__*\n\n'
-            f':incoming_envelope: **{msgCount}** messages have been sent\n:information_desk_person: **{len(userCounts)}** members were active\n'
+            f':incoming_envelope: **{msgCount}** messages have been sent\n:information_desk_person: **{activeUsers}** members were active\n'
             f'{netMemberStr}:hammer: **{puns}** punishment actions were handed down\n\n:bar_chart: The most active channels by message count were {activeChannels}',
             color=0xD267BA,
         )
@@ -181,17 +162,18 @@ class StatCommands(commands.Cog, name='Statistic Commands'):
     async def _stats_users(self, interaction: discord.Interaction):
         '''Returns most active users'''
         await interaction.response.send_message('One moment, crunching the numbers...')
-        messages = mclient.bowser.messages.find({'timestamp': {'$gt': (int(time.time()) - (60 * 60 * 24 * 30))}})
-        msgCounts = {}
-        for message in messages:
-            if message['author'] not in msgCounts.keys():
-                msgCounts[message['author']] = 1
-
-            else:
-                msgCounts[message['author']] += 1
+        rangeStart = int(time.time()) - (60 * 60 * 24 * 30)
+        msgCounts = await amclient.bowser.rollupAuthorDay.aggregate(
+            [
+                {'$match': {'day': {'$gte': rangeStart - rangeStart % tools.DAY}}},
+                {'$group': {'_id': '$author', 'count': {'$sum': '$count'}}},
+                {'$sort': {'count': -1}},
+                {'$limit': 25},
+            ]
+        )
 
-        topSenders = sorted(msgCounts.items(), key=lambda x: x[1], reverse=True)[
-            0:25
+        topSenders = [
+            (x['_id'], x['count']) for x in msgCounts
         ]  # Get a list of tuple sorting by most message to least, and only include top 25
         embed = discord.Embed(
             title='Top User Statistics',
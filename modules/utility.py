@@ -1,12 +1,13 @@
 import asyncio
+import fnmatch
+import functools
 import io
 import logging
-import pathlib
 import re
 import time
 import typing
 import urllib.parse
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 import aiohttp
 import config
@@ -17,14 +18,187 @@ from discord.ext import commands, tasks
 from fuzzywuzzy import process
 
 import tools
+from database import amclient
 
 
-mclient = pymongo.MongoClient(config.mongoURI)
-
 serverLogs = None
 modLogs = None
 
 
+class AffiliateRules:
+    '''
+    Affiliate tag rules, keyed by domain globs with PurePath.match semantics, compiled for lookup by hostname. Literal
+    domains are stored in a trie of reversed labels, "brand.*" and "brand*.*" rules by their leading label and "*"
+    applies everywhere. Any other glob falls back to fnmatch against each domain suffix. The tags for a hostname are
+    computed once and cached.
+    '''
+
+    WILDCARDS = re.compile(r'[*?\[]')
+
+    def __init__(self, rules: typing.Dict[str, typing.List[str]], cache_size: int = 4096):
+        self.everywhere = set()
+        self.trie = {}
+        self.brands = {}  # "brand.*", by label
+        self.prefixes = []  # "brand*.*", as (label prefix, tags)
+        self.globs = []  # Anything else, as (compiled glob, tags)
+        for glob, tags in rules.items():
+            if glob == '*':
+                self.everywhere.update(tags)
+
+            elif not self.WILDCARDS.search(glob):
+                node = self.trie
+                for label in reversed(glob.split('.')):
+                    node = node.setdefault(label, {})
+
+                node.setdefault(None, set()).update(tags)
+
+            elif re.fullmatch(r'[^*?\[.]+\.\*', glob):
+                self.brands.setdefault(glob[:-2], set()).update(tags)
+
+            elif re.fullmatch(r'[^*?\[.]+\*\.\*', glob):
+                self.prefixes.append((glob[:-3], set(tags)))
+
+            else:
+                self.globs.append((re.compile(fnmatch.translate(glob)), set(tags)))
+
+        # A link can only be rewritten if it has a query key we strip (possibly percent-encoded) or is an old amazon link
+        keys = '|'.join(re.escape(tag) for tag in sorted(set().union(*rules.values())))
+        self.precheck = re.compile(rf'/exec/obidos/ASIN/|[?&](?:{keys}|[^=&#\s]*%)', re.I)
+        self.lookup = functools.lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _lookup(self, hostname: str) -> typing.Tuple[typing.FrozenSet[str], bool]:
+        '''Returns the tags to strip from links to `hostname`, and whether it is an amazon domain'''
+        labels = hostname.split('.')
+        tags = set(self.everywhere)
+
+        node = self.trie
+        for label in reversed(labels):
+            node = node.get(label)
+            if node is None:
+                break
+
+            tags.update(node.get(None, ()))
+
+        # Wildcard TLD rules match a label anywhere but last, e.g. "amazon.*" matches amazon.co.uk and www.amazon.com
+        amazon = False
+        for label in labels[:-1]:
+            amazon = amazon or label == 'amazon'
+            tags.update(self.brands.get(label, ()))
+            for prefix, prefixTags in self.prefixes:
+                if label.startswith(prefix):
+                    tags.update(prefixTags)
+
+        for i in range(len(labels)):
+            suffix = '.'.join(labels[i:])
+            for glob, globTags in self.globs:
+                if glob.match(suffix):
+                    tags.update(globTags)
+
+        return frozenset(tags), amazon
+
+
+class WebhookManager:
+    '''
+    Caches the incoming webhook used to repost messages in each channel, and sends through one long-lived HTTP
+    session. A channel's webhook is looked up again after its webhooks change or a send finds it was deleted.
+    '''
+
+    def __init__(self):
+        self.webhooks = {}
+        self.session = None
+
+    def open(self):
+        self.session = aiohttp.ClientSession()
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+        self.webhooks.clear()
+
+    def invalidate(self, channelID: int):
+        self.webhooks.pop(channelID, None)
+
+    async def get(self, channel: discord.TextChannel) -> Webhook:
+        webhook = self.webhooks.get(channel.id)
+        if webhook:
+            return webhook
+
+        useHook = None
+        for h in await channel.webhooks():
+            if h.type == WebhookType.incoming and h.token:
+                useHook = h
+
+        if not useHook:
+            # An incoming webhook does not exist
+            useHook = await channel.create_webhook(
+                name=f'mab_{channel.id}',
+                reason='No webhooks existed; 1 or more is required for affiliate filtering',
+            )
+
+        webhook = Webhook.from_url(useHook.url, session=self.session)
+        self.webhooks[channel.id] = webhook
+        return webhook
+
+    async def send(self, channel: discord.TextChannel, **kwargs) -> discord.WebhookMessage:
+        webhook = await self.get(channel)
+        try:
+            return await webhook.send(wait=True, **kwargs)
+
+        except discord.NotFound:  # Deleted since it was cached
+            self.invalidate(channel.id)
+            webhook = await self.get(channel)
+            return await webhook.send(wait=True, **kwargs)
+
+
+class RepostRegistry:
+    '''
+    Affiliate reposts that their author can still remove with 🗑️, keyed by the ID of the bot's notice message. Held in
+    memory so reactions can be checked without a REST call, and mirrored to bowser.reposts where a TTL index expires
+    them after `ttl` seconds. Notices from before the registry existed, or older than the TTL, are not covered and
+    must be checked by fetching them
+    '''
+
+    def __init__(self, ttl=60 * 60 * 24 * 30):
+        self.ttl = ttl
+        self.reposts = {}  # notice message ID: (allowed remover, reposted message ID, created)
+        self.since = None
+
+    async def load(self):
+        db = amclient.bowser.reposts
+        await db.create_index([('created', 1)], expireAfterSeconds=self.ttl)
+        await db.update_one({'_id': 'since'}, {'$setOnInsert': {'since': time.time()}}, upsert=True)
+        self.since = (await db.find_one({'_id': 'since'}))['since']
+        cutoff = datetime.now(tz=timezone.utc) - timedelta(seconds=self.ttl)
+        for doc in await db.find({'created': {'$gt': cutoff}}):
+            created = doc['created'].replace(tzinfo=timezone.utc).timestamp()
+            self.reposts[doc['_id']] = (doc['remover'], doc['message'], created)
+
+    def get(self, noticeID: int) -> typing.Optional[typing.Tuple[int, int, float]]:
+        repost = self.reposts.get(noticeID)
+        if repost and repost[2] + self.ttl < time.time():
+            del self.reposts[noticeID]
+            return None
+
+        return repost
+
+    def covers(self, noticeID: int) -> bool:
+        '''Whether a notice with this ID would be in the registry if it were a repost'''
+        created = discord.utils.snowflake_time(noticeID).timestamp()
+        return created >= self.since and created > time.time() - self.ttl
+
+    async def add(self, noticeID: int, remover: int, messageID: int):
+        created = datetime.now(tz=timezone.utc)
+        self.reposts[noticeID] = (remover, messageID, created.timestamp())
+        await amclient.bowser.reposts.insert_one(
+            {'_id': noticeID, 'remover': remover, 'message': messageID, 'created': created}
+        )
+
+    async def remove(self, noticeID: int):
+        self.reposts.pop(noticeID, None)
+        await amclient.bowser.reposts.delete_one({'_id': noticeID})
+
+
 class ChatControl(commands.Cog, name='Utility Commands'):
     def __init__(self, bot):
         self.bot = bot
@@ -46,6 +220,9 @@ class ChatControl(commands.Cog, name='Utility Commands'):
             "tigerdirect.com": ["affiliateid", "srccode"],
             "walmart.*": ["sourceid", "veh", "wmlspartner"],
         }
+        self.affiliateRules = AffiliateRules(self.affiliateTags)
+        self.webhooks = WebhookManager()
+        self.reposts = RepostRegistry()
 
         # Add context menus to command tree
         self.historyContextMenu = app_commands.ContextMenu(
@@ -53,6 +230,17 @@ class ChatControl(commands.Cog, name='Utility Commands'):
         )
         self.bot.tree.add_command(self.historyContextMenu, guild=discord.Object(id=config.nintendoswitch))
 
+    async def cog_load(self):
+        self.webhooks.open()
+        await self.reposts.load()
+
+    async def cog_unload(self):
+        await self.webhooks.close()
+
+    @commands.Cog.listener()
+    async def on_webhooks_update(self, channel):
+        self.webhooks.invalidate(channel.id)
+
     # Called after automod filter finished, because of the affilite link reposter. We also want to wait for other items in this function to complete to call said reposter.
     async def on_automod_finished(self, message):
         if message.type == discord.MessageType.premium_guild_subscription:
@@ -68,42 +256,41 @@ class ChatControl(commands.Cog, name='Utility Commands'):
 
         # Filter and clean affiliate links
         # We want to call this last to ensure all above items are complete.
-        links = tools.linkRe.finditer(message.content)
-        if links:
+        if self.affiliateRules.precheck.search(message.content):
             contentModified = False
             content = message.content
-            for link in links:
-                linkModified = False
+            for link in tools.linkRe.finditer(message.content):
+                if not self.affiliateRules.precheck.search(link[0]):
+                    continue
 
                 try:
                     urlParts = urllib.parse.urlsplit(link[0])
                 except ValueError:  # Invalid URL edge case
                     continue
 
+                if not urlParts.hostname:
+                    continue
+
+                linkModified = False
                 urlPartsList = list(urlParts)
 
                 query_raw = dict(urllib.parse.parse_qsl(urlPartsList[3]))
                 # Make all keynames lowercase in dict, this shouldn't break a website, I hope...
                 query = {k.lower(): v for k, v in query_raw.items()}
 
-                # For each domain level of hostname, eg. foo.bar.example => foo.bar.example, bar.example, example
-                labels = urlParts.hostname.split(".")
-                for i in range(0, len(labels)):
-                    domain = ".".join(labels[i - len(labels) :])
-
-                    # Special case: rewrite 'amazon.*/exec/obidos/ASIN/.../' to 'amazon.*/dp/.../'
-                    if pathlib.PurePath(domain).match('amazon.*'):
-                        match = re.match(r'^/exec/obidos/ASIN/(\w+)/.*$', urlParts.path)
-                        if match:
-                            linkModified = True
-                            urlPartsList[2] = f'/dp/{match.group(1)}'  # 2 = path
-
-                    for glob, tags in self.affiliateTags.items():
-                        if pathlib.PurePath(domain).match(glob):
-                            for tag in tags:
-                                if tag in query:
-                                    linkModified = True
-                                    query.pop(tag, None)
+                tags, amazon = self.affiliateRules.lookup(urlParts.hostname)
+
+                # Special case: rewrite 'amazon.*/exec/obidos/ASIN/.../' to 'amazon.*/dp/.../'
+                if amazon:
+                    match = re.match(r'^/exec/obidos/ASIN/(\w+)/.*$', urlParts.path)
+                    if match:
+                        linkModified = True
+                        urlPartsList[2] = f'/dp/{match.group(1)}'  # 2 = path
+
+                for tag in tags:
+                    if tag in query:
+                        linkModified = True
+                        query.pop(tag, None)
 
                 if linkModified:
                     urlPartsList[3] = urllib.parse.urlencode(query)
@@ -113,45 +300,32 @@ class ChatControl(commands.Cog, name='Utility Commands'):
                     content = content.replace(link[0], url)
 
             if contentModified:
-                useHook = None
-                for h in await message.channel.webhooks():
-                    if h.type == WebhookType.incoming and h.token:
-                        useHook = h
-
-                if not useHook:
-                    # An incoming webhook does not exist
-                    useHook = await message.channel.create_webhook(
-                        name=f'mab_{message.channel.id}',
-                        reason='No webhooks existed; 1 or more is required for affiliate filtering',
-                    )
-
-                async with aiohttp.ClientSession() as session:
-                    webhook = Webhook.from_url(useHook.url, session=session)
-                    webhook_message = await webhook.send(
-                        content=content,
-                        username=message.author.display_name,
-                        avatar_url=message.author.display_avatar.url,
-                        wait=True,
-                    )
-
-                    try:
-                        await message.delete()
-                    except Exception:
-                        pass
-
-                    embed = discord.Embed(
-                        description='The above message was automatically reposted by Mecha Bowser to remove an affiliate marketing link. The author may react with 🗑️ to delete these messages.'
-                    )
-
-                    # #mab_remover is the special sauce that allows users to delete their messages, see on_raw_reaction_add()
-                    icon_url = (
-                        f'{message.author.display_avatar.url}#mab_remover_{message.author.id}_{webhook_message.id}'
-                    )
-                    embed.set_footer(text=f'Author: {str(message.author)} ({message.author.id})', icon_url=icon_url)
-
-                    # A seperate message is sent so that the original message has embeds
-                    embed_message = await message.channel.send(embed=embed)
-                    await embed_message.add_reaction('🗑️')
+                webhook_message = await self.webhooks.send(
+                    message.channel,
+                    content=content,
+                    username=message.author.display_name,
+                    avatar_url=message.author.display_avatar.url,
+                )
+
+                try:
+                    await message.delete()
+                except Exception:
+                    pass
+
+                embed = discord.Embed(
+                    description='The above message was automatically reposted by Mecha Bowser to remove an affiliate marketing link. The author may react with 🗑️ to delete these messages.'
+                )
+
+                # #mab_remover lets the author delete the repost after it has expired from the registry
+                icon_url = f'{message.author.display_avatar.url}#mab_remover_{message.author.id}_{webhook_message.id}'
+                embed.set_footer(text=f'Author: {str(message.author)} ({message.author.id})', icon_url=icon_url)
+
+                # A seperate message is sent so that the original message has embeds
+                embed_message = await message.channel.send(embed=embed)
+
+                # The registry is what allows users to delete their messages, see on_raw_reaction_add()
+                await self.reposts.add(embed_message.id, message.author.id, webhook_message.id)
+                await embed_message.add_reaction('🗑️')
 
     # Handle :wastebasket: reactions for user deletions on messages reposted on a user's behalf
     @commands.Cog.listener()
@@ -164,33 +338,16 @@ class ChatControl(commands.Cog, name='Utility Commands'):
             return  # This reaction was added by this bot
 
         channel = self.bot.get_channel(payload.channel_id)
-        message = await channel.fetch_message(payload.message_id)
-        embed = None if not message.embeds else message.embeds[0]
+        repost = self.reposts.get(payload.message_id)
+        if not repost and not self.reposts.covers(payload.message_id):
+            repost = await self._tagged_repost(channel, payload.message_id)
 
-        if message.author.id != self.bot.user.id:
-            return  # Message is not from the bot
-        if not embed:
-            return  # Message does not have an embed
+        if not repost:
+            return  # Not a repost notice
 
-        allowed_remover = None
-        target_message = None
-        # Search for special url tag in footer/author icon urls:
-        # ...#mab_remover_{remover} or ..#mab_remover_{remover}_{message}
-        for icon_url in [embed.author.icon_url, embed.footer.icon_url]:
-            if not icon_url:
-                continue  # Location does not have an icon_url
-
-            match = re.search(r'#mab_remover_(\d{15,25})(?:_(\d{15,25}))?$', icon_url)
-            if not match:
-                continue  # No special url tag here
-
-            allowed_remover = match.group(1)
-            target_message = match.group(2)
-            break
-
-        if not allowed_remover:  # No special url tag detected
-            return
-        if str(payload.user_id) != str(allowed_remover):  # Reactor is not the allowed remover
+        allowed_remover, target_message, _ = repost
+        message = channel.get_partial_message(payload.message_id)
+        if payload.user_id != allowed_remover:  # Reactor is not the allowed remover
             try:
                 await message.remove_reaction(payload.emoji, payload.member)
             except:
@@ -199,14 +356,38 @@ class ChatControl(commands.Cog, name='Utility Commands'):
 
         try:
             if target_message:
-                msg = await channel.fetch_message(target_message)
-                await msg.delete()
+                await channel.get_partial_message(target_message).delete()
 
             await message.delete()
         except Exception as e:
             logging.warning(e)
             pass
 
+        await self.reposts.remove(payload.message_id)
+
+    async def _tagged_repost(self, channel, messageID):
+        '''Read the remover and reposted message from the #mab_remover tag of a notice the registry doesn't cover'''
+        try:
+            message = await channel.fetch_message(messageID)
+        except discord.HTTPException:
+            return None
+
+        if message.author.id != self.bot.user.id or not message.embeds:
+            return None  # Not a notice from the bot
+
+        # Search for special url tag in footer/author icon urls:
+        # ...#mab_remover_{remover} or ..#mab_remover_{remover}_{message}
+        embed = message.embeds[0]
+        for icon_url in [embed.author.icon_url, embed.footer.icon_url]:
+            if not icon_url:
+                continue  # Location does not have an icon_url
+
+            match = re.search(r'#mab_remover_(\d{15,25})(?:_(\d{15,25}))?$', icon_url)
+            if match:
+                return int(match.group(1)), int(match.group(2)) if match.group(2) else None, None
+
+        return None
+
     # Large block of old event commented out code was removed on 12/02/2020
     # Includes: Holiday season celebration, 30k members celebration, Splatoon splatfest event, Pokemon sword/shield event
     # https://github.com/rNintendoSwitch/MechaBowser/commit/373cef69aa5b9da7fe5945599b7dde387caf0700
@@ -282,11 +463,20 @@ class ChatControl(commands.Cog, name='Utility Commands'):
                 await view.message.delete()
 
         userList = None if not deleteUsers else [x.id for x in deleteUsers]
+        core = self.bot.get_cog('MainEvents')
 
         def message_filter(message):
-            return True if not userList or message.author.id in userList else False
+            if userList and message.author.id not in userList:
+                return False
+
+            if core:
+                core.purges.add(message.id)  # Registered before the delete is sent so the bulk delete log skips it
+
+            return True
 
         deleted = await interaction.channel.purge(limit=count, check=message_filter, bulk=True)
+        if core:
+            await core.purges.persist([x.id for x in deleted])
 
         try:
             await interaction.delete_original_response()
@@ -368,7 +558,7 @@ class ChatControl(commands.Cog, name='Utility Commands'):
     async def _info(self, interaction: discord.Interaction, user: discord.User):
         await interaction.response.defer(ephemeral=tools.mod_cmd_invoke_delete(interaction.channel))
         inServer = True
-        dbUser = mclient.bowser.users.find_one({'_id': user.id})
+        dbUser = await amclient.bowser.users.find_one({'_id': user.id})
         if interaction.guild.get_member(user.id):
             user = interaction.guild.get_member(user.id)
 
@@ -379,7 +569,7 @@ class ChatControl(commands.Cog, name='Utility Commands'):
                 'There is little information to display as they have not been recorded joining the server before'
             )
 
-            infractions = mclient.bowser.puns.find({'user': user.id}).count()
+            infractions = await amclient.bowser.puns.count_documents({'user': user.id})
             if infractions:
                 desc += f'\n\nUser has {infractions} infraction entr{"y" if infractions == 1 else "ies"}, use `/history {user.id}` to view'
 
@@ -391,8 +581,8 @@ class ChatControl(commands.Cog, name='Utility Commands'):
             return await interaction.followup.send(embed=embed)
 
         # Member object, loads of info to work with
-        messages = mclient.bowser.messages.find({'author': user.id})
-        msgCount = 0 if not messages else messages.count()
+        counter = await amclient.bowser.messageCounts.find_one({'_id': user.id})
+        msgCount = 0 if not counter else counter['count']
 
         desc = (
             f'Fetched user {user.mention}.'
@@ -443,18 +633,18 @@ class ChatControl(commands.Cog, name='Utility Commands'):
 
         embed.add_field(name='Roles', value=roles, inline=False)
 
-        lastMsg = (
-            'N/a' if msgCount == 0 else f'<t:{int(messages.sort("timestamp", pymongo.DESCENDING)[0]["timestamp"])}:f>'
-        )
+        lastMsg = 'N/a' if msgCount == 0 else f'<t:{int(counter["last_message"])}:f>'
         embed.add_field(name='Last message', value=lastMsg, inline=True)
         embed.add_field(name='Created', value=f'<t:{int(user.created_at.timestamp())}:f>', inline=True)
 
-        noteDocs = mclient.bowser.puns.find({'user': user.id, 'type': 'note'})
+        noteDocs = await amclient.bowser.puns.find(
+            {'user': user.id, 'type': 'note'}, sort=[('timestamp', pymongo.DESCENDING)]
+        )
         fieldValue = 'View history to get full details on all notes\n\n'
-        if noteDocs.count():
-            noteCnt = noteDocs.count()
+        if noteDocs:
+            noteCnt = len(noteDocs)
             noteList = []
-            for x in noteDocs.sort('timestamp', pymongo.DESCENDING):
+            for x in noteDocs:
                 stamp = f'[<t:{int(x["timestamp"])}:d>]'
                 noteContent = f'{stamp}: {x["reason"]}'
 
@@ -470,19 +660,20 @@ class ChatControl(commands.Cog, name='Utility Commands'):
             embed.add_field(name='User notes', value=fieldValue + '\n'.join(noteList), inline=False)
 
         punishments = ''
-        punsCol = mclient.bowser.puns.find({'user': user.id, 'type': {'$ne': 'note'}})
+        punsCol = await amclient.bowser.puns.find(
+            {'user': user.id, 'type': {'$ne': 'note'}}, sort=[('timestamp', pymongo.DESCENDING)]
+        )
         puns = 0
-        if not punsCol.count():
+        if not punsCol:
             punishments = '__*No punishments on record*__'
 
         else:
-            activeStrikes = 0
+            activeStrikes = dbUser.get('active_strikes', 0) if dbUser else 0
             totalStrikes = 0
             activeMute = None
-            for pun in punsCol.sort('timestamp', pymongo.DESCENDING):
+            for pun in punsCol:
                 if pun['type'] == 'strike':
                     totalStrikes += pun['strike_count']
-                    activeStrikes += pun['active_strike_count']
 
                 elif pun['type'] == 'destrike':
                     totalStrikes -= pun['strike_count']
@@ -510,7 +701,7 @@ class ChatControl(commands.Cog, name='Utility Commands'):
                     punishments += f'> {config.addTick} {stamp} **{punType}**\n'
 
             punishments = (
-                f'Showing {puns}/{punsCol.count()} punishment entries. '
+                f'Showing {puns}/{len(punsCol)} punishment entries. '
                 f'For a full history including responsible moderator, active status, and more use `/history {user.id}`'
                 f'\n\n{punishments}'
             )
@@ -577,8 +768,29 @@ class ChatControl(commands.Cog, name='Utility Commands'):
             await interaction.response.defer(ephemeral=tools.mod_cmd_invoke_delete(interaction.channel))
             self_check = False
 
-        db = mclient.bowser.puns
-        puns = db.find({'user': user.id, 'type': {'$ne': 'note'}}) if self_check else db.find({'user': user.id})
+        db = amclient.bowser.puns
+        query = {'user': user.id, 'type': {'$ne': 'note'}} if self_check else {'user': user.id}
+        punCount = await db.count_documents(query)
+        userDoc = await amclient.bowser.users.find_one({'_id': user.id}, projection={'active_strikes': 1})
+        strikeTotals = await db.aggregate(
+            [
+                {'$match': {'user': user.id, 'type': {'$in': ['strike', 'destrike']}}},
+                {
+                    '$group': {
+                        '_id': None,
+                        'total': {
+                            '$sum': {
+                                '$cond': [
+                                    {'$eq': ['$type', 'strike']},
+                                    '$strike_count',
+                                    {'$multiply': ['$strike_count', -1]},
+                                ]
+                            }
+                        },
+                    }
+                },
+            ]
+        )
 
         deictic_language = {
             'no_punishments': ('User has no punishments on record.', 'You have no available punishments on record.'),
@@ -614,80 +826,77 @@ class ChatControl(commands.Cog, name='Utility Commands'):
             'note': 'User note',
         }
 
-        if puns.count() == 0:
+        if punCount == 0:
             desc = deictic_language["no_punishments"][self_check]
-        elif puns.count() == 1:
+        elif punCount == 1:
             desc = deictic_language['single_inf'][self_check]
         else:
-            desc = deictic_language['multiple_infs'][self_check].format(puns.count())
-
-        fields = []
-        activeStrikes = 0
-        totalStrikes = 0
-        for pun in puns.sort('timestamp', pymongo.DESCENDING):
-            datestamp = f'<t:{int(pun["timestamp"])}:f>'
-            moderator = interaction.guild.get_member(pun['moderator'])
-            if not moderator:
-                moderator = await self.bot.fetch_user(pun['moderator'])
-
-            if pun['type'] == 'strike':
-                activeStrikes += pun['active_strike_count']
-                totalStrikes += pun['strike_count']
-                inf = punNames[pun['type']].format(pun['strike_count'], "s" if pun['strike_count'] > 1 else "")
-
-            elif pun['type'] == 'destrike':
-                totalStrikes -= pun['strike_count']
-                inf = punNames[pun['type']].format(pun['strike_count'], "s" if pun['strike_count'] > 1 else "")
-
-            elif pun['type'] in ['blacklist', 'unblacklist']:
-                inf = punNames[pun['type']].format(pun['context'])
-
-            elif pun['type'] == 'appealdeny':
-                inf = punNames[pun['type']].format(
-                    f'until <t:{int(pun["expiry"])}:D>' if pun["expiry"] else "permanently"
-                )
-
-            else:
-                inf = punNames[pun['type']]
-
-            value = f'**Moderator:** {moderator}\n**Details:** [{inf}] {pun["reason"]}'
-
-            if len(value) > 1024:  # This shouldn't happen, but it does -- split long values up
-                strings = []
-                offsets = list(range(0, len(value), 1018))  # 1024 - 6 = 1018
-
-                for i, o in enumerate(offsets):
-                    segment = value[o : (o + 1018)]
-
-                    if i == 0:  # First segment
-                        segment = f'{segment}...'
-                    elif i == len(offsets) - 1:  # Last segment
-                        segment = f'...{segment}'
-                    else:
-                        segment = f'...{segment}...'
-
-                    strings.append(segment)
-
-                for i, string in enumerate(strings):
-                    fields.append({'name': f'{datestamp} ({i+1}/{len(strings)})', 'value': string})
-
-            else:
-                fields.append({'name': datestamp, 'value': value})
+            desc = deictic_language['multiple_infs'][self_check].format(punCount)
 
+        activeStrikes = userDoc.get('active_strikes', 0) if userDoc else 0
+        totalStrikes = strikeTotals[0]['total'] if strikeTotals else 0
         if totalStrikes:
             desc = deictic_language['total_strikes'][self_check].format(activeStrikes, totalStrikes) + desc
 
+        async def fetch_page(offset, limit):
+            # Only the page being viewed is read and has its moderators resolved
+            puns = await db.find(
+                query, sort=[('timestamp', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)], skip=offset, limit=limit
+            )
+            return [await self._history_fields(interaction, pun, punNames) for pun in puns]
+
         author = {'name': f'{user} | {user.id}', 'icon_url': user.display_avatar.url}
         view = tools.PaginatedEmbed(
             interaction=interaction,
-            fields=fields,
+            source=tools.PageSource(fetch_page, punCount),
             title='Infraction History',
             description=desc,
             color=0x18EE1C,
             author=author,
         )
 
-        await interaction.edit_original_response(content='Here is the requested user history:', view=view)
+        await view.start(content='Here is the requested user history:')
+
+    async def _history_fields(self, interaction: discord.Interaction, pun, punNames):
+        datestamp = f'<t:{int(pun["timestamp"])}:f>'
+        moderator = interaction.guild.get_member(pun['moderator'])
+        if not moderator:
+            moderator = self.bot.get_user(pun['moderator']) or await self.bot.fetch_user(pun['moderator'])
+
+        if pun['type'] in ['strike', 'destrike']:
+            inf = punNames[pun['type']].format(pun['strike_count'], "s" if pun['strike_count'] > 1 else "")
+
+        elif pun['type'] in ['blacklist', 'unblacklist']:
+            inf = punNames[pun['type']].format(pun['context'])
+
+        elif pun['type'] == 'appealdeny':
+            inf = punNames[pun['type']].format(f'until <t:{int(pun["expiry"])}:D>' if pun["expiry"] else "permanently")
+
+        else:
+            inf = punNames[pun['type']]
+
+        value = f'**Moderator:** {moderator}\n**Details:** [{inf}] {pun["reason"]}'
+
+        if len(value) <= 1024:
+            return [{'name': datestamp, 'value': value}]
+
+        # This shouldn't happen, but it does -- split long values up
+        strings = []
+        offsets = list(range(0, len(value), 1018))  # 1024 - 6 = 1018
+
+        for i, o in enumerate(offsets):
+            segment = value[o : (o + 1018)]
+
+            if i == 0:  # First segment
+                segment = f'{segment}...'
+            elif i == len(offsets) - 1:  # Last segment
+                segment = f'...{segment}'
+            else:
+                segment = f'...{segment}...'
+
+            strings.append(segment)
+
+        return [{'name': f'{datestamp} ({i+1}/{len(strings)})', 'value': string} for i, string in enumerate(strings)]
 
     @app_commands.command(
         name='echoreply', description='Use the bot to reply to a message. Must provide either text, attachment, or both'
@@ -790,8 +999,8 @@ class ChatControl(commands.Cog, name='Utility Commands'):
     async def _tag_autocomplete(
         self, interaction: discord.Interaction, current: str
     ) -> typing.List[app_commands.Choice[str]]:
-        db = mclient.bowser.tags
-        tags = db.find({'active': True})
+        db = amclient.bowser.tags
+        tags = await db.find({'active': True}, projection={'_id': 1})
         tagList = [tag['_id'] for tag in tags]
         if current == '':
             return [app_commands.Choice(name=t, value=t) for t in tagList[0:10]]
@@ -809,10 +1018,10 @@ class ChatControl(commands.Cog, name='Utility Commands'):
     @app_commands.describe(query='The name of the tag you wish to pull up')
     @app_commands.autocomplete(query=_tag_autocomplete)
     async def _tag(self, interaction: discord.Interaction, query: str):
-        db = mclient.bowser.tags
+        db = amclient.bowser.tags
 
         query = query.lower()
-        tag = db.find_one({'_id': query, 'active': True})
+        tag = await db.find_one({'_id': query, 'active': True})
 
         if not tag:
             return await interaction.response.send_message(
@@ -833,10 +1042,10 @@ class ChatControl(commands.Cog, name='Utility Commands'):
     @app_commands.describe(search='A query to narrow down tags by')
     @app_commands.autocomplete(search=_tag_autocomplete)
     async def _tag_list(self, interaction: discord.Interaction, search: typing.Optional[str]):
-        db = mclient.bowser.tags
+        db = amclient.bowser.tags
 
         tagList = []
-        for tag in db.find({'active': True}):
+        for tag in await db.find({'active': True}):
             description = '' if not 'desc' in tag else tag['desc']
             tagList.append({'name': tag['_id'].lower(), 'desc': description, 'content': tag['content']})
 
@@ -916,19 +1125,19 @@ class ChatControl(commands.Cog, name='Utility Commands'):
             max_length=4000,
         )
 
-        def __init__(self, tag):
+        def __init__(self, tag, doc):
             super().__init__(title=f'Editing Tag: "{tag}"')
             self.tag = tag
             self.textbox.placeholder = 'Write some text! __Discord markdown is supported.__'
 
-            self.db = mclient.bowser.tags
-            self.doc = self.db.find_one({'_id': self.tag})
+            self.db = amclient.bowser.tags
+            self.doc = doc
             if self.doc:
                 self.textbox.default = self.doc['content']
 
         async def on_submit(self, interaction: discord.Interaction):
             if self.doc:
-                self.db.update_one(
+                await self.db.update_one(
                     {'_id': self.tag},
                     {
                         '$push': {
@@ -948,7 +1157,9 @@ class ChatControl(commands.Cog, name='Utility Commands'):
                 await interaction.response.send_message(msg)
 
             else:
-                self.db.insert_one({'_id': self.tag, 'content': self.textbox.value, 'revisions': [], 'active': True})
+                await self.db.insert_one(
+                    {'_id': self.tag, 'content': self.textbox.value, 'revisions': [], 'active': True}
+                )
                 return await interaction.response.send_message(
                     f'{config.greenTick} The **{self.tag}** tag has been created'
                 )
@@ -969,16 +1180,16 @@ class ChatControl(commands.Cog, name='Utility Commands'):
         if name in ['list', 'search', 'edit', 'delete', 'source', 'setdesc', 'setimg']:  # Name blacklist
             return await interaction.response.send_message(f'{config.redTick} You cannot use that name for a tag')
 
-        modal = self.TagEdit(name.lower())
+        modal = self.TagEdit(name.lower(), await amclient.bowser.tags.find_one({'_id': name.lower()}))
         return await interaction.response.send_modal(modal)
 
     @manage_tag_group.command(name='delete', description='Delete an existing tag')
     @app_commands.describe(name='Name of the tag to delete')
     @app_commands.autocomplete(name=_tag_autocomplete)
     async def _tag_delete(self, interaction: discord.Interaction, name: str):
-        db = mclient.bowser.tags
+        db = amclient.bowser.tags
         name = name.lower()
-        tag = db.find_one({'_id': name})
+        tag = await db.find_one({'_id': name})
         if tag:
             view = tools.RiskyConfirmation(timeout=20)
             await interaction.response.send_message(
@@ -991,7 +1202,7 @@ class ChatControl(commands.Cog, name='Utility Commands'):
                 await view.message.edit(content='Deletion timed out. Rerun command to try again', view=view)
 
             if view.value:
-                db.update_one({'_id': name}, {'$set': {'active': False}})
+                await db.update_one({'_id': name}, {'$set': {'active': False}})
                 await view.message.edit(content=f'{config.greenTick} The "{name}" tag has been deleted')
 
             else:
@@ -1007,14 +1218,14 @@ class ChatControl(commands.Cog, name='Utility Commands'):
     )
     @app_commands.autocomplete(name=_tag_autocomplete)
     async def _tag_setdesc(self, interaction: discord.Interaction, name: str, content: typing.Optional[str] = ''):
-        db = mclient.bowser.tags
+        db = amclient.bowser.tags
         name = name.lower()
-        tag = db.find_one({'_id': name})
+        tag = await db.find_one({'_id': name})
 
         content = ' '.join(content.splitlines())
 
         if tag:
-            db.update_one({'_id': tag['_id']}, {'$set': {'desc': content}})
+            await db.update_one({'_id': tag['_id']}, {'$set': {'desc': content}})
 
             status = 'updated' if content else 'cleared'
             return await interaction.response.send_message(
@@ -1038,9 +1249,9 @@ class ChatControl(commands.Cog, name='Utility Commands'):
         option: typing.Literal['main', 'thumbnail'],
         url: typing.Optional[str] = '',
     ):
-        db = mclient.bowser.tags
+        db = amclient.bowser.tags
         name = name.lower()
-        tag = db.find_one({'_id': name})
+        tag = await db.find_one({'_id': name})
 
         IMG_TYPES = {
             'main': {'key': 'img_main', 'name': 'main'},
@@ -1057,7 +1268,7 @@ class ChatControl(commands.Cog, name='Utility Commands'):
             return await interaction.response.send_message(f'{config.redTick} An invalid url, `{url}`, was given')
 
         if tag:
-            db.update_one({'_id': tag['_id']}, {'$set': {img_type['key']: url}})
+            await db.update_one({'_id': tag['_id']}, {'$set': {img_type['key']: url}})
 
             status = 'updated' if url else 'cleared'
             return await interaction.response.send_message(
@@ -1070,9 +1281,9 @@ class ChatControl(commands.Cog, name='Utility Commands'):
     @app_commands.describe(name='Name of the tag to retrieve the raw source')
     @app_commands.autocomplete(name=_tag_autocomplete)
     async def _tag_source(self, interaction: discord.Interaction, name: str):
-        db = mclient.bowser.tags
+        db = amclient.bowser.tags
         name = name.lower()
-        tag = db.find_one({'_id': name})
+        tag = await db.find_one({'_id': name})
 
         if tag:
             embed = discord.Embed(title=f'{name} source', description=f'```md\n{tag["content"]}\n```')
@@ -1111,7 +1322,7 @@ class ChatControl(commands.Cog, name='Utility Commands'):
         context: str,
         feature: str,
     ):
-        db = mclient.bowser.puns
+        db = amclient.bowser.puns
 
         public_notify = False
         try:
@@ -1126,7 +1337,7 @@ class ChatControl(commands.Cog, name='Utility Commands'):
             )
 
         else:
-            db.find_one_and_update(
+            await db.find_one_and_update(
                 {'user': member.id, 'type': 'blacklist', 'active': True, 'context': context},
                 {'$set': {'active': False}},
             )
@@ -1173,15 +1384,15 @@ class ChatControl(commands.Cog, name='Utility Commands'):
         statusText = ''
         if feature == 'modmail':
             context = 'modmail'
-            users = mclient.bowser.users
-            dbUser = users.find_one({'_id': member.id})
+            users = amclient.bowser.users
+            dbUser = await users.find_one({'_id': member.id})
 
             if dbUser['modmail']:
-                users.update_one({'_id': member.id}, {'$set': {'modmail': False}})
+                await users.update_one({'_id': member.id}, {'$set': {'modmail': False}})
                 statusText = 'Blacklisted'
 
             else:
-                users.update_one({'_id': member.id}, {'$set': {'modmail': True}})
+                await users.update_one({'_id': member.id}, {'$set': {'modmail': True}})
                 statusText = 'Unblacklisted'
 
         elif feature == 'reactions':
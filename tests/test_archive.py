@@ -0,0 +1,79 @@
+import asyncio
+import datetime
+
+import pytest
+
+
+mongomock = pytest.importorskip('mongomock')
+
+import database  # noqa: E402
+import tools  # noqa: E402
+
+
+class Avatar:
+    url = 'https://cdn.discordapp.com/avatars/0/0.png'
+
+    def with_format(self, _format):
+        return self
+
+    def with_size(self, _size):
+        return self
+
+
+class Author:
+    def __init__(self, id):
+        self.id = id
+        self.name = f'user{id}'
+        self.discriminator = '0'
+        self.display_avatar = Avatar()
+
+
+class Channel:
+    id = 1
+    name = 'general'
+
+
+class Guild:
+    id = 2
+
+
+class Message:
+    def __init__(self, id):
+        self.id = id
+        self.author = Author(id % 3)
+        self.content = f'message {id} ' + 'x' * 200
+        self.attachments = []
+        self.channel = Channel()
+        self.guild = Guild()
+        self.created_at = datetime.datetime.now(tz=datetime.timezone.utc)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = database.AsyncClient(mongomock.MongoClient())
+    monkeypatch.setattr(tools, 'amclient', client)
+    return client
+
+
+def test_small_archive_is_one_document(client):
+    archiveID = asyncio.run(tools.message_archive([Message(x) for x in range(10)]))
+
+    doc = asyncio.run(client.modmail.logs.find_one({'_id': archiveID}))
+    assert [x['message_id'] for x in doc['messages']] == [str(x) for x in range(10)]
+    assert doc['messages'][4]['author']['name'] == 'user1'
+    assert not doc['chunks']
+    assert asyncio.run(client.modmail.logChunks.count_documents({})) == 0
+
+
+def test_chunked_archive_reads_back_whole(client, monkeypatch):
+    monkeypatch.setattr(tools, 'ARCHIVE_DOCUMENT_BYTES', 4096)
+    archiveID = asyncio.run(tools.message_archive([Message(x) for x in range(50)]))
+
+    assert asyncio.run(client.modmail.logChunks.count_documents({'archive': archiveID})) > 1
+    header = asyncio.run(client.modmail.logs.find_one({'_id': archiveID}))
+    assert header['messages'][-1].get('continued')  # Readers of the header alone see it is incomplete
+
+    doc = asyncio.run(tools.read_archive(archiveID))
+    assert [x['message_id'] for x in doc['messages']] == [str(x) for x in range(50)]
+    assert [x['author']['name'] for x in doc['messages']] == [f'user{x % 3}' for x in range(50)]
+    assert all('author_id' not in x for x in doc['messages'])
@@ -0,0 +1,43 @@
+import re
+
+import tools
+
+
+def test_overlapping_patterns_both_match():
+    chatFilter = tools.ChatFilter()
+    chatFilter.register('first', 'free nitro')
+    chatFilter.register('second', 'nitro')
+
+    assert chatFilter.scan('get free nitro now') == {'first': True, 'second': True}
+
+
+def test_overlapping_match_inside_link():
+    chatFilter = tools.ChatFilter()
+    chatFilter.register('first', re.compile('discord', re.I))
+    chatFilter.register('second', 'cord')
+
+    assert chatFilter.scan('https://discord.gg/abc') == {'first': False, 'second': False}
+    assert chatFilter.scan('https://discord.gg/abc cord') == {'first': False, 'second': True}
+
+
+def test_no_match_is_empty():
+    chatFilter = tools.ChatFilter()
+    chatFilter.register('first', 'free nitro')
+    chatFilter.register('second', 'nitro')
+
+    assert chatFilter.scan('hello there') == {}
+
+
+def test_pattern_flags_are_kept():
+    chatFilter = tools.ChatFilter()
+    chatFilter.register('word', re.compile(r'\w+', re.A))
+
+    assert chatFilter.scan('ééé') == {}
+
+
+def test_scan_result_is_a_copy():
+    chatFilter = tools.ChatFilter()
+    chatFilter.register('nitro', 'nitro')
+
+    chatFilter.scan('nitro')['nitro'] = False
+    assert chatFilter.scan('nitro') == {'nitro': True}
@@ -1,4 +1,6 @@
 import asyncio
+import bisect
+import collections
 import logging
 import os
 import re
@@ -10,10 +12,11 @@ from datetime import datetime, timedelta, timezone
 
 import config
 import discord
+import discord.ext.commands
 import pymongo
 
+from database import amclient, message_store
 
-mclient = pymongo.MongoClient(config.mongoURI)
 
 linkRe = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[#-_]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', re.I)
 reasonFilterLinkRe = re.compile(
@@ -96,152 +99,189 @@ class NormalConfirmation(discord.ui.View):
             await self.message.edit(view=None)
 
 
-async def message_archive(archive: typing.Union[discord.Message, list], edit=None):
-    db = mclient.modmail.logs
-    if type(archive) != list:
-        # Single message to archive
-        archive = [archive]
+ARCHIVE_DOCUMENT_BYTES = 8 * 1024 * 1024  # Estimated size an archive document is filled to, half the BSON limit
 
-    archiveID = f'{archive[0].id}-{int(time.time() * 1000)}'
-    if edit:
-        db.insert_one(
-            {
-                '_id': archiveID,
-                'key': archiveID,
-                'open': False,
-                'created_at': str(archive[0].created_at),
-                'closed_at': str(archive[0].created_at),
-                'channel_id': str(archive[0].channel.id),
-                'guild_id': str(archive[0].guild.id),
-                'bot_id': str(config.parakarry),
-                'recipient': {
-                    'id': 0,
-                    'name': archive[0].author.name,
-                    'discriminator': archive[0].author.discriminator,
-                    'avatar_url': archive[0].author.display_avatar.with_format('png').with_size(1024).url,
-                    'mod': False,
-                },
-                'creator': {
-                    'id': str(archive[0].author.id),
-                    'name': archive[0].author.name,
-                    'discriminator': archive[0].author.discriminator,
-                    'avatar_url': '',
-                    'mod': False,
-                },
-                'closer': {'id': str(0), 'name': 'message edited', 'discriminator': 0, 'avatar_url': ''},
-                'messages': [
-                    {
-                        'timestamp': str(archive[0].created_at),
-                        'message_id': str(archive[0].id),
-                        'content': archive[0].content,
-                        'type': 'edit_before',
-                        'author': {
-                            'id': str(archive[0].author.id),
-                            'name': archive[0].author.name,
-                            'discriminator': archive[0].author.discriminator,
-                            'avatar_url': archive[0].author.display_avatar.with_format('png').with_size(1024).url,
-                            'mod': False,
-                        },
-                        'attachments': [x.url for x in archive[0].attachments],
-                    },
-                    {
-                        'timestamp': str(archive[1].created_at),
-                        'message_id': str(archive[1].id),
-                        'content': archive[1].content,
-                        'type': 'edit_after',
-                        'author': {
-                            'id': str(archive[1].author.id),
-                            'name': archive[1].author.name,
-                            'discriminator': archive[1].author.discriminator,
-                            'avatar_url': archive[1].author.display_avatar.with_format('png').with_size(1024).url,
-                            'mod': False,
-                        },
-                        'attachments': [x.url for x in archive[1].attachments],
-                    },
-                ],
+
+class ArchiveWriter:
+    '''
+    Streams messages into a modmail.logs archive as they arrive. Every archive that fits in ARCHIVE_DOCUMENT_BYTES is
+    a single document in the form the log viewer reads. Larger ones, which could not be stored at all before, keep
+    their first part in that document, ending with a note that the archive continues, and the rest go to
+    modmail.logChunks one chunk at a time, referencing authors that are stored once per archive in the header.
+    read_archive rebuilds the single-document form
+    '''
+
+    CONTINUED_AUTHOR = {'id': '0', 'name': 'Archive', 'discriminator': 0, 'avatar_url': '', 'mod': True}
+
+    ARCHIVED_RECIPIENT = {
+        'id': 0,
+        'name': '',
+        'discriminator': 0,
+        'avatar_url': 'https://cdn.discordapp.com/attachments/276036563866091521/695443024955834438/unknown.png',
+        'mod': False,
+    }
+
+    def __init__(self, first: discord.Message, closer='message archived', recipient=None):
+        self.archiveID = f'{first.id}-{int(time.time() * 1000)}'
+        self.first = first
+        self.closer = closer
+        self.recipient = recipient if recipient else self.ARCHIVED_RECIPIENT
+        self.authors = {}
+        self.pending = []
+        self.pendingBytes = 0
+        self.chunks = 0
+        self.started = False
+
+    def author(self, user):
+        '''The archive's record for `user`, built the first time they are seen'''
+        key = str(user.id)
+        if key not in self.authors:
+            self.authors[key] = {
+                'id': key,
+                'name': user.name,
+                'discriminator': user.discriminator,
+                'avatar_url': user.display_avatar.with_format('png').with_size(1024).url,
+                'mod': False,
             }
-        )
 
-    else:
-        messages = []
-        for msg in archive:  # TODO: attachment CDN urls should be posted as message
-            messages.append(
+        return self.authors[key]
+
+    async def add(self, msg: discord.Message, _type='thread_message'):
+        entry = {
+            'timestamp': str(msg.created_at),
+            'message_id': str(msg.id),
+            'content': msg.content if msg.content else '',
+            'type': _type,
+            'author_id': self.author(msg.author)['id'],
+            'attachments': [x.url for x in msg.attachments],
+        }
+        if _type == 'thread_message':
+            entry['channel'] = {'id': str(msg.channel.id), 'name': msg.channel.name}
+
+        size = len(entry['content'].encode()) + sum(len(x) for x in entry['attachments']) + 512  # Keys and author
+        if self.pending and self.pendingBytes + size > ARCHIVE_DOCUMENT_BYTES:
+            await self.flush()
+
+        self.pending.append(entry)
+        self.pendingBytes += size
+
+    async def flush(self):
+        if not self.started:
+            messages = self.pending
+            for entry in messages:
+                entry['author'] = self.authors[entry.pop('author_id')]
+
+            await amclient.modmail.logs.insert_one(
                 {
-                    'timestamp': str(msg.created_at),
-                    'message_id': str(msg.id),
-                    'content': msg.content if msg.content else '',
-                    'type': 'thread_message',
-                    'author': {
-                        'id': str(msg.author.id),
-                        'name': msg.author.name,
-                        'discriminator': msg.author.discriminator,
-                        'avatar_url': msg.author.display_avatar.with_format('png').with_size(1024).url,
+                    '_id': self.archiveID,
+                    'key': self.archiveID,
+                    'open': False,
+                    'created_at': str(self.first.created_at),
+                    'closed_at': str(self.first.created_at),
+                    'channel_id': str(self.first.channel.id),
+                    'guild_id': str(self.first.guild.id),
+                    'bot_id': str(config.parakarry),
+                    'recipient': self.recipient,
+                    'creator': {
+                        'id': str(self.first.author.id),
+                        'name': self.first.author.name,
+                        'discriminator': self.first.author.discriminator,
+                        'avatar_url': '',
                         'mod': False,
                     },
-                    'channel': {'id': str(msg.channel.id), 'name': msg.channel.name},
-                    'attachments': [x.url for x in msg.attachments],
+                    'closer': {'id': str(0), 'name': self.closer, 'discriminator': 0, 'avatar_url': ''},
+                    'messages': messages,
+                    'chunks': 0,
                 }
             )
+            self.started = True
 
-        db.insert_one(
-            {
-                '_id': archiveID,
-                'key': archiveID,
-                'open': False,
-                'created_at': str(archive[0].created_at),
-                'closed_at': str(archive[0].created_at),
-                'channel_id': str(archive[0].channel.id),
-                'guild_id': str(archive[0].guild.id),
-                'bot_id': str(config.parakarry),
-                'recipient': {
-                    'id': 0,
-                    'name': '',
-                    'discriminator': 0,
-                    'avatar_url': 'https://cdn.discordapp.com/attachments/276036563866091521/695443024955834438/unknown.png',
-                    'mod': False,
-                },
-                'creator': {
-                    'id': str(archive[0].author.id),
-                    'name': archive[0].author.name,
-                    'discriminator': archive[0].author.discriminator,
-                    'avatar_url': '',
-                    'mod': False,
-                },
-                'closer': {'id': str(0), 'name': 'message archived', 'discriminator': 0, 'avatar_url': ''},
-                'messages': messages,
+        elif self.pending:
+            self.chunks += 1
+            await amclient.modmail.logChunks.insert_one(
+                {
+                    '_id': f'{self.archiveID}-{self.chunks}',
+                    'archive': self.archiveID,
+                    'index': self.chunks,
+                    'messages': self.pending,
+                }
+            )
+
+        self.pending = []
+        self.pendingBytes = 0
+
+    async def close(self):
+        '''Write any remaining messages and the archive's author records. Returns the archive ID'''
+        await self.flush()
+        if self.chunks:
+            # Readers of the header alone are told the archive is incomplete, read_archive drops this note
+            note = {
+                'timestamp': str(datetime.now(tz=timezone.utc)),
+                'message_id': '0',
+                'content': f'This archive is too large to show in full, it continues in {self.chunks} more part(s)',
+                'type': 'system',
+                'author': self.CONTINUED_AUTHOR,
+                'attachments': [],
+                'continued': True,
             }
-        )
+            await amclient.modmail.logs.update_one(
+                {'_id': self.archiveID},
+                {'$set': {'authors': self.authors, 'chunks': self.chunks}, '$push': {'messages': note}},
+            )
 
-    return archiveID
+        return self.archiveID
 
 
-async def store_user(member, messages=0):
-    db = mclient.bowser.users
-    # Double check exists
-    if db.find_one({'_id': member.id}):
-        logging.error('Attempted to store user that already exists!')
-        return
+async def read_archive(archiveID):
+    '''Load an archive in the single-document form the log viewer uses, joining any chunks back onto its messages'''
+    doc = await amclient.modmail.logs.find_one({'_id': archiveID})
+    if not doc or not doc.get('chunks'):
+        return doc
+
+    authors = doc.pop('authors', {})
+    doc['messages'] = [x for x in doc['messages'] if not x.get('continued')]
+    for chunk in await amclient.modmail.logChunks.find({'archive': archiveID}, sort=[('index', 1)]):
+        for entry in chunk['messages']:
+            authorID = entry.pop('author_id')
+            entry['author'] = authors.get(authorID, {'id': authorID, 'name': '', 'discriminator': 0, 'avatar_url': ''})
+            doc['messages'].append(entry)
+
+    return doc
+
+
+async def message_archive(archive: typing.Union[discord.Message, list], edit=None):
+    if type(archive) != list:
+        # Single message to archive
+        archive = [archive]
+
+    if edit:
+        writer = ArchiveWriter(archive[0], closer='message edited')
+        writer.recipient = dict(writer.author(archive[0].author), id=0)
+        await writer.add(archive[0], 'edit_before')
+        await writer.add(archive[1], 'edit_after')
+
+    else:
+        writer = ArchiveWriter(archive[0])
+        for msg in archive:  # TODO: attachment CDN urls should be posted as message
+            await writer.add(msg)
+
+    return await writer.close()
 
+
+def user_document(member, joined):
+    '''Build the bowser.users document for a member we have never seen before'''
     roleList = []
     for role in member.roles:
-        if role.id == member.guild.id:
+        if role.id == member.guild.id or role.managed:
             continue
 
         roleList.append(role.id)
 
-    userData = {
+    return {
         '_id': member.id,
         'roles': roleList,
-        'joins': [int(datetime.now(tz=timezone.utc).timestamp())],
+        'joins': [joined],
         'leaves': [],
-        'nameHist': [
-            {
-                'str': member.name,
-                'type': 'name',
-                'discriminator': member.discriminator,
-                'timestamp': int(datetime.now(tz=timezone.utc).timestamp()),
-            }
-        ],
         'lockdown': False,
         'jailed': False,
         'friendcode': None,
@@ -255,7 +295,160 @@ async def store_user(member, messages=0):
         'background': 'default-light',
         'backgrounds': ['default-light', 'default-dark'],
     }
-    db.insert_one(userData)
+
+
+async def store_user(member, messages=0):
+    db = amclient.bowser.users
+    # Double check exists
+    if await db.find_one({'_id': member.id}):
+        logging.error('Attempted to store user that already exists!')
+        return
+
+    joined = int(datetime.now(tz=timezone.utc).timestamp())
+    await db.insert_one(user_document(member, joined))
+    await record_member_event(member.id, 'join', joined)
+    await record_history('name', member.id, name_event(member, 'name', joined))
+
+
+async def record_member_event(user, _type, timestamp):
+    '''Log a join or leave to bowser.memberEvents, alongside the user's joins/leaves arrays'''
+    await amclient.bowser.memberEvents.insert_one({'user': user, 'type': _type, 'timestamp': timestamp})
+
+
+async def rebuild_member_events():
+    '''
+    Regenerate bowser.memberEvents from the joins and leaves arrays on every user document, replacing the collection.
+    Events recorded while this runs may be missing until it is run again
+    '''
+    await ensure_stat_indexes()
+
+    def events(field, _type):
+        return {'$map': {'input': {'$ifNull': [f'${field}', []]}, 'in': {'type': _type, 'timestamp': '$$this'}}}
+
+    await amclient.bowser.users.aggregate(
+        [
+            {'$project': {'events': {'$concatArrays': [events('joins', 'join'), events('leaves', 'leave')]}}},
+            {'$unwind': '$events'},
+            {'$project': {'_id': 0, 'user': '$_id', 'type': '$events.type', 'timestamp': '$events.timestamp'}},
+            {'$out': 'memberEvents'},
+        ],
+        allowDiskUse=True,
+    )
+
+    return await amclient.bowser.memberEvents.estimated_document_count()
+
+
+# Voice, name and role history is kept in buckets of up to HISTORY_BUCKET_SIZE events per user, one collection per
+# kind, so the user document stays a fixed size
+HISTORY_BUCKET_SIZE = 200
+HISTORY_COLLECTIONS = {'voice': 'voiceHistory', 'name': 'nameHistory', 'role': 'roleHistory'}
+LEGACY_HISTORY_FIELDS = {'voice': 'voiceHistory', 'name': 'nameHist'}  # Arrays that used to live on bowser.users
+
+
+def name_event(member, _type, timestamp):
+    '''History event for a username ('name') or display name ('nick') change'''
+    return {
+        'str': member.name if _type == 'name' else member.display_name,  # Not escaped
+        'type': _type,
+        'discriminator': member.discriminator,
+        'timestamp': timestamp,
+    }
+
+
+async def record_history(kind, user, event):
+    '''Append an event to a user's voice, name or role history'''
+    await record_history_many(kind, [(user, event)])
+
+
+async def record_history_many(kind, entries):
+    '''
+    Append (user, event) pairs to the newest open bucket for each user, starting a new bucket once the open one has
+    HISTORY_BUCKET_SIZE events. Written in order so several events for one user keep their order
+    '''
+    if not entries:
+        return
+
+    await amclient.bowser[HISTORY_COLLECTIONS[kind]].bulk_write(
+        [
+            pymongo.UpdateOne(
+                {'user': user, 'count': {'$lt': HISTORY_BUCKET_SIZE}},
+                {
+                    '$push': {'events': event},
+                    '$inc': {'count': 1},
+                    '$min': {'start': event['timestamp']},
+                    '$max': {'end': event['timestamp']},
+                },
+                upsert=True,
+            )
+            for user, event in entries
+        ]
+    )
+
+
+async def user_history(kind, user, start=None, end=None):
+    '''Return a user's voice, name or role history events in order, optionally within [start, end]'''
+    query = {'user': user}
+    if start is not None:
+        query['end'] = {'$gte': start}
+
+    if end is not None:
+        query['start'] = {'$lte': end}
+
+    events = []
+    for bucket in await amclient.bowser[HISTORY_COLLECTIONS[kind]].find(query, sort=[('start', 1)]):
+        events.extend(
+            x
+            for x in bucket['events']
+            if (start is None or x['timestamp'] >= start) and (end is None or x['timestamp'] <= end)
+        )
+
+    return events
+
+
+async def migrate_user_history(batch_size=500):
+    '''
+    Move the voiceHistory and nameHist arrays off bowser.users into history buckets, batch_size users at a time.
+    Buckets get deterministic IDs so a run that is interrupted can be repeated safely. Returns the number of users
+    migrated
+    '''
+    await ensure_stat_indexes()
+    fields = list(LEGACY_HISTORY_FIELDS.values())
+    migrated = 0
+    while True:
+        users = await amclient.bowser.users.find(
+            {'$or': [{x: {'$exists': True}} for x in fields]}, projection={x: 1 for x in fields}, limit=batch_size
+        )
+        if not users:
+            return migrated
+
+        for kind, field in LEGACY_HISTORY_FIELDS.items():
+            buckets = []
+            for user in users:
+                events = sorted(user.get(field) or [], key=lambda x: x.get('timestamp') or 0)
+                for idx in range(0, len(events), HISTORY_BUCKET_SIZE):
+                    chunk = events[idx : idx + HISTORY_BUCKET_SIZE]
+                    buckets.append(
+                        {
+                            '_id': f'{user["_id"]}-legacy-{idx // HISTORY_BUCKET_SIZE}',
+                            'user': user['_id'],
+                            'count': len(chunk),
+                            'start': chunk[0].get('timestamp') or 0,
+                            'end': chunk[-1].get('timestamp') or 0,
+                            'events': chunk,
+                        }
+                    )
+
+            if buckets:
+                try:
+                    await amclient.bowser[HISTORY_COLLECTIONS[kind]].insert_many(buckets, ordered=False)
+
+                except pymongo.errors.BulkWriteError:
+                    pass  # Already moved by an interrupted run
+
+        await amclient.bowser.users.update_many(
+            {'_id': {'$in': [x['_id'] for x in users]}}, {'$unset': {x: '' for x in fields}}
+        )
+        migrated += len(users)
 
 
 async def issue_pun(
@@ -271,35 +464,307 @@ async def issue_pun(
     strike_count=None,
     public_notify=False,
 ):
-    db = mclient.bowser.puns
+    db = amclient.bowser.puns
     timestamp = time.time() if not _date else _date
     docID = str(uuid.uuid4())
-    while db.find_one({'_id': docID}):  # Uh oh, duplicate uuid generated
+    while await db.find_one({'_id': docID}):  # Uh oh, duplicate uuid generated
         docID = str(uuid.uuid4())
 
-    db.insert_one(
-        {
-            '_id': docID,
-            'user': user,
-            'moderator': moderator,
-            'type': _type,
-            'strike_count': strike_count,
-            'active_strike_count': strike_count,
-            'timestamp': int(timestamp),
-            'reason': reason,
-            'expiry': expiry,
-            'context': context,
-            'active': active,
-            'sensitive': False,
-            'public': public,
-            'public_log_message': None,
-            'public_log_channel': None,
-            'public_notify': public_notify,
-        }
+    await db.insert_one(
+        pun_document(
+            docID,
+            user,
+            moderator,
+            _type,
+            reason,
+            expiry,
+            active,
+            context,
+            timestamp,
+            public,
+            strike_count,
+            public_notify,
+        )
     )
+    await record_pun_rollup(_type, timestamp)
     return docID
 
 
+async def issue_puns(users, moderator, _type, reason=None, active=True, context=None, public=True):
+    '''Issue the same pun to many users with a single insert. Returns the pun IDs in the same order as `users`'''
+    timestamp = time.time()
+    docs = [
+        pun_document(str(uuid.uuid4()), user, moderator, _type, reason, None, active, context, timestamp, public)
+        for user in users
+    ]
+    if not docs:
+        return []
+
+    await amclient.bowser.puns.insert_many(docs)
+    await record_pun_rollup(_type, timestamp, len(docs))
+    return [x['_id'] for x in docs]
+
+
+def pun_document(
+    docID,
+    user,
+    moderator,
+    _type,
+    reason=None,
+    expiry=None,
+    active=True,
+    context=None,
+    timestamp=None,
+    public=True,
+    strike_count=None,
+    public_notify=False,
+):
+    return {
+        '_id': docID,
+        'user': user,
+        'moderator': moderator,
+        'type': _type,
+        'strike_count': strike_count,
+        'active_strike_count': strike_count,
+        'timestamp': int(timestamp),
+        'reason': reason,
+        'expiry': expiry,
+        'context': context,
+        'active': active,
+        'sensitive': False,
+        'public': public,
+        'public_log_message': None,
+        'public_log_channel': None,
+        'public_notify': public_notify,
+    }
+
+
+STRIKE_DECAY = 60 * 60 * 24 * 7  # One active strike decays for every week without a new strike
+
+
+def deduct_strikes(strikes, count):
+    '''
+    Take `count` strikes from a user's active strike puns, oldest first. Returns (pun ID, remaining active count) for
+    each pun that changed
+    '''
+    changes = []
+    for pun in sorted(strikes, key=lambda x: x['timestamp']):
+        if count <= 0:
+            break
+
+        taken = min(pun['active_strike_count'], count)
+        if taken:
+            changes.append((pun['_id'], pun['active_strike_count'] - taken))
+            count -= taken
+
+    return changes
+
+
+def _strike_writes(changes):
+    return [
+        pymongo.UpdateOne({'_id': _id}, {'$set': {'active_strike_count': remaining, 'active': remaining > 0}})
+        for _id, remaining in changes
+    ]
+
+
+async def add_strikes(user, count):
+    '''Add newly issued strikes to a user's cached total. A new strike restarts their decay timer'''
+    await amclient.bowser.users.update_one(
+        {'_id': user}, {'$inc': {'active_strikes': count}, '$set': {'strike_check': time.time() + STRIKE_DECAY}}
+    )
+
+
+async def remove_strikes(user, count):
+    '''Remove up to `count` active strikes from a user, oldest first, and restart their decay timer'''
+    strikes = await amclient.bowser.puns.find(
+        {'user': user, 'type': 'strike', 'active': True}, projection={'timestamp': 1, 'active_strike_count': 1}
+    )
+    changes = deduct_strikes(strikes, count)
+    if changes:
+        await amclient.bowser.puns.bulk_write(_strike_writes(changes), ordered=False)
+
+    active = sum(x['active_strike_count'] for x in strikes)
+    remaining = active - min(count, active)
+    await amclient.bowser.users.update_one(
+        {'_id': user}, {'$set': {'active_strikes': remaining, 'strike_check': time.time() + STRIKE_DECAY}}
+    )
+    return remaining
+
+
+async def refresh_strike_state(user=None):
+    '''Recompute the cached active_strikes for one user, or for every user when None, from their strike puns'''
+    match = {'type': 'strike', 'active': True}
+    if user is not None:
+        match['user'] = user
+
+    totals = await amclient.bowser.puns.aggregate(
+        [{'$match': match}, {'$group': {'_id': '$user', 'total': {'$sum': '$active_strike_count'}}}]
+    )
+    totals = {x['_id']: x['total'] for x in totals}
+
+    writes = [pymongo.UpdateOne({'_id': x}, {'$set': {'active_strikes': total}}) for x, total in totals.items()]
+    if user is None:
+        writes.append(
+            pymongo.UpdateMany(
+                {'active_strikes': {'$gt': 0}, '_id': {'$nin': list(totals)}}, {'$set': {'active_strikes': 0}}
+            )
+        )
+
+    elif user not in totals:
+        writes.append(pymongo.UpdateOne({'_id': user}, {'$set': {'active_strikes': 0}}))
+
+    await amclient.bowser.users.bulk_write(writes, ordered=False)
+
+
+async def decay_strikes(now=None):
+    '''
+    Apply the weekly decay to every user whose strike_check has passed, one strike for each full week since their last
+    strike or decay. Due users and their active strikes are read with one aggregation, and the changes are written with
+    one bulk_write per collection. Returns the number of users and strikes decayed
+    '''
+    now = now if now else time.time()
+    due = await amclient.bowser.users.aggregate(
+        [
+            {'$match': {'active_strikes': {'$gt': 0}, 'strike_check': {'$lte': now}}},
+            {'$lookup': {'from': 'puns', 'localField': '_id', 'foreignField': 'user', 'as': 'strikes'}},
+            {
+                '$project': {
+                    'strike_check': 1,
+                    'strikes': {
+                        '$filter': {
+                            'input': '$strikes',
+                            'cond': {'$and': [{'$eq': ['$$this.type', 'strike']}, {'$eq': ['$$this.active', True]}]},
+                        }
+                    },
+                }
+            },
+        ]
+    )
+
+    punWrites = []
+    userWrites = []
+    decayed = 0
+    for user in due:
+        active = sum(x['active_strike_count'] for x in user['strikes'])
+        weeks = 1 + int((now - user['strike_check']) // STRIKE_DECAY)
+        decay = min(weeks, active)
+        punWrites.extend(_strike_writes(deduct_strikes(user['strikes'], decay)))
+        userWrites.append(
+            pymongo.UpdateOne(
+                {'_id': user['_id']},
+                {
+                    '$set': {
+                        'active_strikes': active - decay,
+                        'strike_check': user['strike_check'] + weeks * STRIKE_DECAY,
+                    }
+                },
+            )
+        )
+        decayed += decay
+
+    if punWrites:
+        await amclient.bowser.puns.bulk_write(punWrites, ordered=False)
+
+    if userWrites:
+        await amclient.bowser.users.bulk_write(userWrites, ordered=False)
+
+    return len(userWrites), decayed
+
+
+HOUR = 60 * 60
+DAY = HOUR * 24
+
+
+async def ensure_stat_indexes():
+    await amclient.bowser.rollupChannelHour.create_index([('hour', 1), ('channel', 1)], unique=True)
+    await amclient.bowser.rollupAuthorDay.create_index([('day', 1), ('author', 1)], unique=True)
+    await amclient.bowser.rollupPunDay.create_index([('day', 1), ('type', 1)], unique=True)
+    await amclient.bowser.memberEvents.create_index([('type', 1), ('timestamp', 1)])
+    await amclient.bowser.memberEvents.create_index([('user', 1)])
+    for collection in HISTORY_COLLECTIONS.values():
+        await amclient.bowser[collection].create_index([('user', 1), ('start', 1)])
+    await amclient.modmail.logChunks.create_index([('archive', 1), ('index', 1)])
+
+
+async def record_message_rollups(docs):
+    '''
+    Add stored message documents to the activity rollups used by /stats: messages per channel per hour and messages
+    per author per day (UTC)
+    '''
+    channels = {}
+    authors = {}
+    for doc in docs:
+        channelKey = (doc['channel'], doc['timestamp'] - doc['timestamp'] % HOUR)
+        authorKey = (doc['author'], doc['timestamp'] - doc['timestamp'] % DAY)
+        channels[channelKey] = channels.get(channelKey, 0) + 1
+        authors[authorKey] = authors.get(authorKey, 0) + 1
+
+    if not channels:
+        return
+
+    await amclient.bowser.rollupChannelHour.bulk_write(
+        [
+            pymongo.UpdateOne({'hour': hour, 'channel': channel}, {'$inc': {'count': count}}, upsert=True)
+            for (channel, hour), count in channels.items()
+        ],
+        ordered=False,
+    )
+    await amclient.bowser.rollupAuthorDay.bulk_write(
+        [
+            pymongo.UpdateOne({'day': day, 'author': author}, {'$inc': {'count': count}}, upsert=True)
+            for (author, day), count in authors.items()
+        ],
+        ordered=False,
+    )
+
+
+async def record_pun_rollup(_type, timestamp, amount=1):
+    day = int(timestamp) - int(timestamp) % DAY
+    await amclient.bowser.rollupPunDay.update_one({'day': day, 'type': _type}, {'$inc': {'count': amount}}, upsert=True)
+
+
+async def rebuild_rollups():
+    '''
+    Recompute all activity rollups from the message store and bowser.puns. Messages stored while a rebuild runs may
+    be counted twice or not at all until it is run again
+    '''
+    await ensure_stat_indexes()
+
+    def bucket(field, size):
+        return {'$subtract': [f'${field}', {'$mod': [f'${field}', size]}]}
+
+    for collection, key, size, keyField in [
+        (amclient.bowser.rollupChannelHour, 'hour', HOUR, 'channel'),
+        (amclient.bowser.rollupAuthorDay, 'day', DAY, 'author'),
+    ]:
+        await collection.delete_many({})
+        async for partition in message_store.aggregate(
+            [{'$group': {'_id': {keyField: f'${keyField}', key: bucket('timestamp', size)}, 'count': {'$sum': 1}}}],
+            allowDiskUse=True,
+        ):
+            for idx in range(0, len(partition), 1000):
+                await collection.bulk_write(
+                    [
+                        pymongo.UpdateOne(
+                            {key: doc['_id'][key], keyField: doc['_id'][keyField]},
+                            {'$inc': {'count': doc['count']}},
+                            upsert=True,
+                        )
+                        for doc in partition[idx : idx + 1000]
+                    ],
+                    ordered=False,
+                )
+
+    await amclient.bowser.puns.aggregate(
+        [
+            {'$group': {'_id': {'type': '$type', 'day': bucket('timestamp', DAY)}, 'count': {'$sum': 1}}},
+            {'$project': {'_id': 0, 'type': '$_id.type', 'day': '$_id.day', 'count': 1}},
+            {'$out': 'rollupPunDay'},
+        ],
+        allowDiskUse=True,
+    )
+
+
 def resolve_duration(data, include_seconds=False):
     """
     Takes a raw input string formatted 1w1d1h1m1s (any order)
@@ -384,8 +849,8 @@ def mod_cmd_invoke_delete(channel):
 async def commit_profile_change(bot, user: discord.User, element: str, item: str, revoke=False, silent=False):
     '''Given a user, update the owned status of a particular element (trophy, background, etc.), "item"'''
     # Calling functions should be verifying availability of item
-    db = mclient.bowser.users
-    dbUser = db.find_one({'_id': user.id})
+    db = amclient.bowser.users
+    dbUser = await db.find_one({'_id': user.id})
     key = {'background': 'backgrounds', 'trophy': 'trophies'}[element]
 
     if item in dbUser[key] and not revoke:
@@ -397,7 +862,7 @@ async def commit_profile_change(bot, user: discord.User, element: str, item: str
     socialCog = bot.get_cog('Social Commands')
 
     if not revoke:
-        db.update({'_id': user.id}, {'$push': {key: item}})
+        await db.update_one({'_id': user.id}, {'$push': {key: item}})
         dmMsg = f'Hey there {discord.utils.escape_markdown(user.name)}!\nYou have received a new item for your profile on the r/NintendoSwitch Discord server!\n\nThe **{item.replace("-", " ")}** {element} is now yours, enjoy! '
         if element == 'background':
             dmMsg += f'If you wish to use this background, use the `/profile background` command in our Discord server. Here\'s what your profile could look like:'
@@ -415,10 +880,10 @@ async def commit_profile_change(bot, user: discord.User, element: str, item: str
             pass
 
     else:
-        db.update({'_id': user.id}, {'$pull': {key: item}})
+        await db.update_one({'_id': user.id}, {'$pull': {key: item}})
         # Reset background to default if the one being revoked is currently equiped
         if dbUser['background'] == item and element == 'background':
-            db.update({'_id': user.id}, {'$set': {'background': 'default-light'}})
+            await db.update_one({'_id': user.id}, {'$set': {'background': 'default-light'}})
 
         dmMsg = f'Hey there {discord.utils.escape_markdown(user.name)},\nA profile item has been revoked from you on the r/NintendoSwitch Discord server.\n\nThe **{item.replace("-", " ")}** {element} was revoked from you. '
         if element == 'background':
@@ -504,29 +969,71 @@ async def send_modlog(
         embed.add_field(name='Old reason', value=updated)
 
     await channel.send(embed=embed)
+    if public and footer:
+        await queue_public_modlog(bot, footer, delay)
+
+
+async def send_bulk_modlog(bot, channel, _type, puns, reason=None, moderator=None, public=False, delay=300):
+    '''
+    Log one action taken against many users as a single modlog. `puns` is a list of (user, pun ID) pairs, and the
+    user list is only split over several embeds when it would not fit in one description
+    '''
+    lines = [f'{user} ({user.id}) `{docID}`' for user, docID in puns]
+    descriptions = ['']
+    for line in lines:
+        if len(descriptions[-1]) + len(line) + 1 > 4000:
+            descriptions.append('')
+
+        descriptions[-1] += line + '\n'
+
+    if moderator and not isinstance(moderator, str):  # Convert to str
+        moderator = moderator.mention
+
+    author = f'{config.punStrs[_type]} | {len(puns)} users'
+    timestamp = datetime.now(tz=timezone.utc)
+    for idx, description in enumerate(descriptions):
+        embed = discord.Embed(color=config.punColors[_type], description=description, timestamp=timestamp)
+        embed.set_author(name=author if len(descriptions) == 1 else f'{author} ({idx + 1}/{len(descriptions)})')
+        if moderator:
+            embed.add_field(name='Moderator', value=moderator, inline=True)
+
+        if reason:
+            embed.add_field(name='Reason', value=reason)
+
+        await channel.send(embed=embed)
+
     if public:
-        event_loop = bot.loop
-        post_action = event_loop.call_later(
-            delay,
-            event_loop.create_task,
-            send_public_modlog(bot, footer, bot.get_channel(config.publicModChannel), expires),
-        )
-        return post_action
+        await queue_public_modlogs(bot, [docID for _, docID in puns], delay)
 
 
-async def send_public_modlog(bot, id, channel, mock_document=None):
-    db = mclient.bowser.puns
-    doc = mock_document if not id else db.find_one({'_id': id})
+async def queue_public_modlog(bot, id, delay=300):
+    '''Add a pun to the public modlog outbox, to be posted by the moderation cog after `delay` seconds'''
+    await queue_public_modlogs(bot, [id], delay)
 
-    if not doc:
-        return
 
-    user = await bot.fetch_user(doc['user'])
+async def queue_public_modlogs(bot, ids, delay=300):
+    due = time.time() + delay
+    await amclient.bowser.modlogOutbox.bulk_write(
+        [
+            pymongo.UpdateOne({'_id': x}, {'$set': {'due': due}, '$setOnInsert': {'attempts': 0}}, upsert=True)
+            for x in ids
+        ],
+        ordered=False,
+    )
+    mod = bot.get_cog('Moderation Commands')
+    if mod:
+        mod.outbox.wake(due)
 
-    try:
-        member = await channel.guild.fetch_member(doc['user'])
-    except:
-        member = None
+
+async def send_public_modlog(bot, id, channel, mock_document=None):
+    db = amclient.bowser.puns
+    doc = mock_document if not id else await db.find_one({'_id': id})
+
+    if not doc or (id and doc.get('public_log_message')):
+        return  # Missing, or already posted
+
+    user = bot.get_user(doc['user']) or await bot.fetch_user(doc['user'])
+    member = channel.guild.get_member(doc['user'])  # Cache is chunked, so this is None when they aren't a member
 
     author = f'{config.punStrs[doc["type"]]} '
 
@@ -578,7 +1085,7 @@ async def send_public_modlog(bot, id, channel, mock_document=None):
     message = await channel.send(content, embed=embed)
 
     if id:
-        db.update_one({'_id': id}, {'$set': {'public_log_message': message.id, 'public_log_channel': channel.id}})
+        await db.update_one({'_id': id}, {'$set': {'public_log_message': message.id, 'public_log_channel': channel.id}})
 
 
 def filter_links_from_reason(reason):
@@ -677,30 +1184,37 @@ def format_pundm(_type, reason, moderator=None, details=None, auto=False):
     return punDM
 
 
+class LinkSpans:
+    '''
+    The link spans of a string, found once with linkRe and kept as sorted starts and ends so a span can be checked for
+    overlap with a binary search instead of against every link
+    '''
+
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, string: str):
+        self.starts = []
+        self.ends = []
+        for link in linkRe.finditer(string):
+            self.starts.append(link.start())
+            self.ends.append(link.end())
+
+    def overlaps(self, span: typing.Tuple[int, int]) -> bool:
+        # Links never overlap each other, so the first link ending at or after this span starts is the only candidate
+        # (https://nedbatchelder.com/blog/201310/range_overlap_in_two_compares.html)
+        idx = bisect.bisect_left(self.ends, span[0])
+        return idx < len(self.starts) and self.starts[idx] <= span[1]
+
+
 def spans_overlap_link(string: str, spans: typing.List[typing.Tuple[int, int]]) -> typing.List[bool]:
     """
     Returns list of booleans for every character span passed (as `(start, end)`) if they overlap a link in given string.
     """
-    START, END = (0, 1)  # Consts for readablity of (start, end) tuples
-
-    links = linkRe.finditer(string)
-
     if not spans:
         return []
-    if not links:
-        return [False] * len(spans)
 
-    link_spans = list(map(lambda m: m.span(), links))
-    overlaps = [False] * len(spans)
-
-    for i, span in enumerate(spans):
-        for link in link_spans:
-            # If span overlaps with link (https://nedbatchelder.com/blog/201310/range_overlap_in_two_compares.html)
-            if span[END] >= link[START] and link[END] >= span[START]:
-                overlaps[i] = True
-                break
-
-    return overlaps
+    links = LinkSpans(string)
+    return [links.overlaps(span) for span in spans]
 
 
 def re_match_nonlink(pattern: typing.Pattern, string: str) -> typing.Optional[bool]:
@@ -712,20 +1226,103 @@ def re_match_nonlink(pattern: typing.Pattern, string: str) -> typing.Optional[bo
     False - All matches overlapped a link.
     None  - No match found, regardless of link overlap.
     """
-    matches = list(re.finditer(pattern, string))
-    spans = list(map(lambda m: m.span(), matches))
+    links = None
+    for match in re.finditer(pattern, string):
+        if links is None:
+            links = LinkSpans(string)
+
+        if not links.overlaps(match.span()):
+            return True
+
+    return None if links is None else False
+
+
+class ChatFilter:
+    '''
+    Scans messages for every registered pattern. Each filter keeps its own compiled pattern, flags included, so
+    filters matching overlapping text are all reported. A message's links are found at most once and only when
+    something matched, and a filter stops scanning at its first match outside a link.
+    '''
+
+    def __init__(self):
+        self.patterns = {}
+        self.last = (None, None)
+
+    def register(self, name: str, pattern: typing.Union[str, typing.Pattern]):
+        self.patterns[name] = re.compile(pattern)
+        self.last = (None, None)
+
+    def unregister(self, name: str):
+        self.patterns.pop(name, None)
+        self.last = (None, None)
+
+    def scan(self, string: str) -> typing.Dict[str, bool]:
+        '''
+        Returns the filters that matched `string`, mapped to True if at least one of their matches is outside a link
+        or False if every match overlapped a link. Filters that did not match are left out.
+        '''
+        if self.last[0] == string:
+            return dict(self.last[1])
+
+        results = {}
+        links = None
+        for name, pattern in self.patterns.items():
+            for match in pattern.finditer(string):
+                if links is None:
+                    links = LinkSpans(string)
+
+                results[name] = not links.overlaps(match.span())
+                if results[name]:
+                    break
+
+        self.last = (string, results)
+        return dict(results)
+
+
+chat_filter = ChatFilter()
+
+
+class PageSource:
+    '''
+    Supplies a PaginatedEmbed one page at a time. `fetch(offset, limit)` is awaited with an item offset and returns up
+    to `limit` items from there, each item being the list of fields it renders as. `count` is the total number of
+    items. The most recently viewed pages are cached so paging back and forth does not refetch them
+    '''
 
-    if not matches:
-        return None
+    def __init__(
+        self,
+        fetch: typing.Callable[[int, int], typing.Awaitable[typing.List[typing.List[typing.Dict]]]],
+        count: int,
+        *,
+        per_page: int = 10,
+        cache_size: int = 8,
+    ):
+        self.fetch = fetch
+        self.count = count
+        self.per_page = per_page
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
 
-    overlaps = spans_overlap_link(string, spans)
-    return any(not overlap for overlap in overlaps)
+    async def get(self, offset: int) -> typing.List[typing.List[typing.Dict]]:
+        if offset in self.cache:
+            self.cache.move_to_end(offset)
+            return self.cache[offset]
+
+        items = await self.fetch(offset, self.per_page)
+        self.cache[offset] = items
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        return items
 
 
 class PaginatedEmbed(discord.ui.View):
     '''
     Displays an interactive paginated embed of given fields, with optional owner-locking, until timed out.
     Interactions should be deferred with `thinking=True` before instantiating.
+
+    Instead of fields a PageSource can be given, in which case only the page being viewed is fetched and the view is
+    sent by awaiting start()
     '''
 
     PAGE_TEMPLATE = 'Page {0}/{1}'
@@ -735,8 +1332,9 @@ class PaginatedEmbed(discord.ui.View):
     def __init__(
         self,
         interaction: discord.Interaction,
-        fields: typing.List[typing.Dict],  # name: str , value: str, inline: optional bool
+        fields: typing.Optional[typing.List[typing.Dict]] = None,  # name: str , value: str, inline: optional bool
         *,
+        source: typing.Optional[PageSource] = None,
         title: typing.Optional[str] = '',
         description: typing.Optional[str] = None,
         color: typing.Union[discord.Colour, int, None] = None,
@@ -750,6 +1348,7 @@ class PaginatedEmbed(discord.ui.View):
         self.bot = interaction.client
         self.owner = interaction.user
         self.title = title
+        self.source = source
 
         # Find the page character cap
         footer_max_length = (
@@ -770,7 +1369,14 @@ class PaginatedEmbed(discord.ui.View):
             )
         self.embed.set_footer(icon_url=None if not self.owner else self.owner.display_avatar.url)
 
-        self.build_pages(interaction, fields)
+        self.current_page = 1
+        self.ended_by = None
+        if source:
+            self.offsets = [0]  # The item offset each page starts at, learned as pages are viewed
+            return
+
+        self.build_pages(interaction, fields or [])
+        self.page_fields = self.pages[0] if self.pages else []
         embed = self.generate_new_embed()
         if self.single_page:
             interaction.client.loop.call_soon(
@@ -787,6 +1393,21 @@ class PaginatedEmbed(discord.ui.View):
                 self.process_response(embed, interaction=interaction, button_interact=False),
             )
 
+    async def start(self, content: typing.Optional[str] = None):
+        '''Fetch the first page from the source and send it, along with the page controls if there is more than one'''
+        await self.turn_to(1)
+        self.single_page = self.page_count <= 1
+        embed = self.generate_new_embed()
+        if self.single_page:
+            self.stop()
+
+        else:
+            self.ui_setup()
+            self.update_buttons()
+
+        self.MESSAGE = await self.initial_interaction.original_response()
+        await self.MESSAGE.edit(content=content, embed=embed, view=None if self.single_page else self)
+
     def ui_setup(self):
         # Create components and assign them callbacks
         self.add_item(discord.ui.Button(label='⬅️ Previous', disabled=True, style=discord.ButtonStyle.success))
@@ -798,18 +1419,49 @@ class PaginatedEmbed(discord.ui.View):
         for index, child in enumerate(self.children):
             child.callback = callbacks[index]
 
-    async def regress_page(self, interaction: discord.Interaction):
-        if self.current_page - 1 <= 1:
-            self.children[0].disabled = True
+    def update_buttons(self):
+        self.children[0].disabled = self.current_page <= 1
+        self.children[1].disabled = self.current_page >= self.page_count
+
+    async def turn_to(self, page: int):
+        if not self.source:
+            self.page_fields = self.pages[page - 1]
+            self.current_page = page
+            return
+
+        offset = self.offsets[page - 1]
+        items = await self.source.get(offset)
+
+        # Keep whole items together, ending the page early if the next one would overflow it
+        fields = []
+        length = 0
+        used = 0
+        for item in items:
+            itemLength = sum(len(field['name']) + len(field['value']) for field in item)
+            if fields and (length + itemLength > self.page_char_cap or len(fields) + len(item) > 25):
+                break
+
+            fields.extend(item)
+            length += itemLength
+            used += 1
 
-        if self.children[1].disabled:
-            self.children[1].disabled = False
+        nextOffset = offset + used
+        if len(self.offsets) == page:
+            self.offsets.append(nextOffset)
 
-        self.current_page -= 1
+        # Pages already viewed are known, the rest are estimated as full pages
+        remaining = max(self.source.count - nextOffset, 0)
+        self.page_count = page + -(-remaining // self.source.per_page)
+        self.page_fields = fields
+        self.current_page = page
+
+    async def regress_page(self, interaction: discord.Interaction):
+        await self.turn_to(self.current_page - 1)
+        self.update_buttons()
         await self.process_response(self.generate_new_embed(), interaction=interaction, button_interact=True)
 
     async def end_pagination(self, interaction: discord.Interaction | None):
-        page_text = self.PAGE_TEMPLATE.format(self.current_page, len(self.pages))
+        page_text = self.PAGE_TEMPLATE.format(self.current_page, self.page_count)
         footer_text = 'Timed out' if not interaction else self.FOOTER_ENDED_BY.format(str(interaction.user))
         self.embed.set_footer(text=f'{page_text}    {footer_text}', icon_url=self.embed.footer.icon_url)
 
@@ -822,13 +1474,8 @@ class PaginatedEmbed(discord.ui.View):
         self.stop()
 
     async def progress_page(self, interaction: discord.Interaction):
-        if self.current_page + 1 >= len(self.pages):
-            self.children[1].disabled = True
-
-        if self.children[0].disabled:
-            self.children[0].disabled = False
-
-        self.current_page += 1
+        await self.turn_to(self.current_page + 1)
+        self.update_buttons()
         await self.process_response(self.generate_new_embed(), interaction=interaction, button_interact=True)
 
     async def on_timeout(self):
@@ -862,39 +1509,34 @@ class PaginatedEmbed(discord.ui.View):
 
     def build_pages(self, interaction: discord.Interaction, fields: typing.List[typing.Dict]):
         self.pages = []
-        while fields:
-            remaining_chars = self.page_char_cap
-            page = []
+        page = []
+        remaining_chars = self.page_char_cap
+        for field in fields:
+            field_length = len(field['name']) + len(field['value'])
 
-            # Make sure a field won't max out this page
-            for field in fields.copy():
-                field_length = len(field['name']) + len(field['value'])
-
-                if remaining_chars - field_length < 0:
-                    break
-                remaining_chars -= field_length
+            # Start a new page if this field would max out the current one
+            if page and (remaining_chars - field_length < 0 or len(page) == 25):
+                self.pages.append(page)
+                page = []
+                remaining_chars = self.page_char_cap
 
-                page.append(fields.pop(0))
-
-                if len(page) == 25:
-                    break
+            remaining_chars -= field_length
+            page.append(field)
 
+        if page:
             self.pages.append(page)
 
-        self.current_page = 1
-        self.ended_by = None
-
+        self.page_count = max(len(self.pages), 1)
         self.single_page = len(self.pages) <= 1
 
     def generate_new_embed(self) -> discord.Embed:
         self.embed.clear_fields()
-        if len(self.pages) != 0:
-            for field in self.pages[self.current_page - 1]:
-                self.embed.add_field(
-                    name=field['name'], value=field['value'], inline=True if not 'inline' in field else field['inline']
-                )
+        for field in self.page_fields:
+            self.embed.add_field(
+                name=field['name'], value=field['value'], inline=True if not 'inline' in field else field['inline']
+            )
 
-        page_text = self.PAGE_TEMPLATE.format(self.current_page, max(len(self.pages), 1))
+        page_text = self.PAGE_TEMPLATE.format(self.current_page, max(self.page_count, 1))
         self.embed.title = f'{self.title} {page_text}'
 
         if self.single_page:
@@ -908,16 +1550,22 @@ class PaginatedEmbed(discord.ui.View):
 
 def convert_list_to_fields(lines: str, codeblock: bool = True) -> typing.List[typing.Dict]:
     fields = []
+    closing = 3 if codeblock else 0
 
-    while lines:
+    idx = 0
+    while idx < len(lines):
         value = '```' if codeblock else ''
 
-        for line in lines.copy():
-            staged = value + line + '\n'
-            if len(staged) + (3 if codeblock else 0) > 1024:
+        while idx < len(lines):
+            staged = value + lines[idx] + '\n'
+            if len(staged) + closing > 1024:
+                if value == ('```' if codeblock else ''):  # A single line longer than a field, cut it to fit
+                    value = staged[: 1024 - closing - 1] + '\n'
+                    idx += 1
+
                 break
 
-            lines.pop(0)
+            idx += 1
             value = staged
 
         value += '```' if codeblock else ''